@@ -53,8 +53,92 @@ class Adjustments:
     # than inbuf_overflow.
     inbuf_overflow = 525000
 
+    # Where to put data that exceeds outbuf_overflow or inbuf_overflow
+    # (see zope.server.buffers.Spool): spool_backend is 'tempfile' for
+    # temporary files in spool_dir (the default temporary directory if
+    # None), or 'memfd' for anonymous memory files (Linux only).  If
+    # spool_quota is not 0, all the spooled data of the process may not
+    # exceed that many bytes; requests that would exceed it fail.
+    spool_backend = 'tempfile'
+    spool_dir = None
+    spool_quota = 0
+
+    # Backpressure for application threads: if outbuf_high_water is not
+    # 0, an application thread writing to a channel that holds more than
+    # that many bytes of pending output waits until the main loop has
+    # sent enough of it, instead of the output overflowing to the spool.
+    # The write fails with a TimeoutError, aborting the response, if
+    # the client reads nothing for write_timeout seconds (0 waits
+    # forever).
+    outbuf_high_water = 0
+    write_timeout = 60
+
+    # Boolean: application threads never send themselves.  They queue
+    # their output for the main loop, so slow clients don't tie up
+    # application threads in blocking sends.  A blocking flush waits
+    # until the main loop has sent the output (again failing after
+    # write_timeout seconds without progress); writes don't wait, so
+    # the queued output is only limited if outbuf_high_water is set.
+    send_in_main_loop = False
+
+    # Reuse the buffers receiving request bodies: keep up to this many
+    # emptied in-memory buffers in a process-wide pool
+    # (zope.server.buffers.BufferPool).  0 disables the pool.
+    buffer_pool_size = 0
+
+    # Boolean: set SO_REUSEPORT on the listening socket, so that several
+    # processes can listen on the same port (see zope.server.prefork).
+    reuse_port = False
+
+    # The maximum number of connections to accept per readiness event
+    # of the listening socket.  Accepting stops early when no more
+    # connections are pending or connection_limit is reached.
+    accept_batch = 16
+
     # Stop accepting new connections if too many are already active.
-    connection_limit = maxsockets.max_select_sockets() - 3  # Safe
+    # The default is a fraction of the open files limit usable with
+    # select(); servers using a poll or epoll loop can allow more (see
+    # maxsockets.connection_limit()).
+    connection_limit = maxsockets.connection_limit()
+
+    # Backpressure: once the task dispatcher has task_queue_high_watermark
+    # pending tasks, stop accepting connections and reading requests
+    # until no more than task_queue_low_watermark tasks are pending.
+    # Clients are then throttled by TCP flow control instead of filling
+    # the task queue and the input buffers.  0 disables the check.
+    task_queue_high_watermark = 0
+    task_queue_low_watermark = 0
+
+    # Load shedding: HTTP requests that waited more than max_queue_wait
+    # seconds in the task queue are answered with a 503 Service
+    # Unavailable response instead of being executed; the client has
+    # probably given up on them already.  0 disables shedding.
+    max_queue_wait = 0
+
+    # Limits of HTTP requests, to bound the memory and disk space a
+    # connection can use.  Requests exceeding them are answered right
+    # away, from the main loop, and the connection is closed:
+    # - a header (including the request line) larger than
+    #   max_request_header_size bytes, or with more than max_header_count
+    #   fields, with 431 Request Header Fields Too Large;
+    # - a URI longer than max_uri_length with 414 URI Too Long;
+    # - a body larger than max_request_body_size with 413 Payload Too
+    #   Large, before it is received (chunked bodies as soon as a chunk
+    #   would exceed the limit).
+    # 0 disables a check; only the header size is limited by default.
+    max_request_header_size = 262144
+    max_header_count = 0
+    max_uri_length = 0
+    max_request_body_size = 0
+
+    # Boolean: hand HTTP requests with a body to the application as soon
+    # as their header has arrived.  The body stream then reads the body
+    # while it is received, waiting for data as needed; the main loop
+    # stops receiving while body_pipe_size bytes are waiting to be read.
+    # Applications reading the body may wait up to channel_timeout
+    # seconds for more data (TimeoutError).
+    stream_request_bodies = False
+    body_pipe_size = 262144
 
     # Minimum seconds between cleaning up inactive channels.
     cleanup_interval = 300
@@ -73,5 +157,25 @@ class Adjustments:
         (socket.SOL_TCP, socket.TCP_NODELAY, 1),
         ]
 
+    # The following options are off (0) by default.  Options the
+    # platform does not support are ignored with a warning.
+
+    # Seconds the kernel may wait for the first data from a client
+    # before completing accept() (Linux TCP_DEFER_ACCEPT).  Connections
+    # that never send anything never become channels.
+    tcp_defer_accept = 0
+
+    # The length of the TCP Fast Open queue of the listening socket.
+    tcp_fastopen = 0
+
+    # SO_RCVBUF and SO_SNDBUF of the listening socket, which accepted
+    # connections inherit.
+    recv_buffer_size = 0
+    send_buffer_size = 0
+
+    # TCP_NOTSENT_LOWAT for accepted connections: limit the amount of
+    # unsent data the kernel buffers per connection.
+    tcp_notsent_lowat = 0
+
 
 default_adj = Adjustments()
@@ -13,7 +13,14 @@
 ##############################################################################
 """Buffers
 """
+import errno
+import mmap
+import os
 import tempfile
+import threading
+import weakref
+from collections import deque
+from collections import namedtuple
 from io import BytesIO
 
 
@@ -72,6 +79,9 @@ class FileBasedBuffer:
             file.seek(read_pos)
         return res
 
+    def peek(self, bytes=-1):
+        return self.get(bytes)
+
     def skip(self, bytes, allow_prune=0):
         if self.remain < bytes:
             raise ValueError("Can't skip %d bytes in buffer of %d bytes" % (
@@ -127,24 +137,229 @@ class StringIOBasedBuffer(FileBasedBuffer):
         return BytesIO()
 
 
+class Spool(namedtuple('Spool', 'backend directory quota')):
+    """
+    Where buffers put the data they can't keep in memory.
+
+    *backend* is ``'tempfile'`` for temporary files in *directory* (the
+    default temporary directory if None; a tmpfs mount such as
+    ``/dev/shm`` keeps the data in memory), or ``'memfd'`` for anonymous
+    memory files (Linux).  *quota*, if not 0, limits the number of
+    bytes all the spool files of the process hold together; exceeding
+    it raises :class:`OSError` with ``errno.ENOSPC``.
+
+    .. versionadded:: 5.1
+    """
+
+    # The bytes held by all spool files of the process.
+    used = 0
+    _lock = threading.Lock()
+
+    def open(self):
+        """Return a new anonymous spool file, opened in ``w+b`` mode."""
+        if self.backend == 'memfd':
+            fd = os.memfd_create('zope_server_buffer', os.MFD_CLOEXEC)
+            return open(fd, 'w+b')
+        if self.backend == 'tempfile':
+            return tempfile.TemporaryFile(mode='w+b',
+                                          suffix='zope_server_buffer.tmp',
+                                          dir=self.directory)
+        raise ValueError('Unknown spool backend %r' % (self.backend,))
+
+    def reserve(self, size):
+        with Spool._lock:
+            if self.quota and Spool.used + size > self.quota:
+                raise OSError(errno.ENOSPC,
+                              'Spool quota of %d bytes exceeded' % self.quota)
+            Spool.used += size
+
+    def release(self, size):
+        with Spool._lock:
+            Spool.used -= size
+
+
+default_spool = Spool('tempfile', None, 0)
+
+
+def get_spool(adj):
+    """Return the :class:`Spool` configured by the adjustments *adj*."""
+    return Spool(adj.spool_backend, adj.spool_dir, adj.spool_quota)
+
+
+def _release_reservation(spool, reserved):
+    spool.release(reserved[0])
+    reserved[0] = 0
+
+
+class SpooledFile(tempfile.SpooledTemporaryFile):
+    """
+    A :class:`tempfile.SpooledTemporaryFile` rolling over to a file of
+    a :class:`Spool`, and counting the data it spools against the quota.
+
+    .. versionadded:: 5.1
+    """
+
+    def __init__(self, max_size, spool):
+        tempfile.SpooledTemporaryFile.__init__(self, max_size=max_size,
+                                               mode='w+b')
+        self.spool = spool
+        # Bytes reserved from the spool quota, released when closed or
+        # garbage collected.
+        self._reserved = [0]
+        self._release = weakref.finalize(self, _release_reservation, spool,
+                                         self._reserved)
+
+    def _reserve(self, size):
+        self.spool.reserve(size)
+        self._reserved[0] += size
+
+    def rollover(self):
+        if self._rolled:
+            return
+        file = self._file
+        data = file.getvalue()
+        self._reserve(len(data))
+        newfile = self.spool.open()
+        newfile.write(data)
+        newfile.seek(file.tell())
+        self._file = newfile
+        self._rolled = True
+
+    def write(self, s):
+        if self._rolled:
+            self._reserve(len(s))
+        return tempfile.SpooledTemporaryFile.write(self, s)
+
+    def close(self):
+        tempfile.SpooledTemporaryFile.close(self)
+        self._release()
+
+
+class MappedFileBuffer(FileBasedBuffer):
+    """
+    A buffer in a file of a :class:`Spool`, read through a memory map.
+
+    :meth:`peek` returns a memoryview of the mapped file and :meth:`get`
+    slices it, instead of reading the file.  The data is counted against
+    the spool quota until the buffer is emptied or closed.
+
+    .. versionadded:: 5.1
+    """
+
+    _map = None
+
+    def __init__(self, spool=default_spool):
+        self.spool = spool
+        self.size = 0  # The size of the file.
+        self.pos = 0  # The read position.
+        FileBasedBuffer.__init__(self, spool.open())
+
+    def append(self, s):
+        size = len(s)
+        self.spool.reserve(size)
+        try:
+            file = self.file
+            file.seek(self.size)
+            file.write(s)
+            file.flush()
+        except BaseException:
+            self.spool.release(size)
+            raise
+        self.size += size
+        self.remain += size
+
+    def _unmap(self):
+        """Unmap the file; return False if a view is still in use."""
+        m = self._map
+        if m is not None:
+            self._map = None
+            try:
+                m.close()
+            except BufferError:
+                # The garbage collector will unmap it.
+                return False
+        return True
+
+    def peek(self, numbytes=-1):
+        if not self.remain:
+            return b''
+        m = self._map
+        if m is None or len(m) < self.size:
+            self._unmap()
+            m = self._map = mmap.mmap(self.file.fileno(), self.size,
+                                      access=mmap.ACCESS_READ)
+        if numbytes < 0:
+            end = self.size
+        else:
+            end = min(self.pos + numbytes, self.size)
+        return memoryview(m)[self.pos:end]
+
+    def get(self, numbytes=-1, skip=0):
+        res = bytes(self.peek(numbytes))
+        if skip:
+            self.skip(len(res))
+        return res
+
+    def skip(self, numbytes, allow_prune=0):
+        if self.remain < numbytes:
+            raise ValueError("Can't skip %d bytes in buffer of %d bytes" % (
+                numbytes, self.remain))
+        self.pos += numbytes
+        self.remain -= numbytes
+        if not self.remain:
+            self.prune()
+
+    def prune(self):
+        """Give back the space of an emptied buffer."""
+        if self.remain or not self.size:
+            return
+        if not self._unmap():
+            # Truncating the file under the view would crash its user.
+            return
+        self.file.truncate(0)
+        self.spool.release(self.size)
+        self.size = self.pos = 0
+
+    def getfile(self):
+        self.file.seek(self.pos)
+        return self.file
+
+    def close(self):
+        if self.file.closed:
+            return
+        self._unmap()
+        self.file.close()
+        self.spool.release(self.size)
+        self.size = self.pos = self.remain = 0
+
+
 class OverflowableBuffer(TempfileBasedBuffer):
     """
     A buffer based on a :class:`tempfile.SpooledTemporaryFile`,
     buffering up to *overflow* (plus some extra) in memory, and
     automatically spooling that to disk when exceeded.
 
+    If a :class:`Spool` is given, the data is spooled to its files
+    instead of default temporary files.
+
     .. versionchanged:: 4.0.0
        Re-implement in terms of ``SpooledTemporaryFile``.
        Internal attributes of this object such as ``overflowed`` and
        ``strbuf`` no longer exist.
+
+    .. versionchanged:: 5.1
+       Add the *spool* argument.
     """
 
-    def __init__(self, overflow):
+    def __init__(self, overflow, spool=None):
         # overflow is the maximum to be stored in a SpooledTemporaryFile
         self.overflow = overflow + STRBUF_LIMIT
+        self.spool = spool
         TempfileBasedBuffer.__init__(self)
 
     def newfile(self):
+        if self.spool is not None:
+            return SpooledFile(self.overflow, self.spool)
         return tempfile.SpooledTemporaryFile(max_size=self.overflow,
                                              mode='w+b',
                                              suffix='zope_server_buffer.tmp')
@@ -157,3 +372,478 @@ class OverflowableBuffer(TempfileBasedBuffer):
         # it can do getfile().getvalue() (which before would work for
         # small values)
         return self.file._file
+
+
+class BufferPool:
+    """
+    A bounded, thread-safe pool of :class:`OverflowableBuffer` objects.
+
+    :meth:`acquire` returns an empty buffer, reusing a released one if
+    possible.  :meth:`release` empties a buffer and keeps it for reuse,
+    unless the pool already holds *size* buffers or the buffer has
+    rolled over to disk; such buffers are closed instead.
+
+    The ``hits``, ``misses`` and ``discarded`` counters and ``len()``
+    (the number of idle buffers in the pool) tell how well the pool
+    works.
+
+    .. versionadded:: 5.1
+    """
+
+    def __init__(self, size, overflow, spool=None):
+        self.size = size
+        self.overflow = overflow
+        self.spool = spool
+        self.hits = 0
+        self.misses = 0
+        self.discarded = 0
+        self._buffers = []
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._buffers)
+
+    def acquire(self):
+        with self._lock:
+            if self._buffers:
+                self.hits += 1
+                return self._buffers.pop()
+            self.misses += 1
+        return OverflowableBuffer(self.overflow, self.spool)
+
+    def release(self, buf):
+        file = buf.file
+        reusable = not file.closed and not file._rolled
+        if reusable:
+            try:
+                file.seek(0)
+                file.truncate()
+            except BufferError:
+                # A view of the data is still in use; leave the buffer
+                # to the garbage collector.
+                with self._lock:
+                    self.discarded += 1
+                return
+            buf.remain = 0
+        with self._lock:
+            if reusable and len(self._buffers) < self.size:
+                self._buffers.append(buf)
+                return
+            self.discarded += 1
+        buf.close()
+
+
+class PipeBuffer:
+    """
+    A bounded buffer passing a stream from one thread to another.
+
+    The writing thread (the main loop) calls :meth:`append`, and
+    :meth:`finish` at the end of the stream or :meth:`abort` if the
+    stream is broken.  It should stop appending while :meth:`full` is
+    true; once the reader has made room again, :attr:`on_drain` is
+    called (in the reading thread) if it is set.  :attr:`on_first_read`,
+    if set, is called before the first read.
+
+    The reading side is the file-like object returned by
+    :meth:`getfile`.  Reads wait until enough data has arrived or the
+    stream has ended.  A read raises :exc:`TimeoutError` if no data
+    arrives for *timeout* seconds, and the exception passed to
+    :meth:`abort` once the data before it has been read.  Data appended
+    after :meth:`close` is discarded.
+
+    .. versionadded:: 5.1
+    """
+
+    on_drain = None
+    on_first_read = None
+
+    def __init__(self, high_water, timeout=None):
+        self.high_water = high_water
+        self.timeout = timeout or None
+        self._data = bytearray()
+        self._cond = threading.Condition()
+        self._waiting = False  # True while the reader waits for data
+        self._finished = False
+        self._error = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._data)
+
+    def getfile(self):
+        return self
+
+    def full(self):
+        # A reader waiting for more than high_water bytes gets them.
+        return (len(self._data) >= self.high_water
+                and not self._waiting and not self._closed)
+
+    #
+    # Writing side
+    #
+
+    def append(self, s):
+        with self._cond:
+            if not self._closed:
+                self._data += s
+                self._cond.notify_all()
+
+    def finish(self):
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def abort(self, error):
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    #
+    # Reading side
+    #
+
+    def _wait(self, ready):
+        # Wait until ready() is true or no more data can come.  Called
+        # with the condition acquired.
+        if ready():
+            return
+        cond = self._cond
+        self._waiting = True
+        try:
+            if len(self._data) >= self.high_water:
+                # The writer may have stopped.
+                self._drained()
+            while not ready():
+                if self._error is not None:
+                    raise self._error
+                if self._finished:
+                    return
+                if not cond.wait(self.timeout):
+                    raise TimeoutError(
+                        'No data received for %s seconds' % self.timeout)
+        finally:
+            self._waiting = False
+
+    def _take(self, n):
+        # Remove n bytes from the front.  Called with the condition
+        # acquired.  (Deleting the start of a bytearray doesn't copy
+        # the rest.)
+        data = self._data
+        was_full = len(data) >= self.high_water
+        result = bytes(data[:n])
+        del data[:n]
+        if was_full and len(data) < self.high_water:
+            self._drained()
+        return result
+
+    def _start_reading(self):
+        on_first_read = self.on_first_read
+        if on_first_read is not None:
+            self.on_first_read = None
+            on_first_read()
+
+    def _drained(self):
+        on_drain = self.on_drain
+        if on_drain is not None:
+            on_drain()
+
+    def read(self, size=-1):
+        self._start_reading()
+        with self._cond:
+            if size is None or size < 0:
+                self._wait(lambda: False)
+                return self._take(len(self._data))
+            self._wait(lambda: len(self._data) >= size)
+            return self._take(min(size, len(self._data)))
+
+    def readline(self, size=-1):
+        if size is None:
+            size = -1
+        self._start_reading()
+        data = self._data
+        searched = [0]
+
+        def ready():
+            # Search only the data that arrived since the last check.
+            if data.find(b'\n', searched[0]) >= 0:
+                return True
+            searched[0] = len(data)
+            return 0 <= size <= len(data)
+
+        with self._cond:
+            self._wait(ready)
+            index = data.find(b'\n')
+            n = len(data) if index < 0 else index + 1
+            if size >= 0:
+                n = min(n, size)
+            return self._take(n)
+
+    def readlines(self, hint=-1):
+        lines = []
+        total = 0
+        for line in self:
+            lines.append(line)
+            total += len(line)
+            if 0 < hint < total:
+                break
+        return lines
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+    def close(self):
+        """Stop reading; the rest of the stream is discarded."""
+        with self._cond:
+            self._closed = True
+            del self._data[:]
+        self._drained()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_buffer_pool(size, overflow, spool=None):
+    """Return the process-wide :class:`BufferPool` for these arguments."""
+    key = (size, overflow, spool)
+    pool = _pools.get(key)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.setdefault(key, BufferPool(size, overflow, spool))
+    return pool
+
+
+def spool_buffer(adj):
+    """Return a :class:`MappedFileBuffer` in the spool configured by *adj*.
+
+    Meant as the *spool_factory* of :class:`SegmentedBuffer`.
+    """
+    return MappedFileBuffer(get_spool(adj))
+
+
+class FileSegment:
+    """
+    A range of an open file, queued in a :class:`SegmentedBuffer`.
+
+    The segment owns the file descriptor *fd* and closes it.  Channels
+    send it with :func:`os.sendfile`; :meth:`get` reads it with
+    :func:`os.pread` for other uses.
+
+    .. versionadded:: 5.1
+    """
+
+    def __init__(self, fd, offset, count):
+        self.fd = fd
+        self.offset = offset
+        self.remain = count
+
+    def __len__(self):
+        return self.remain
+
+    def get(self, numbytes=-1, skip=0):
+        if numbytes < 0 or numbytes > self.remain:
+            numbytes = self.remain
+        res = os.pread(self.fd, numbytes, self.offset)
+        if numbytes and not res:
+            raise OSError(errno.EIO, 'File shorter than expected')
+        if skip:
+            self.skip(len(res))
+        return res
+
+    peek = get
+
+    def skip(self, numbytes, allow_prune=0):
+        self.offset += numbytes
+        self.remain -= numbytes
+
+    def close(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+_memory_types = (bytes, memoryview)
+
+
+class SegmentedBuffer:
+    """
+    An output buffer keeping the appended data as a queue of segments.
+
+    Appended ``bytes`` (and read-only memoryviews) are queued as they
+    are, without copying.  :meth:`peek` returns a memoryview of the
+    first segment, and :meth:`skip` only advances an offset into it,
+    so data can be sent without copying it either.  Small appends are
+    joined to the last segment to keep the number of segments (and of
+    ``send()`` calls) down.
+
+    Once more than *overflow* bytes are held in memory, further data is
+    spooled to a buffer made by *spool_factory* (by default a
+    :class:`TempfileBasedBuffer`) queued as the last segment.  Ranges of
+    files can be queued with :meth:`append_file`.
+
+    .. versionadded:: 5.1
+    """
+
+    def __init__(self, overflow, spool_factory=TempfileBasedBuffer):
+        self.overflow = overflow
+        self.spool_factory = spool_factory
+        self.segments = deque()
+        self.offset = 0  # Bytes of segments[0] already consumed.
+        self.remain = 0
+        self.in_memory = 0  # Size of the in-memory segments.
+        self.spool = None  # The spooling last segment, if any.
+
+    def __len__(self):
+        return self.remain
+
+    def append(self, s):
+        if isinstance(s, memoryview) and s.readonly and s.contiguous:
+            s = s.cast('B')
+        elif not isinstance(s, bytes):
+            # The caller may reuse a mutable buffer.
+            s = bytes(s)
+        size = len(s)
+        if not size:
+            return
+        self.remain += size
+        spool = self.spool
+        if spool is None and self.in_memory + size > self.overflow:
+            spool = self.spool = self.spool_factory()
+            self.segments.append(spool)
+        if spool is not None:
+            spool.append(s)
+            return
+        self.in_memory += size
+        segments = self.segments
+        if size < STRBUF_LIMIT and segments:
+            last = segments[-1]
+            if (isinstance(last, bytes) and
+                    len(last) + size <= STRBUF_LIMIT):
+                segments[-1] = last + s
+                return
+        segments.append(s)
+
+    def append_file(self, fd, offset, count):
+        """Queue *count* bytes of the file *fd*, starting at *offset*.
+
+        The buffer takes over the file descriptor and closes it.
+        """
+        if not count:
+            os.close(fd)
+            return
+        self.segments.append(FileSegment(fd, offset, count))
+        self.remain += count
+        # Later data goes after the file.
+        self.spool = None
+
+    def peek_file(self):
+        """Return the first segment if it is a :class:`FileSegment`."""
+        segments = self.segments
+        if segments and isinstance(segments[0], FileSegment):
+            return segments[0]
+        return None
+
+    def peek(self, numbytes=-1):
+        """Return up to *numbytes* from the start of the buffer.
+
+        Less data may be returned, up to the end of the first segment;
+        an empty result means the buffer is empty.  Data held in memory
+        is returned as a memoryview without copying it.
+        """
+        if not self.segments:
+            return b''
+        head = self.segments[0]
+        if not isinstance(head, _memory_types):
+            return head.peek(numbytes)
+        view = memoryview(head)[self.offset:]
+        if numbytes >= 0:
+            view = view[:numbytes]
+        return view
+
+    def peek_segments(self, numbytes, maxsegments=64):
+        """Return a list of up to *numbytes* from the start of the buffer.
+
+        The data is returned as separate segments, for
+        ``socket.sendmsg()``.  It is cut short before a segment not held
+        in memory, unless that comes first.
+        """
+        segments = self.segments
+        if not segments or not isinstance(segments[0], _memory_types):
+            return [self.peek(numbytes)]
+        res = []
+        offset = self.offset
+        for segment in segments:
+            if (numbytes <= 0 or not isinstance(segment, _memory_types) or
+                    len(res) >= maxsegments):
+                break
+            view = memoryview(segment)[offset:offset + numbytes]
+            res.append(view)
+            numbytes -= len(view)
+            offset = 0
+        return res
+
+    def get(self, numbytes=-1, skip=0):
+        if numbytes < 0 or numbytes > self.remain:
+            numbytes = self.remain
+        chunks = []
+        offset = self.offset
+        wanted = numbytes
+        for segment in self.segments:
+            if not wanted:
+                break
+            if isinstance(segment, _memory_types):
+                chunk = segment[offset:offset + wanted]
+            else:
+                chunk = segment.get(wanted)
+            chunks.append(chunk)
+            wanted -= len(chunk)
+            offset = 0
+        res = b''.join(chunks)
+        if skip:
+            self.skip(len(res))
+        return res
+
+    def skip(self, numbytes, allow_prune=0):
+        if self.remain < numbytes:
+            raise ValueError("Can't skip %d bytes in buffer of %d bytes" % (
+                numbytes, self.remain))
+        self.remain -= numbytes
+        segments = self.segments
+        while numbytes:
+            head = segments[0]
+            if not isinstance(head, _memory_types):
+                available = len(head)
+                head.skip(min(numbytes, available))
+                if numbytes < available:
+                    return
+                numbytes -= available
+                segments.popleft()
+                head.close()
+                if head is self.spool:
+                    self.spool = None
+                continue
+            available = len(head) - self.offset
+            if numbytes < available:
+                self.offset += numbytes
+                return
+            numbytes -= available
+            segments.popleft()
+            self.in_memory -= len(head)
+            self.offset = 0
+
+    def prune(self):
+        """Nothing to do; consumed segments are released by skip()."""
+
+    def close(self):
+        for segment in self.segments:
+            if not isinstance(segment, _memory_types):
+                segment.close()
+        self.spool = None
+        self.segments.clear()
+        self.offset = self.remain = self.in_memory = 0
@@ -14,16 +14,27 @@
 """Dual-mode channel
 """
 import asyncore
+import errno
+import os
+import threading
+from contextlib import contextmanager
+from functools import partial
 from time import time
 
 from zope.server import trigger
 from zope.server.adjustments import default_adj
-from zope.server.buffers import OverflowableBuffer
+from zope.server.buffers import COPY_BYTES
+from zope.server.buffers import SegmentedBuffer
+from zope.server.buffers import spool_buffer
 
 
 # Create the main trigger if it doesn't exist yet.
 the_trigger = trigger.trigger()
 
+# The buffer handle_read() receives into, one per thread running an
+# event loop.  received() gets memoryviews of it.
+_read_buffers = threading.local()
+
 
 class DualModeChannel(asyncore.dispatcher):
     """Channel that switches between asynchronous and synchronous mode.
@@ -43,15 +54,50 @@ class DualModeChannel(asyncore.dispatcher):
 
     last_activity = 0
 
+    # The maximum number of output buffer segments passed to a single
+    # sendmsg() call.  0 always sends one segment at a time with send().
+    sendmsg_segments = 64
+
+    # Boolean: send files queued with write_file() using os.sendfile().
+    use_sendfile = hasattr(os, 'sendfile')
+
+    # Boolean: when nothing is waiting in the output buffer, write()
+    # sends what the socket accepts right away and buffers only the
+    # rest.
+    send_directly = True
+
+    # The output buffer, created when something is written and dropped
+    # again once it has been sent in asynchronous mode, so that idle
+    # connections don't hold one.  See the outbuf property.
+    _outbuf = None
+
+    # True while an application thread waits for the main loop to send
+    # output of a channel in synchronous mode (see _wait_for_drain()).
+    # _drained is the condition it waits on, created by set_sync(); the
+    # main loop notifies it after every send attempt.  With
+    # adj.send_in_main_loop, its lock also guards the output buffer in
+    # synchronous mode.
+    _draining = False
+    _drained = None
+    _drain_error = None
+
     def __init__(self, conn, addr, adj=None):
         self.addr = addr
         if adj is None:
             adj = default_adj
         self.adj = adj
-        self.outbuf = OverflowableBuffer(adj.outbuf_overflow)
         self.creation_time = time()
         asyncore.dispatcher.__init__(self, conn)
 
+    @property
+    def outbuf(self):
+        outbuf = self._outbuf
+        if outbuf is None:
+            adj = self.adj
+            outbuf = self._outbuf = SegmentedBuffer(
+                adj.outbuf_overflow, partial(spool_buffer, adj))
+        return outbuf
+
     #
     # ASYNCHRONOUS METHODS
     #
@@ -61,13 +107,16 @@ class DualModeChannel(asyncore.dispatcher):
 
     def writable(self):
         if not self.async_mode:
-            return 0
-        return self.will_close or self.outbuf
+            return self._draining or (
+                self.adj.send_in_main_loop and self._outbuf)
+        return self.will_close or self._outbuf
 
     def handle_write(self):
         if not self.async_mode:
+            if self._draining or self.adj.send_in_main_loop:
+                self._drain()
             return
-        if self.outbuf:
+        if self._outbuf:
             try:
                 self._flush_some()
             except OSError:
@@ -84,16 +133,64 @@ class DualModeChannel(asyncore.dispatcher):
     def handle_read(self):
         if not self.async_mode or self.will_close:
             return
+        self._receive()
+
+    def _receive(self):
         try:
-            data = self.recv(self.adj.recv_bytes)
+            if hasattr(self.socket, 'recv_into'):
+                data = self._recv_view(self.adj.recv_bytes)
+            else:
+                data = self.recv(self.adj.recv_bytes)
         except OSError:
             self.handle_comm_error()
             return
         self.last_activity = time()
         self.received(data)
 
+    def _recv_view(self, size):
+        buf = getattr(_read_buffers, 'buf', None)
+        if buf is None or len(buf) < size:
+            buf = _read_buffers.buf = bytearray(size)
+        return memoryview(buf)[:self.recv_into(buf, size)]
+
+    def recv_into(self, buffer, nbytes=0):
+        """Like recv(), but receive into *buffer*; return the byte count."""
+        try:
+            num_received = self.socket.recv_into(buffer, nbytes)
+        except OSError as why:
+            if why.errno in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0
+            else:
+                raise
+        if not num_received:
+            # The connection was closed.
+            self.handle_close()
+        return num_received
+
     def received(self, data):
-        """Override to receive data in async mode."""
+        """Override to receive data in async mode.
+
+        *data* may be a memoryview of a buffer that is reused for the
+        next read; copy what must be kept.
+        """
+
+    def _drain(self):
+        # Send for the application thread of a channel in synchronous
+        # mode.
+        cond = self._drained
+        with cond:
+            try:
+                self._flush_some()
+            except Exception as e:
+                # Hand communication errors to the application, as when
+                # it sends itself.  That includes disconnects, since
+                # close() refuses to run in synchronous mode.  The
+                # output is lost.
+                self._drain_error = e
+                self._discard_output()
+            self.last_activity = time()
+            cond.notify_all()
 
     def handle_comm_error(self):
         """
@@ -108,6 +205,8 @@ class DualModeChannel(asyncore.dispatcher):
 
         The main thread will stop calling received().
         """
+        if self._drained is None:
+            self._drained = threading.Condition()
         self.async_mode = False
 
     #
@@ -120,14 +219,24 @@ class DualModeChannel(asyncore.dispatcher):
         If block is set, this pauses the application.  If it is turned
         off, only the amount of data that can be sent without blocking
         is sent.
+
+        With adj.send_in_main_loop, the main loop does the sending.  If
+        block is set, flush() waits until it has sent all pending data,
+        raising TimeoutError (and dropping the data) if the client reads
+        nothing for adj.write_timeout seconds; otherwise flush() returns
+        right away.
         """
+        if self._sends_in_loop():
+            if block:
+                self._wait_for_drain(0)
+            return
         if not block:
             while self._flush_some():
                 pass
             return
         blocked = False
         try:
-            while self.outbuf:
+            while self._outbuf:
                 # We propagate errors to the application on purpose.
                 if not blocked:
                     self.socket.setblocking(1)
@@ -142,6 +251,9 @@ class DualModeChannel(asyncore.dispatcher):
 
         The main thread will begin calling received() again.
         """
+        if self._outbuf is not None and not self._outbuf:
+            # All sent; don't keep the buffer around while idle.
+            self._outbuf = None
         self.async_mode = True
         self.pull_trigger()
         self.last_activity = time()
@@ -151,26 +263,147 @@ class DualModeChannel(asyncore.dispatcher):
     #
 
     def write(self, data):
-        wrote = 0
         if isinstance(data, bytes):
+            data = [data] if data else []
+        else:
+            data = [v for v in data if v]
+        wrote = 0
+        for v in data:
+            wrote += len(v)
+        if self._sends_in_loop():
             if data:
-                self.outbuf.append(data)
-                wrote = len(data)
+                with self._queueing() as outbuf:
+                    for v in data:
+                        outbuf.append(v)
         else:
+            if (data and self.send_directly and not self._outbuf and
+                    self.connected):
+                # We propagate errors to the application on purpose.
+                data = self._send_directly(data)
             for v in data:
-                if v:
-                    self.outbuf.append(v)
-                    wrote += len(v)
+                self.outbuf.append(v)
+            self._flush_full()
+        high_water = self.adj.outbuf_high_water
+        if (high_water and not self.async_mode and
+                len(self._outbuf or ()) > high_water):
+            self._wait_for_drain(high_water)
+        return wrote
+
+    def _queue_output(self, data):
+        """Add *data* to the pending output without trying to send it.
 
-        while len(self.outbuf) >= self.adj.send_bytes:
+        It goes out with the next write or flush (or, with
+        adj.send_in_main_loop, when the main loop gets to it).
+        """
+        if self._sends_in_loop():
+            with self._queueing() as outbuf:
+                outbuf.append(data)
+        else:
+            self.outbuf.append(data)
+
+    def _send_directly(self, data):
+        """Send as much of the list *data* as possible without blocking.
+
+        Returns a list of what remains to be sent.
+        """
+        if (len(data) > 1 and self.sendmsg_segments and
+                hasattr(self.socket, 'sendmsg')):
+            num_sent = self.sendmsg(data[:self.sendmsg_segments])
+        else:
+            num_sent = self.send(data[0])
+        if num_sent:
+            self.last_activity = time()
+        for i, v in enumerate(data):
+            if num_sent < len(v):
+                rest = data[i:]
+                if num_sent:
+                    rest[0] = memoryview(v)[num_sent:]
+                return rest
+            num_sent -= len(v)
+        return []
+
+    def write_file(self, fd, offset, count):
+        """Write *count* bytes of the file *fd*, starting at *offset*.
+
+        The data is sent with :func:`os.sendfile` without reading it in
+        Python.  *fd* is duplicated, so the caller may close it.
+        """
+        if count:
+            fd = os.dup(fd)
+            if self._sends_in_loop():
+                with self._queueing() as outbuf:
+                    outbuf.append_file(fd, offset, count)
+            else:
+                self.outbuf.append_file(fd, offset, count)
+                self._flush_full()
+        return count
+
+    def _sends_in_loop(self):
+        # True if the main loop does the sending for the application
+        # thread (see Adjustments.send_in_main_loop).
+        return not self.async_mode and self.adj.send_in_main_loop
+
+    @contextmanager
+    def _queueing(self):
+        # Lock the output buffer against the main loop sending from it.
+        with self._drained:
+            self._raise_drain_error()
+            outbuf = self.outbuf
+            idle = not outbuf
+            yield outbuf
+        if idle:
+            # Make the main loop notice that there is data to send.
+            self.pull_trigger()
+
+    def _raise_drain_error(self):
+        error = self._drain_error
+        if error is not None:
+            self._drain_error = None
+            raise error
+
+    def _wait_for_drain(self, level):
+        """Wait until the main loop sent the output down to *level* bytes.
+
+        Only for channels in synchronous mode.  Raises TimeoutError,
+        dropping the pending output, if the client doesn't read anything
+        for adj.write_timeout seconds.
+        """
+        cond = self._drained
+        timeout = self.adj.write_timeout or None
+        with cond:
+            self._draining = True
+            try:
+                self.pull_trigger()
+                while True:
+                    self._raise_drain_error()
+                    if (len(self._outbuf or ()) <= level or
+                            not self.connected):
+                        break
+                    if not cond.wait(timeout):
+                        raise TimeoutError(
+                            'Client did not read for %s seconds' % timeout)
+            except BaseException:
+                # Abort the response.
+                self._discard_output()
+                raise
+            finally:
+                self._draining = False
+
+    def _discard_output(self):
+        outbuf = self._outbuf
+        if outbuf is not None:
+            self._outbuf = None
+            outbuf.close()
+
+    def _flush_full(self):
+        outbuf = self._outbuf
+        while outbuf is not None and len(outbuf) >= self.adj.send_bytes:
             # Send what we can without blocking.
             # We propagate errors to the application on purpose
             # (to stop the application if the connection closes).
             if not self._flush_some():
                 break
 
-        return wrote
-
     def pull_trigger(self):
         """Wake up the main loop."""
         the_trigger.pull_trigger()
@@ -180,19 +413,64 @@ class DualModeChannel(asyncore.dispatcher):
 
         Returns 1 if some data was sent.
         """
-        outbuf = self.outbuf
+        outbuf = self._outbuf
         if outbuf and self.connected:
-            chunk = outbuf.get(self.adj.send_bytes)
-            num_sent = self.send(chunk)
+            send_bytes = self.adj.send_bytes
+            file_segment = outbuf.peek_file()
+            if file_segment is not None and self.use_sendfile:
+                num_sent = self.sendfile(file_segment)
+            elif (self.sendmsg_segments and len(outbuf.segments) > 1 and
+                    hasattr(self.socket, 'sendmsg')):
+                # Send the pending segments (for instance the response
+                # header and the first body chunks) in one system call.
+                num_sent = self.sendmsg(
+                    outbuf.peek_segments(send_bytes, self.sendmsg_segments))
+            else:
+                num_sent = self.send(outbuf.peek(send_bytes))
             if num_sent:
                 outbuf.skip(num_sent, 1)
+                if not outbuf and self.async_mode:
+                    # All sent; don't keep the buffer around while idle.
+                    self._outbuf = None
                 return 1
         return 0
 
+    def sendmsg(self, buffers):
+        """Like send(), but gather the data from a list of buffers."""
+        try:
+            return self.socket.sendmsg(buffers)
+        except OSError as why:
+            if why.errno == errno.EWOULDBLOCK:
+                return 0
+            elif why.errno in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0
+            else:
+                raise
+
+    def sendfile(self, segment):
+        """Send some of a :class:`~zope.server.buffers.FileSegment`."""
+        try:
+            num_sent = os.sendfile(self.socket.fileno(), segment.fd,
+                                   segment.offset,
+                                   min(segment.remain, COPY_BYTES))
+        except OSError as why:
+            if why.errno == errno.EWOULDBLOCK:
+                return 0
+            elif why.errno in asyncore._DISCONNECTED:
+                self.handle_close()
+                return 0
+            else:
+                raise
+        if not num_sent:
+            raise OSError(errno.EIO, 'File shorter than expected')
+        return num_sent
+
     def close_when_done(self):
-        # Flush all possible.
-        while self._flush_some():
-            pass
+        if not self._sends_in_loop():
+            # Flush all possible.
+            while self._flush_some():
+                pass
         self.will_close = True
         if not self.async_mode:
             # For safety, don't close the socket until the
@@ -205,6 +483,8 @@ class DualModeChannel(asyncore.dispatcher):
         # closed in a thread, the main loop can end up with a bad file
         # descriptor.
         assert self.async_mode
-        self.outbuf.close()
+        if self._outbuf is not None:
+            self._outbuf.close()
+            self._outbuf = None
         self.connected = False
         asyncore.dispatcher.close(self)
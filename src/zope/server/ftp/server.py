@@ -25,6 +25,7 @@ from zope.interface import implementer
 from zope.security.interfaces import Unauthorized
 
 from zope.server.buffers import OverflowableBuffer
+from zope.server.buffers import get_spool
 from zope.server.dualmodechannel import DualModeChannel
 from zope.server.dualmodechannel import the_trigger
 from zope.server.interfaces import ITask
@@ -774,7 +775,8 @@ class STORChannel(FTPDataChannel):
 
     def __init__(self, control_channel, finish_args):
         self.finish_args = finish_args
-        self.inbuf = OverflowableBuffer(control_channel.adj.inbuf_overflow)
+        adj = control_channel.adj
+        self.inbuf = OverflowableBuffer(adj.inbuf_overflow, get_spool(adj))
         FTPDataChannel.__init__(self, control_channel)
         # Note that this channel starts in async mode.
 
@@ -868,7 +870,7 @@ class RETRChannel(FTPDataChannel):
         self.close()
 
     def reportDefault(self):
-        if not len(self.outbuf):
+        if not self._outbuf:
             # All data transferred
             if not self.opened:
                 # Zero-length file
@@ -32,87 +32,148 @@ class ChunkedReceiver:
     #   chunk-ext-name = token
     #   chunk-ext-val  = token | quoted-string
 
-    # This implementation is quite lax on what it will accept, and is
-    # probably even vulnerable to malicious input (denial of service due to
-    # space exhaustion) on carefully crafted badly formed chunk
-    # control lines.
+    # This implementation is quite lax on what it will accept, but it
+    # limits the size of control lines, of the trailer, and, if
+    # max_body_size is given, of the body.  Input it
+    # can't accept sets ``error`` (a (status, reason) tuple) and
+    # completes the receiver; the rest of the input is discarded.
 
     chunk_remainder = 0
     control_line = b''
     all_chunks_received = 0
     trailer = b''
     completed = 0
+    error = None
+    body_size = 0  # The sum of the chunk sizes so far.
 
-    # max_control_line = 1024
-    # max_trailer = 65536
+    max_control_line = 1024
+    max_trailer = 65536
 
-    def __init__(self, buf):
+    # The trailer received so far, its size, and its last two bytes (at
+    # first the newline ending the last control line), in which the
+    # blank line ending it may have started.
+    _trailer_parts = None
+    _trailer_size = 0
+    _trailer_tail = b'\n'
+
+    def __init__(self, buf, max_body_size=0):
         self.buf = buf
+        self.max_body_size = max_body_size
 
     def received(self, s):
         # Returns the number of bytes consumed.
         if self.completed:
             return 0
-        orig_size = len(s)
-        while s:
-            rm = self.chunk_remainder
-            if rm > 0:
-                # Receive the remainder of a chunk.
-                to_write = s[:rm]
-                self.buf.append(to_write)
-                written = len(to_write)
-                s = s[written:]
-                self.chunk_remainder -= written
-            elif not self.all_chunks_received:
-                # Receive a control line.
-                s = self.control_line + s
-                pos = s.find(b'\n')
-                if pos < 0:
-                    # Control line not finished.
-                    self.control_line = s
-                    s = b''
-                else:
-                    # Control line finished.
-                    line = s[:pos]
-                    s = s[pos + 1:]
-                    self.control_line = b''
-                    line = line.strip()
-                    if line:
-                        # Begin a new chunk.
-                        semi = line.find(b';')
-                        if semi >= 0:
-                            # discard extension info.
-                            line = line[:semi]
-                        sz = int(line.strip(), 16)  # hexadecimal
-                        if sz > 0:
-                            # Start a new chunk.
-                            self.chunk_remainder = sz
-                        else:
-                            # Finished chunks.
-                            self.all_chunks_received = 1
-                    # else expect a control line.
-            else:
-                # Receive the trailer.
-                trailer = self.trailer + s
-                if trailer.startswith(b'\r\n'):
-                    # No trailer.
-                    self.completed = 1
-                    return orig_size - (len(trailer) - 2)
-                if trailer.startswith(b'\n'):
-                    # No trailer.
-                    self.completed = 1
-                    return orig_size - (len(trailer) - 1)
-                pos = find_double_newline(trailer)
-                if pos < 0:
-                    # Trailer not finished.
-                    self.trailer = trailer
-                    s = b''
+        # Work on positions in the data rather than on slices of it, so
+        # that many small chunks take linear time.  Control lines are
+        # searched in a bytes copy, made only if there are any; chunk
+        # data is collected as views and appended to the buffer at once.
+        data = memoryview(s)
+        raw = None
+        size = data.nbytes
+        pieces = []
+        pos = 0
+        try:
+            while pos < size:
+                rm = self.chunk_remainder
+                if rm > 0:
+                    # Receive the remainder of a chunk.
+                    end = min(pos + rm, size)
+                    pieces.append(data[pos:end])
+                    self.chunk_remainder -= end - pos
+                    pos = end
+                elif not self.all_chunks_received:
+                    # Receive a control line.
+                    if raw is None:
+                        raw = bytes(s)
+                    end = raw.find(b'\n', pos)
+                    line_end = size if end < 0 else end
+                    line = raw[pos:line_end]
+                    if self.control_line:
+                        line = self.control_line + line
+                    if len(line) > self.max_control_line:
+                        return self._fail('400', 'Bad Request', size)
+                    if end < 0:
+                        # Control line not finished.
+                        self.control_line = line
+                        pos = size
+                    else:
+                        # Control line finished.
+                        self.control_line = b''
+                        pos = end + 1
+                        line = line.strip()
+                        # An empty line ends the data of a chunk.
+                        if line and not self._start_chunk(line):
+                            return self._fail('400', 'Bad Request', size)
+                        if (self.max_body_size and
+                                self.body_size > self.max_body_size):
+                            return self._fail('413', 'Payload Too Large', size)
                 else:
-                    # Finished the trailer.
-                    self.completed = 1
-                    self.trailer = trailer[:pos]
-                    return orig_size - (len(trailer) - pos)
-        return orig_size
+                    # Receive the trailer.
+                    if raw is None:
+                        raw = bytes(s)
+                    end = self._find_trailer_end(raw, pos)
+                    trailer_end = size if end < 0 else end
+                    self._trailer_size += trailer_end - pos
+                    if self._trailer_size > self.max_trailer:
+                        return self._fail(
+                            '431', 'Request Header Fields Too Large', size)
+                    self._trailer_parts.append(raw[pos:trailer_end])
+                    if end < 0:
+                        # Trailer not finished.
+                        tail = self._trailer_tail + raw[max(pos, size - 2):]
+                        self._trailer_tail = tail[-2:]
+                        pos = size
+                    else:
+                        # Finished the trailer.
+                        self.completed = 1
+                        trailer = b''.join(self._trailer_parts)
+                        if trailer not in (b'\r\n', b'\n'):
+                            # Not just the blank line ending it.
+                            self.trailer = trailer
+                        self._trailer_parts = None
+                        return end
+            return size
+        finally:
+            if pieces:
+                self.buf.append(
+                    pieces[0] if len(pieces) == 1 else b''.join(pieces))
+
+    def _start_chunk(self, line):
+        # Returns False if the control line is not acceptable.
+        semi = line.find(b';')
+        if semi >= 0:
+            # discard extension info.
+            line = line[:semi]
+        try:
+            sz = int(line.strip(), 16)  # hexadecimal
+        except ValueError:
+            return False
+        if sz > 0:
+            # Start a new chunk.
+            self.chunk_remainder = sz
+            self.body_size += sz
+        elif sz == 0:
+            # Finished chunks.
+            self.all_chunks_received = 1
+            self._trailer_parts = []
+        else:
+            return False
+        return True
+
+    def _find_trailer_end(self, data, pos):
+        # Returns the position just after the blank line ending the
+        # trailer, or -1.  An empty trailer is just that blank line.
+        tail = self._trailer_tail
+        index = find_double_newline(tail + bytes(data[pos:pos + 2]))
+        if index >= 0:
+            return pos + index - len(tail)
+        return find_double_newline(data, pos)
+
+    def _fail(self, status, reason, consumed):
+        self.error = (status, reason)
+        self.completed = 1
+        return consumed
 
     def getfile(self):
         return self.buf.getfile()
@@ -18,6 +18,7 @@ processing but threads to do work.
 """
 import re
 import sys
+from functools import lru_cache
 from io import BytesIO
 from urllib.parse import unquote
 from urllib.parse import urlsplit
@@ -25,6 +26,9 @@ from urllib.parse import urlsplit
 from zope.interface import implementer
 
 from zope.server.buffers import OverflowableBuffer
+from zope.server.buffers import PipeBuffer
+from zope.server.buffers import get_buffer_pool
+from zope.server.buffers import get_spool
 from zope.server.fixedstreamreceiver import FixedStreamReceiver
 from zope.server.interfaces import IStreamConsumer
 from zope.server.utilities import find_double_newline
@@ -32,6 +36,75 @@ from zope.server.utilities import find_double_newline
 
 PY3 = sys.version_info >= (3, )
 
+# Sizes of the caches of parsing results that repeat across requests
+# (header names, request lines and URIs); see cache_info().  Inputs
+# longer than MAX_CACHED_LENGTH are parsed without the caches, so that
+# large requests can't fill them with large keys.
+HEADER_NAME_CACHE_SIZE = 1024
+FIRST_LINE_CACHE_SIZE = 1024
+URI_CACHE_SIZE = 1024
+MAX_CACHED_LENGTH = 1024
+
+
+def _normalize_header_name(name):
+    return name.upper().replace('-', '_')
+
+
+def _crack_first_line(first_line_re, line):
+    method = uri = version = None
+    m = first_line_re.match(line)
+    if m is not None and m.end() == len(line):
+        if m.group(3):
+            version = m.group(5)
+        method = m.group(1).upper()
+        uri = m.group(2)
+    return (method, uri, version)
+
+
+def _split_uri(uri):
+    scheme, netloc, path, query, fragment = urlsplit(uri)
+    if path and '%' in path:
+        path = unquote(path)
+    if query == '':
+        query = None
+    return (scheme, netloc, path, query, fragment)
+
+
+_cached_normalize_header_name = lru_cache(
+    maxsize=HEADER_NAME_CACHE_SIZE)(_normalize_header_name)
+_cached_crack_first_line = lru_cache(
+    maxsize=FIRST_LINE_CACHE_SIZE)(_crack_first_line)
+_cached_split_uri = lru_cache(maxsize=URI_CACHE_SIZE)(_split_uri)
+
+
+def normalize_header_name(name):
+    """Return the key of the header *name* in HTTPRequestParser.headers."""
+    if len(name) > MAX_CACHED_LENGTH:
+        return _normalize_header_name(name)
+    return _cached_normalize_header_name(name)
+
+
+_caches = {
+    'header_names': _cached_normalize_header_name,
+    'first_lines': _cached_crack_first_line,
+    'uris': _cached_split_uri,
+}
+
+
+def cache_info():
+    """Return the statistics of the parsing caches.
+
+    Returns a dictionary mapping cache names to
+    :func:`functools.lru_cache` ``CacheInfo`` tuples.
+    """
+    return {name: func.cache_info() for name, func in _caches.items()}
+
+
+def cache_clear():
+    """Empty the parsing caches and reset their statistics."""
+    for func in _caches.values():
+        func.cache_clear()
+
 
 @implementer(IStreamConsumer)
 class HTTPRequestParser:
@@ -45,11 +118,28 @@ class HTTPRequestParser:
     completed = 0  # Set once request is completed.
     empty = 0        # Set if no request was made.
     in_header = False
+    # Set to a (status, reason) tuple if the request can't be served;
+    # the rest of the input is discarded.
+    error = None
+
+    # The header received so far: a list of fragments, their total size,
+    # and the last two bytes, in which the blank line ending the header
+    # may have started.
+    _fragments = None
+    _header_size = 0
+    _tail = b''
 
-    header_plus = b''
     chunked = 0
     content_length = 0
     body_rcv = None
+    _buffer_pool = None  # The pool the body buffer came from.
+    # Set if the body is passed on while it is received (see
+    # Adjustments.stream_request_bodies); body_pipe is the PipeBuffer.
+    streaming = 0
+    body_pipe = None
+    # Set if the client waits for "100 Continue" before sending the
+    # body; such requests are always streamed.
+    expect_continue = 0
 
     # Data from parsing. native strings.
     first_line = ''
@@ -87,12 +177,23 @@ class HTTPRequestParser:
         br = self.body_rcv
         if br is None:
             # In header.
-            s = self.header_plus + data
-            index = find_double_newline(s)
+            index = self._find_header_end(data)
+            size = self._header_size + (datalen if index < 0 else index)
+            max_size = self.adj.max_request_header_size
+            if max_size and size > max_size:
+                self.error = ('431', 'Request Header Fields Too Large')
+                self.completed = 1
+                self._fragments = None
+                return datalen
             if index >= 0:
                 # Header finished.
-                header_plus = s[:index]
-                consumed = len(data) - (len(s) - index)
+                fragments = self._fragments
+                if fragments:
+                    fragments.append(data[:index])
+                    header_plus = b''.join(fragments)
+                    self._fragments = None
+                else:
+                    header_plus = bytes(data[:index])
                 self.in_header = 0
                 # Remove preceeding blank lines.
                 header_plus = header_plus.lstrip()
@@ -101,20 +202,51 @@ class HTTPRequestParser:
                     self.completed = 1
                 else:
                     self.parse_header(header_plus)
+                    if self.error is not None:
+                        # Don't read the body, if any.
+                        self.completed = 1
+                        return datalen
                     if self.body_rcv is None:
                         self.completed = 1
-                return consumed
+                return index
             else:
                 # Header not finished yet.
-                self.header_plus = s
+                if self._fragments is None:
+                    self._fragments = []
+                self._fragments.append(bytes(data))
+                self._header_size = size
+                self._tail = (self._tail + bytes(data[-2:]))[-2:]
                 return datalen
         else:
             # In body.
             consumed = br.received(data)
             if br.completed:
                 self.completed = 1
+                if self.chunked:
+                    self.error = br.error
+                pipe = self.body_pipe
+                if pipe is not None:
+                    if self.error is None:
+                        pipe.finish()
+                    else:
+                        pipe.abort(OSError('Bad request body: %s %s'
+                                           % self.error))
             return consumed
 
+    def _find_header_end(self, data):
+        """Return the index just after the blank line ending the header.
+
+        Returns -1 if *data* doesn't contain the end of the header.  Only
+        *data* is searched, so parsing a header received in many pieces
+        takes linear time.
+        """
+        tail = self._tail
+        if tail:
+            index = find_double_newline(tail + bytes(data[:2]))
+            if index >= 0:
+                return index - len(tail)
+        return find_double_newline(data)
+
     def parse_header(self, header_plus):
         """
         Parses the header_plus block of text (the headers plus the
@@ -133,21 +265,37 @@ class HTTPRequestParser:
         self.first_line = first_line
         self.header = header
 
+        adj = self.adj
+        max_uri_length = adj.max_uri_length
+        if max_uri_length and len(first_line) > max_uri_length:
+            # Check the request target before the line is parsed (and
+            # cached).
+            parts = first_line.split(' ', 2)
+            if len(parts) > 1 and len(parts[1]) > max_uri_length:
+                self.error = ('414', 'URI Too Long')
+                return
+
         lines = self.get_header_lines()
         headers = self.headers
+        max_count = adj.max_header_count
+        count = 0
         for line in lines:
             index = line.find(':')
             if index > 0:
+                count += 1
+                if max_count and count > max_count:
+                    self.error = ('431', 'Request Header Fields Too Large')
+                    return
                 key = line[:index]
                 value = line[index + 1:].strip()
-                key1 = key.upper().replace('-', '_')
+                key1 = normalize_header_name(key)
                 # If a header already exists, we append subsequent values
                 # seperated by a comma. Applications already need to handle
                 # the comma seperated values, as HTTP front ends might do
                 # the concatenation for you (behavior specified in RFC2616).
-                try:
+                if key1 in headers:
                     headers[key1] += ', %s' % value
-                except KeyError:
+                else:
                     headers[key1] = value
             # else there's garbage in the headers?
 
@@ -159,22 +307,55 @@ class HTTPRequestParser:
         self.split_uri()
 
         if version == '1.1':
+            if headers.get('EXPECT', '').lower() == '100-continue':
+                self.expect_continue = 1
             te = headers.get('TRANSFER_ENCODING', '')
             if te == 'chunked':
                 from zope.server.http.chunking import ChunkedReceiver
                 self.chunked = 1
-                buf = OverflowableBuffer(self.adj.inbuf_overflow)
-                self.body_rcv = ChunkedReceiver(buf)
+                buf = self._new_buffer()
+                self.body_rcv = ChunkedReceiver(buf,
+                                                adj.max_request_body_size)
         if not self.chunked:
             try:
                 cl = int(headers.get('CONTENT_LENGTH', 0))
             except ValueError:
                 cl = 0
             self.content_length = cl
-            if cl > 0:
-                buf = OverflowableBuffer(self.adj.inbuf_overflow)
+            max_size = adj.max_request_body_size
+            if max_size and cl > max_size:
+                self.error = ('413', 'Payload Too Large')
+            elif cl > 0:
+                buf = self._new_buffer()
                 self.body_rcv = FixedStreamReceiver(cl, buf)
 
+    def _new_buffer(self):
+        adj = self.adj
+        if adj.stream_request_bodies or self.expect_continue:
+            self.streaming = 1
+            self.body_pipe = PipeBuffer(adj.body_pipe_size,
+                                        adj.channel_timeout)
+            return self.body_pipe
+        spool = get_spool(adj)
+        if adj.buffer_pool_size:
+            self._buffer_pool = get_buffer_pool(adj.buffer_pool_size,
+                                                adj.inbuf_overflow, spool)
+            return self._buffer_pool.acquire()
+        return OverflowableBuffer(adj.inbuf_overflow, spool)
+
+    def close(self):
+        """Give the body buffer back to its pool, if any.
+
+        The body stream must not be used afterwards; the rest of a
+        streamed body is discarded.
+        """
+        if self.body_pipe is not None:
+            self.body_pipe.close()
+        pool = self._buffer_pool
+        if pool is not None:
+            self._buffer_pool = None
+            pool.release(self.body_rcv.buf)
+
     def get_header_lines(self):
         """
         Splits the header into lines, putting multi-line headers together.
@@ -193,27 +374,17 @@ class HTTPRequestParser:
         '(( HTTP/([0-9.]+))$|$)')
 
     def crack_first_line(self):
-        method = uri = version = None
-
-        r = self.first_line
-        m = self.first_line_re.match(r)
-
-        if m is not None and m.end() == len(r):
-            if m.group(3):
-                version = m.group(5)
-            method = m.group(1).upper()
-            uri = m.group(2)
-
-        return (method, uri, version)
+        line = self.first_line
+        if len(line) > MAX_CACHED_LENGTH:
+            return _crack_first_line(self.first_line_re, line)
+        return _cached_crack_first_line(self.first_line_re, line)
 
     def split_uri(self):
-        (self.proxy_scheme, self.proxy_netloc, path, self.query,
-         self.fragment) = urlsplit(self.uri)
-        if path and '%' in path:
-            path = unquote(path)
-        self.path = path
-        if self.query == '':
-            self.query = None
+        uri = self.uri
+        split = (_split_uri if len(uri) > MAX_CACHED_LENGTH
+                 else _cached_split_uri)
+        (self.proxy_scheme, self.proxy_netloc, self.path, self.query,
+         self.fragment) = split(uri)
 
     def getBodyStream(self):
         body_rcv = self.body_rcv
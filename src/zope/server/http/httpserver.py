@@ -16,6 +16,7 @@
 This server uses asyncore to accept connections and do initial
 processing but threads to do work.
 """
+import threading
 
 from zope.server.http.httpserverchannel import HTTPServerChannel
 from zope.server.serverbase import ServerBase
@@ -27,6 +28,11 @@ class HTTPServer(ServerBase):
     channel_class = HTTPServerChannel
     SERVER_IDENT = 'zope.server.http'
 
+    # Statistics: the number of requests answered with 503 Service
+    # Unavailable because they waited longer than adj.max_queue_wait.
+    shed_requests = 0
+    _shed_lock = threading.Lock()
+
     def executeRequest(self, task):
         """Execute an HTTP request."""
         # This is a default implementation, meant to be overridden.
@@ -35,6 +41,11 @@ class HTTPServer(ServerBase):
         task.response_headers['Content-Length'] = str(len(body))
         task.write(body)
 
+    def requestShed(self, task):
+        """Called from a task thread when *task* is shed."""
+        with self._shed_lock:
+            self.shed_requests += 1
+
     def getExtraLogMessage(self):
         return '\n\tURL: http://%s:%d/' % (self.server_name, self.port)
 
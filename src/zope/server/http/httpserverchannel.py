@@ -16,6 +16,7 @@
 from zope.server.http.httprequestparser import HTTPRequestParser
 from zope.server.http.httptask import HTTPTask
 from zope.server.serverchannelbase import ServerChannelBase
+from zope.server.serverchannelbase import task_lock
 
 
 class HTTPServerChannel(ServerChannelBase):
@@ -23,3 +24,79 @@ class HTTPServerChannel(ServerChannelBase):
 
     task_class = HTTPTask
     parser_class = HTTPRequestParser
+
+    # The request being served while its body is received (see
+    # Adjustments.stream_request_bodies).
+    streaming_request = None
+
+    def handle_partial_request(self, req):
+        """See ServerChannelBase
+
+        Serves streaming requests once their header has arrived.
+        """
+        if req.streaming and req is not self.streaming_request:
+            self.streaming_request = req
+            req.body_pipe.on_drain = self.pull_trigger
+            ServerChannelBase.handle_request(self, req)
+
+    def handle_request(self, req):
+        """See ServerChannelBase"""
+        if req is self.streaming_request:
+            # The body is complete; the request is being served already.
+            self.streaming_request = None
+            if req.error is not None:
+                # Don't try to find the next request after a bad body.
+                self.will_close = True
+            return
+        if req.error is not None:
+            with task_lock:
+                idle = not self.running_tasks
+            if idle:
+                # Answer bad requests right away, without waiting for
+                # a thread.  The response only needs non-blocking writes
+                # and closes the connection.
+                self.task_class(self, req).service()
+                return
+        ServerChannelBase.handle_request(self, req)
+
+    def handle_spool_full(self, req):
+        """See ServerChannelBase
+
+        Answers like for requests exceeding the size limits, and closes
+        the connection.
+        """
+        req.error = ('507', 'Insufficient Storage')
+        req.completed = 1
+        self.handle_request(req)
+
+    def readable(self):
+        """See async.dispatcher
+
+        Keeps receiving the body of a streaming request in synchronous
+        mode, as long as the application reads it.
+        """
+        req = self.streaming_request
+        if req is not None and not self.async_mode:
+            return not self.will_close and not req.body_pipe.full()
+        return ServerChannelBase.readable(self)
+
+    def handle_read(self):
+        """See async.dispatcher"""
+        if self.streaming_request is not None and not self.async_mode:
+            if not self.will_close:
+                self._receive()
+            return
+        ServerChannelBase.handle_read(self)
+
+    def handle_close(self):
+        """See async.dispatcher"""
+        req = self.streaming_request
+        if req is not None and not self.async_mode:
+            # The client went away while the application reads the body.
+            # Closing has to wait until the channel is asynchronous again.
+            self.streaming_request = None
+            self.will_close = True
+            req.body_pipe.abort(ConnectionResetError(
+                'Connection closed while receiving the request body'))
+            return
+        ServerChannelBase.handle_close(self)
@@ -16,6 +16,9 @@
 An HTTP task that can execute an HTTP request with the help of the channel and
 the server it belongs to.
 """
+import os
+import stat
+import time
 
 from zope.interface import implementer
 from zope.publisher.interfaces.http import IHeaderOutput
@@ -48,6 +51,10 @@ class HTTPTask(AbstractTask):
     bytes_written = 0
     auth_user_name = ''
     cgi_env = None
+    sent_continue = 0
+
+    # The Retry-After header value (seconds) of shed requests.
+    shed_retry_after = 1
 
     def __init__(self, channel, request_data):
         # request_data is a httprequestparser.HTTPRequestParser
@@ -59,9 +66,69 @@ class HTTPTask(AbstractTask):
             # fall back to a version we support.
             version = '1.0'
         self.version = version
+        self.created = time.time()
+        if request_data.expect_continue and request_data.streaming:
+            # Ask for the body once the application reads it.
+            request_data.body_pipe.on_first_read = self.sendContinue
+
+    def service(self):
+        try:
+            AbstractTask.service(self)
+        finally:
+            self.request_data.close()
 
     def _do_service(self):
-        self.channel.server.executeRequest(self)
+        error = self.request_data.error
+        max_queue_wait = self.channel.adj.max_queue_wait
+        if error is not None:
+            self.writeError(*error)
+        elif (max_queue_wait and
+                self.start_time - self.created > max_queue_wait):
+            self.shed()
+        else:
+            try:
+                self.channel.server.executeRequest(self)
+            except OSError:
+                # Reading a streamed body fails once the parser rejects
+                # it; answer like for a body rejected before serving.
+                error = self.request_data.error
+                if error is None or self.wrote_header:
+                    raise
+                self.writeError(*error)
+
+    def sendContinue(self):
+        """Tell a client expecting "100 Continue" to send the body.
+
+        Does nothing if the response header was written already or the
+        body has arrived anyway.
+        """
+        if (self.sent_continue or self.wrote_header
+                or self.request_data.completed):
+            return
+        self.sent_continue = 1
+        self.channel.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+        self.channel.flush()
+
+    def shed(self):
+        """Answer with 503 Service Unavailable instead of executing.
+
+        Called for requests that waited too long in the task queue.
+        """
+        self.channel.server.requestShed(self)
+        self.response_headers['Retry-After'] = str(self.shed_retry_after)
+        self.writeError('503', 'Service Unavailable',
+                        'the server is overloaded')
+
+    def writeError(self, status, reason, detail=None):
+        """Answer with a short plain text error response."""
+        body = reason
+        if detail:
+            body = f'{reason}: {detail}.'
+        body = (body + '\r\n').encode('latin1')
+        self.setResponseStatus(status, reason)
+        self.response_headers['Content-Type'] = 'text/plain'
+        self.response_headers['Content-Length'] = str(len(body))
+        self.write(body)
 
     def setResponseStatus(self, status, reason):
         """See zope.publisher.interfaces.http.IHeaderOutput"""
@@ -128,6 +195,16 @@ class HTTPTask(AbstractTask):
             # Close if unrecognized HTTP version.
             close_it = 1
 
+        request_data = self.request_data
+        if request_data.error is not None:
+            # The rest of the request wasn't read.
+            close_it = 1
+        elif (request_data.expect_continue and not self.sent_continue
+                and not request_data.completed):
+            # The client may or may not send the body it was not asked
+            # for; don't take it for the next request.
+            close_it = 1
+
         self.close_on_finish = close_it
         if close_it:
             self.response_headers['Connection'] = 'close'
@@ -213,11 +290,52 @@ class HTTPTask(AbstractTask):
         channel = self.channel
         if not self.wrote_header:
             rh = self.buildResponseHeader()
-            channel.write(rh)
-            self.bytes_written += len(rh)
             self.wrote_header = 1
-        if data:
+            # Hand the header and the first data to the channel together
+            # so that they can go out in one packet.
+            self.bytes_written += channel.write((rh, data) if data else rh)
+        elif data:
             self.bytes_written += channel.write(data)
 
+    def writeFile(self, file):
+        """Write the rest of *file*, without reading it in Python.
+
+        The data is sent from the current position of *file*, up to its
+        end or the length given by the Content-Length response header.
+        Returns False, without writing anything, if the file can't be
+        sent this way (it isn't a regular file with a descriptor, or the
+        channel can't use :func:`os.sendfile`); the caller should then
+        read and write it instead.
+        """
+        channel = self.channel
+        if not getattr(channel, 'use_sendfile', False):
+            return False
+        try:
+            fd = file.fileno()
+            offset = file.tell()
+            st = os.fstat(fd)
+        except (AttributeError, OSError, ValueError):
+            return False
+        if not stat.S_ISREG(st.st_mode):
+            return False
+        count = self._getContentLength()
+        if count is None:
+            count = max(st.st_size - offset, 0)
+        self.write(b'')  # The response header.
+        self.bytes_written += channel.write_file(fd, offset, count)
+        return True
+
+    def _getContentLength(self):
+        value = self.response_headers.get('Content-Length')
+        if value is None:
+            for header in self.accumulated_headers or ():
+                name, _, v = header.partition(':')
+                if name.strip().lower() == 'content-length':
+                    value = v
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
     def flush(self):
         self.channel.flush()
@@ -33,6 +33,19 @@ class TestChunkedReceiver(unittest.TestCase):
                              expected)
         return reader
 
+    def test_reused_memoryviews(self):
+        # Data passed as views of a buffer that is then overwritten.
+        data = b'2\r\noh\r\n4;x=y\r\n hai\r\n0\r\n\r\n'
+        reader = self._makeOne()
+        buf = bytearray(5)
+        for start in range(0, len(data), 5):
+            chunk = data[start:start + 5]
+            buf[:len(chunk)] = chunk
+            reader.received(memoryview(buf)[:len(chunk)])
+            buf[:] = b'XXXXX'
+        self.assertTrue(reader.completed)
+        self.assertEqual(reader.getfile().read(), b'oh hai')
+
     def test_simple_body(self):
         reader = self._do_test(b'2\r\noh\r\n4\r\n hai\r\n0\r\n\r\n')
         self.assertTrue(reader.completed)
@@ -41,6 +54,7 @@ class TestChunkedReceiver(unittest.TestCase):
     def test_simple_body_no_trailer(self):
         reader = self._do_test(b'2\r\noh\r\n4\r\n hai\r\n0\n\r\n')
         self.assertTrue(reader.completed)
+        self.assertEqual(reader.trailer, b'')
         self.assertEqual(0, reader.received(b'abc'))
 
         reader = self._do_test(b'2\r\noh\r\n4\r\n hai\r\n\r\n')
@@ -54,13 +68,69 @@ class TestChunkedReceiver(unittest.TestCase):
         self._do_test(b'2;token=oh_hi\r\noh\r\n4\r\n hai\r\n0\r\n\r\n')
 
     def test_incorrect_chunk_token_ext_too_long(self):
-        # Most servers place limits on the size of tokens in chunks
-        # they'll accept, but we don't. For example, this fails in
-        # gevent.
+        # Control lines are limited to max_control_line bytes.
         data = b'2;token=oh_hi\r\noh\r\n4\r\n hai\r\n0\r\n\r\n'
         data = data.replace(b'oh_hi', b'_oh_hi' * 4000)
-        reader = self._do_test(data)
+        reader = self._makeOne()
+        self.assertEqual(reader.received(data), len(data))
+        self.assertTrue(reader.completed)
+        self.assertEqual(reader.error, ('400', 'Bad Request'))
+        self.assertEqual(reader.getfile().read(), b'')
+
+        # Also when the line arrives in pieces.
+        reader = self._makeOne()
+        for i in range(0, 2000, 10):
+            reader.received(data[i:i + 10])
+        self.assertEqual(reader.error, ('400', 'Bad Request'))
+
+        reader = self._makeOne()
+        reader.max_control_line = 30000
+        reader.received(data)
+        self.assertIsNone(reader.error)
+        self.assertEqual(reader.getfile().read(), b'oh hai')
+
+    def test_invalid_chunk_size(self):
+        for line in (b'xyz', b'-1', b'2 3'):
+            reader = self._makeOne()
+            reader.received(b'2\r\noh\r\n' + line + b'\r\nmore')
+            self.assertTrue(reader.completed)
+            self.assertEqual(reader.error, ('400', 'Bad Request'))
+
+    def test_trailer(self):
+        data = b'2\r\noh\r\n0\r\nX-Sum: 1\r\nX-Other: 2\r\n\r\nnext'
+        reader = self._do_test(data[:-4], b'oh')
+        self.assertEqual(reader.trailer, b'X-Sum: 1\r\nX-Other: 2\r\n\r\n')
+        reader = self._makeOne()
+        self.assertEqual(reader.received(data), len(data) - 4)
+        self.assertIsNone(reader.error)
+
+    def test_trailer_too_large(self):
+        reader = self._makeOne()
+        reader.max_trailer = 20
+        reader.received(b'2\r\noh\r\n0\r\nX-Sum: 1\r\n')
+        self.assertFalse(reader.completed)
+        self.assertEqual(reader.received(b'X-Other: 2\r\n\r\n'), 14)
+        self.assertTrue(reader.completed)
+        self.assertEqual(reader.error,
+                         ('431', 'Request Header Fields Too Large'))
+
+    def test_body_too_large(self):
+        reader = chunking.ChunkedReceiver(StringIOBasedBuffer(), 6)
+        reader.received(b'2\r\noh\r\n4\r\n hai\r\n')
+        self.assertIsNone(reader.error)
+        self.assertEqual(reader.body_size, 6)
+        # Rejected as soon as the chunk is announced.
+        self.assertEqual(reader.received(b'1\r\n'), 3)
+        self.assertTrue(reader.completed)
+        self.assertEqual(reader.error, ('413', 'Payload Too Large'))
+        self.assertEqual(reader.getfile().read(), b'oh hai')
+
+    def test_many_small_chunks(self):
+        data = b'1\r\nx\r\n' * 10000 + b'0\r\n\r\n'
+        reader = self._makeOne()
+        self.assertEqual(reader.received(data), len(data))
         self.assertTrue(reader.completed)
+        self.assertEqual(reader.getfile().read(), b'x' * 10000)
 
     def test_trailer_leading_bytes(self):
         reader = self._makeOne()
@@ -92,3 +162,4 @@ class TestChunkedReceiver(unittest.TestCase):
         # We accept this as completed
         reader.received(b'\njunk')
         self.assertTrue(reader.completed)
+        self.assertEqual(reader.trailer, b'')
@@ -37,6 +37,29 @@ class Tests(unittest.TestCase):
                 return
         raise AssertionError('Looping too far')
 
+    def testReusedMemoryviews(self):
+        # The channel passes views of a buffer it reuses for every read.
+        data = (b'POST /foo HTTP/1.1\r\nContent-Length: 7\r\n\r\n'
+                b'Hello.\nGET /bar HTTP/1.1\r\n\r\n')
+        buf = bytearray(10)
+        parsers = [HTTPRequestParser(my_adj)]
+        for start in range(0, len(data), 10):
+            chunk = data[start:start + 10]
+            buf[:len(chunk)] = chunk
+            view = memoryview(buf)[:len(chunk)]
+            while view:
+                parser = parsers[-1]
+                view = view[parser.received(view):]
+                if parser.completed:
+                    parsers.append(HTTPRequestParser(my_adj))
+            buf[:] = b'X' * 10
+        first, second = parsers[:2]
+        self.assertEqual(first.path, '/foo')
+        self.assertEqual(first.headers, {'CONTENT_LENGTH': '7'})
+        self.assertEqual(first.getBodyStream().read(), b'Hello.\n')
+        self.assertEqual(second.command, 'GET')
+        self.assertEqual(second.path, '/bar')
+
     def testSimpleGET(self):
         data = b"""\
 GET /foobar HTTP/8.4
@@ -154,3 +177,341 @@ Content-Length: Nope
         self.parser.header = "header: abc\n\tdef"
         lines = self.parser.get_header_lines()
         self.assertEqual(lines, ['header: abcdef'])
+
+
+class TestIncrementalHeader(unittest.TestCase):
+
+    request = (b'GET /foo HTTP/1.1\r\nHost: example.com\r\n'
+               b'Content-Length: 3\r\n\r\nabcGET /next HTTP/1.1\r\n\r\n')
+
+    def _makeOne(self, max_size=262144):
+        adj = Adjustments()
+        adj.max_request_header_size = max_size
+        return HTTPRequestParser(adj)
+
+    def _feed(self, parser, chunks):
+        consumed = 0
+        for chunk in chunks:
+            while chunk and not parser.completed:
+                n = parser.received(chunk)
+                consumed += n
+                chunk = chunk[n:]
+        return consumed
+
+    def test_split_at_every_position(self):
+        # Also splits the blank line ending the header.
+        for size in (1, 2, 3, 5, 7):
+            parser = self._makeOne()
+            chunks = [self.request[i:i + size]
+                      for i in range(0, len(self.request), size)]
+            consumed = self._feed(parser, chunks)
+            self.assertTrue(parser.completed, size)
+            self.assertEqual(parser.path, '/foo')
+            self.assertEqual(parser.headers['HOST'], 'example.com')
+            self.assertEqual(parser.getBodyStream().read(), b'abc')
+            # Nothing beyond the request is consumed.
+            self.assertEqual(self.request[consumed:],
+                             b'GET /next HTTP/1.1\r\n\r\n')
+
+    def test_blank_line_split_after_leading_newline(self):
+        parser = self._makeOne()
+        self.assertEqual(parser.received(b'GET / HTTP/1.1\n'), 15)
+        self.assertEqual(parser.received(b'\nGET'), 1)
+        self.assertTrue(parser.completed)
+        self.assertEqual(parser.path, '/')
+
+    def test_header_too_large(self):
+        parser = self._makeOne(max_size=100)
+        self.assertEqual(parser.received(b'GET / HTTP/1.1\r\n'), 16)
+        self.assertFalse(parser.completed)
+        data = b'X-Big: ' + b'x' * 100 + b'\r\n\r\nmore'
+        self.assertEqual(parser.received(data), len(data))
+        self.assertTrue(parser.completed)
+        self.assertFalse(parser.empty)
+        self.assertEqual(parser.error,
+                         ('431', 'Request Header Fields Too Large'))
+
+    def test_header_at_limit(self):
+        header = b'GET / HTTP/1.1\r\nX: y\r\n\r\n'
+        parser = self._makeOne(max_size=len(header))
+        self.assertEqual(parser.received(header), len(header))
+        self.assertIsNone(parser.error)
+        self.assertEqual(parser.headers, {'X': 'y'})
+
+    def test_no_limit(self):
+        parser = self._makeOne(max_size=0)
+        header = b'GET / HTTP/1.1\r\nX: ' + b'y' * 300000 + b'\r\n\r\n'
+        self._feed(parser, [header[i:i + 8192]
+                            for i in range(0, len(header), 8192)])
+        self.assertTrue(parser.completed)
+        self.assertIsNone(parser.error)
+        self.assertEqual(len(parser.headers['X']), 300000)
+
+    def test_chunked_body_error(self):
+        parser = self._makeOne()
+        data = (b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+                b'zz\r\nGET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(self._feed(parser, [data]), len(data))
+        self.assertEqual(parser.error, ('400', 'Bad Request'))
+
+
+class TestLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.adj = Adjustments()
+
+    def _parse(self, data):
+        parser = HTTPRequestParser(self.adj)
+        # The rest of the input is discarded.
+        self.assertEqual(parser.received(data), len(data))
+        self.assertTrue(parser.completed)
+        return parser
+
+    def test_within_limits(self):
+        self.adj.max_header_count = 2
+        self.adj.max_uri_length = 5
+        self.adj.max_request_body_size = 3
+        parser = HTTPRequestParser(self.adj)
+        data = (b'POST /abcd HTTP/1.0\r\nContent-Length: 3\r\n'
+                b'X-A: 1\r\n\r\nabc')
+        data = data[parser.received(data):]
+        parser.received(data)
+        self.assertTrue(parser.completed)
+        self.assertIsNone(parser.error)
+
+    def test_too_many_headers(self):
+        self.adj.max_header_count = 2
+        parser = self._parse(b'GET / HTTP/1.1\r\nA: 1\r\nB: 2\r\nC: 3\r\n\r\n'
+                             b'GET / HTTP/1.1\r\n\r\n')
+        self.assertEqual(parser.error,
+                         ('431', 'Request Header Fields Too Large'))
+
+    def test_uri_too_long(self):
+        self.adj.max_uri_length = 10
+        from zope.server.http import httprequestparser
+        httprequestparser.cache_clear()
+        self.addCleanup(httprequestparser.cache_clear)
+        parser = self._parse(b'GET /0123456789 HTTP/1.1\r\n\r\n')
+        self.assertEqual(parser.error, ('414', 'URI Too Long'))
+        self.assertEqual(parser.path, None)
+        # The request line was not parsed.
+        self.assertEqual(parser.command, '')
+        info = httprequestparser.cache_info()
+        self.assertEqual(info['first_lines'].currsize, 0)
+        self.assertEqual(info['uris'].currsize, 0)
+        # Only the target counts.
+        parser = HTTPRequestParser(self.adj)
+        parser.received(b'GET /012345678 HTTP/1.1\r\n\r\n')
+        self.assertIsNone(parser.error)
+
+    def test_content_length_too_large(self):
+        self.adj.max_request_body_size = 10
+        parser = self._parse(b'POST / HTTP/1.1\r\nContent-Length: 11\r\n'
+                             b'\r\n0123456789a')
+        self.assertEqual(parser.error, ('413', 'Payload Too Large'))
+        self.assertIsNone(parser.body_rcv)
+
+    def test_chunked_body_too_large(self):
+        self.adj.max_request_body_size = 10
+        parser = HTTPRequestParser(self.adj)
+        parser.received(b'POST / HTTP/1.1\r\n'
+                        b'Transfer-Encoding: chunked\r\n\r\n')
+        parser.received(b'8\r\n01234567\r\n')
+        self.assertFalse(parser.completed)
+        parser.received(b'8\r\n')
+        self.assertTrue(parser.completed)
+        self.assertEqual(parser.error, ('413', 'Payload Too Large'))
+
+    def test_disabled(self):
+        self.adj.max_header_count = 0
+        self.adj.max_uri_length = 0
+        self.adj.max_request_body_size = 0
+        parser = HTTPRequestParser(self.adj)
+        headers = b''.join(b'X-%d: 1\r\n' % i for i in range(300))
+        parser.received(b'POST /' + b'x' * 70000 + b' HTTP/1.0\r\n' + headers
+                        + b'Content-Length: 2000000000\r\n\r\n')
+        self.assertIsNone(parser.error)
+        self.assertFalse(parser.completed)
+        parser.close()
+
+
+class TestBufferPool(unittest.TestCase):
+
+    def setUp(self):
+        self.adj = Adjustments()
+        # A size no other test uses, for a pool of our own.
+        self.adj.buffer_pool_size = 3
+        self.adj.inbuf_overflow = 12345
+
+    def _parse(self, data):
+        parser = HTTPRequestParser(self.adj)
+        while data and not parser.completed:
+            data = data[parser.received(data):]
+        self.assertTrue(parser.completed)
+        return parser
+
+    def test_body_buffers_are_reused(self):
+        from zope.server.buffers import get_buffer_pool
+        from zope.server.buffers import get_spool
+        pool = get_buffer_pool(3, 12345, get_spool(self.adj))
+        hits = pool.hits
+
+        parser = self._parse(b'POST / HTTP/1.0\r\n'
+                             b'Content-Length: 5\r\n\r\nhello')
+        buf = parser.body_rcv.buf
+        self.assertEqual(parser.getBodyStream().read(), b'hello')
+        parser.close()
+        parser.close()  # Only released once.
+        self.assertEqual(len(pool), 1)
+
+        parser = self._parse(b'POST / HTTP/1.1\r\n'
+                             b'Transfer-Encoding: chunked\r\n\r\n'
+                             b'2\r\nhi\r\n0\r\n\r\n')
+        self.assertIs(parser.body_rcv.buf, buf)
+        self.assertEqual(pool.hits, hits + 1)
+        self.assertEqual(parser.getBodyStream().read(), b'hi')
+        parser.close()
+
+    def test_without_pool(self):
+        self.adj.buffer_pool_size = 0
+        parser = self._parse(b'POST / HTTP/1.0\r\n'
+                             b'Content-Length: 5\r\n\r\nhello')
+        self.assertIsNone(parser._buffer_pool)
+        parser.close()
+        self.assertEqual(parser.getBodyStream().read(), b'hello')
+
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.adj = Adjustments()
+        self.adj.stream_request_bodies = True
+        self.parser = HTTPRequestParser(self.adj)
+
+    def test_body_is_readable_while_received(self):
+        from zope.server.buffers import PipeBuffer
+        parser = self.parser
+        data = b'POST / HTTP/1.0\r\nContent-Length: 10\r\n\r\nhello'
+        self.assertEqual(parser.received(data), len(data) - 5)
+        self.assertTrue(parser.streaming)
+        self.assertIsInstance(parser.body_pipe, PipeBuffer)
+        self.assertEqual(parser.received(b'hello'), 5)
+        self.assertFalse(parser.completed)
+        body = parser.getBodyStream()
+        self.assertEqual(body.read(5), b'hello')
+        parser.received(b'world')
+        self.assertTrue(parser.completed)
+        self.assertEqual(body.read(), b'world')
+        parser.close()
+
+    def test_no_body(self):
+        parser = self.parser
+        parser.received(b'GET / HTTP/1.0\r\n\r\n')
+        self.assertTrue(parser.completed)
+        self.assertFalse(parser.streaming)
+        self.assertEqual(parser.getBodyStream().read(), b'')
+
+    def test_bad_body(self):
+        parser = self.parser
+        data = b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n'
+        parser.received(data)
+        self.assertTrue(parser.streaming)
+        parser.received(b'2\r\nhi\r\nzz\r\n')
+        self.assertEqual(parser.error, ('400', 'Bad Request'))
+        body = parser.getBodyStream()
+        self.assertEqual(body.read(2), b'hi')
+        with self.assertRaises(OSError):
+            body.read()
+
+    def test_expect_continue(self):
+        parser = HTTPRequestParser(Adjustments())
+        parser.received(b'PUT / HTTP/1.1\r\nContent-Length: 5\r\n'
+                        b'Expect: 100-Continue\r\n\r\n')
+        self.assertTrue(parser.expect_continue)
+        # Streamed, even though stream_request_bodies is off.
+        self.assertTrue(parser.streaming)
+
+    def test_expect_continue_http10(self):
+        parser = HTTPRequestParser(Adjustments())
+        parser.received(b'PUT / HTTP/1.0\r\nContent-Length: 5\r\n'
+                        b'Expect: 100-continue\r\n\r\n')
+        self.assertFalse(parser.expect_continue)
+        self.assertFalse(parser.streaming)
+
+    def test_close_discards_body(self):
+        parser = self.parser
+        parser.received(b'POST / HTTP/1.0\r\nContent-Length: 10\r\n\r\n')
+        parser.close()
+        parser.received(b'0123456789')
+        self.assertTrue(parser.completed)
+        self.assertEqual(len(parser.body_pipe), 0)
+
+
+class TestParsingCaches(unittest.TestCase):
+
+    request = (b'GET /a%20b?x=1 HTTP/1.1\r\nHost: example.com\r\n'
+               b'X-Forwarded-For: 10.0.0.1\r\n\r\n')
+
+    def setUp(self):
+        from zope.server.http import httprequestparser
+        self.module = httprequestparser
+        httprequestparser.cache_clear()
+        self.addCleanup(httprequestparser.cache_clear)
+
+    def _parse(self, data):
+        parser = HTTPRequestParser(my_adj)
+        parser.received(data)
+        self.assertTrue(parser.completed)
+        return parser
+
+    def test_normalize_header_name(self):
+        normalize = self.module.normalize_header_name
+        self.assertEqual(normalize('Content-Type'), 'CONTENT_TYPE')
+        self.assertEqual(normalize('content-type'), 'CONTENT_TYPE')
+
+    def test_repeated_requests_hit_caches(self):
+        first = self._parse(self.request)
+        info = self.module.cache_info()
+        self.assertEqual(info['header_names'].misses, 2)
+        self.assertEqual(info['first_lines'].misses, 1)
+        self.assertEqual(info['uris'].misses, 1)
+
+        second = self._parse(self.request)
+        info = self.module.cache_info()
+        self.assertEqual(info['header_names'].hits, 2)
+        self.assertEqual(info['first_lines'].hits, 1)
+        self.assertEqual(info['uris'].hits, 1)
+        for parser in (first, second):
+            self.assertEqual(parser.command, 'GET')
+            self.assertEqual(parser.path, '/a b')
+            self.assertEqual(parser.query, 'x=1')
+            self.assertEqual(parser.headers['X_FORWARDED_FOR'], '10.0.0.1')
+
+        self.module.cache_clear()
+        self.assertEqual(self.module.cache_info()['uris'].currsize, 0)
+
+    def test_long_inputs_are_not_cached(self):
+        long_path = b'/' + b'x' * self.module.MAX_CACHED_LENGTH
+        parser = self._parse(b'GET ' + long_path + b' HTTP/1.1\r\n'
+                             b'X-' + b'y' * 2000 + b': 1\r\n\r\n')
+        self.assertEqual(parser.path, long_path.decode('ascii'))
+        self.assertIn('X_' + 'Y' * 2000, parser.headers)
+        parser = HTTPRequestParser(my_adj)
+        parser.uri = long_path.decode('ascii')
+        parser.split_uri()
+        for info in self.module.cache_info().values():
+            self.assertEqual(info.currsize, 0)
+
+    def test_first_line_re_override(self):
+        import re
+
+        class GetOnlyParser(HTTPRequestParser):
+            first_line_re = re.compile(
+                '(GET) ([^ ]+)(( HTTP/([0-9.]+))$|$)')
+
+        for parser_class, expected in (
+                (HTTPRequestParser, ('POST', '/', '1.0')),
+                (GetOnlyParser, (None, None, None))):
+            parser = parser_class(my_adj)
+            parser.first_line = 'POST / HTTP/1.0'
+            self.assertEqual(parser.crack_first_line(), expected)
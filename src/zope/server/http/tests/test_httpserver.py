@@ -22,7 +22,9 @@ from time import sleep
 from zope.interface import implementer
 from zope.testing.cleanup import CleanUp
 
+from zope.server import reactor
 from zope.server.adjustments import Adjustments
+from zope.server.buffers import STRBUF_LIMIT
 from zope.server.interfaces import ITask
 from zope.server.task import AbstractTask
 from zope.server.tests import LoopTestMixin
@@ -34,6 +36,17 @@ my_adj = Adjustments()
 my_adj.outbuf_overflow = 10000
 my_adj.inbuf_overflow = 10000
 
+main_loop_adj = Adjustments()
+main_loop_adj.outbuf_overflow = 10000
+main_loop_adj.inbuf_overflow = 10000
+main_loop_adj.send_in_main_loop = True
+
+streaming_adj = Adjustments()
+streaming_adj.outbuf_overflow = 10000
+streaming_adj.stream_request_bodies = True
+# Small, to make the main loop wait for the application.
+streaming_adj.body_pipe_size = 4096
+
 
 @implementer(ITask)
 class SleepingTask(AbstractTask):
@@ -51,6 +64,7 @@ class Tests(LoopTestMixin,
             unittest.TestCase):
 
     thread_name = 'test_httpserver'
+    adj = my_adj
 
     def _makeServer(self):
         # import only now to prevent the testrunner from importing it too early
@@ -60,6 +74,10 @@ class Tests(LoopTestMixin,
         class EchoHTTPServer(HTTPServer):
             def executeRequest(self, task):
                 headers = task.request_data.headers
+                if 'X_REJECT' in headers:
+                    # Reject without reading the body.
+                    task.writeError('413', 'Payload Too Large')
+                    return
                 if 'CONTENT_LENGTH' in headers:
                     cl = headers['CONTENT_LENGTH']
                     task.response_headers['Content-Length'] = cl
@@ -72,7 +90,7 @@ class Tests(LoopTestMixin,
                 instream.close()
 
         return EchoHTTPServer(self.LOCALHOST, self.SERVER_PORT,
-                              task_dispatcher=self.td, adj=my_adj)
+                              task_dispatcher=self.td, adj=self.adj)
 
     def _makeConnection(self, host=None, port=None):
         h = HTTPConnection(host or self.LOCALHOST, port or self.port)
@@ -164,6 +182,135 @@ class Tests(LoopTestMixin,
         self.assertEqual(length, len(data))
         self.assertEqual(response_body, data.encode("ascii"))
 
+    def testHeaderTooLarge(self):
+        adj = self.adj
+        self.addCleanup(setattr, adj, 'max_request_header_size',
+                        adj.max_request_header_size)
+        adj.max_request_header_size = 4096
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        sock.send(b'GET / HTTP/1.1\r\nX-Big: ' + b'x' * 5000 + b'\r\n\r\n')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 431)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(response.read(),
+                         b'Request Header Fields Too Large\r\n')
+        # The server closed the connection.
+        self.assertEqual(sock.recv(10), b'')
+
+    def testIdleConnectionClosed(self):
+        adj = self.adj
+        self.addCleanup(setattr, adj, 'channel_timeout', adj.channel_timeout)
+        adj.channel_timeout = 0.2
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        sock.settimeout(10)
+        # Closed by the event loop, without another connection coming in.
+        self.assertEqual(sock.recv(10), b'')
+
+    def testExpectContinue(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 5\r\n'
+                     b'Expect: 100-continue\r\n\r\n')
+        expected = b'HTTP/1.1 100 Continue\r\n\r\n'
+        received = b''
+        while len(received) < len(expected):
+            received += sock.recv(len(expected) - len(received))
+        self.assertEqual(received, expected)
+        sock.sendall(b'hello')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 200)
+        self.assertEqual(response.read(5), b'hello')
+        self.assertIsNone(response.getheader('Connection'))
+
+    def testExpectContinueRejected(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 5\r\n'
+                     b'Expect: 100-continue\r\nX-Reject: 1\r\n\r\n')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        # No 100 Continue came first.
+        self.assertEqual(int(response.status), 413)
+        # The body that was not asked for is not parsed as a request.
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(response.read(), b'Payload Too Large\r\n')
+
+    def testExpectContinueChunkedBodyTooLarge(self):
+        adj = self.adj
+        self.addCleanup(setattr, adj, 'max_request_body_size',
+                        adj.max_request_body_size)
+        adj.max_request_body_size = 1000
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        sock.sendall(b'POST / HTTP/1.1\r\nTransfer-Encoding: chunked\r\n'
+                     b'Expect: 100-continue\r\n\r\n')
+        expected = b'HTTP/1.1 100 Continue\r\n\r\n'
+        received = b''
+        while len(received) < len(expected):
+            received += sock.recv(len(expected) - len(received))
+        self.assertEqual(received, expected)
+        # The body is rejected while the application reads it.
+        sock.sendall(b'1000\r\n')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 413)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(response.read(), b'Payload Too Large\r\n')
+
+    def testBodyTooLarge(self):
+        adj = self.adj
+        self.addCleanup(setattr, adj, 'max_request_body_size',
+                        adj.max_request_body_size)
+        adj.max_request_body_size = 1000
+        tasks = []
+        orig_add_task = self.server.addTask
+
+        def addTask(task):
+            tasks.append(task)
+            orig_add_task(task)
+        self.server.addTask = addTask
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        # The response comes before the body is sent.
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 1001\r\n\r\n')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 413)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(response.read(), b'Payload Too Large\r\n')
+        # It was answered by the main loop.
+        self.assertEqual(tasks, [])
+
+    def testSpoolQuotaExceeded(self):
+        adj = self.adj
+        for name in ('spool_quota', 'stream_request_bodies'):
+            self.addCleanup(setattr, adj, name, getattr(adj, name))
+        adj.spool_quota = 100
+        adj.stream_request_bodies = False
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        # The body overflows to the spool near its end.
+        body = b'x' * (adj.inbuf_overflow + STRBUF_LIMIT + 100)
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: %d\r\n\r\n'
+                     % len(body) + body)
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 507)
+        self.assertEqual(response.getheader('Connection'), 'close')
+        self.assertEqual(response.read(), b'Insufficient Storage\r\n')
+
     def testLargeBody(self):
         # Tests the use of multiple requests in a single connection.
         h = self._makeConnection()
@@ -377,3 +524,79 @@ class TestHTTPServer(unittest.TestCase):
         self.server.executeRequest(task)
         self.assertIn('Content-Type', task.response_headers)
         self.assertIn('Content-Length', task.response_headers)
+
+    def test_requestShed(self):
+        self.assertEqual(self.server.shed_requests, 0)
+        self.server.requestShed(None)
+        self.server.requestShed(None)
+        self.assertEqual(self.server.shed_requests, 2)
+
+
+@unittest.skipUnless('poll' in reactor.backends, 'poll not available')
+class PollTests(Tests):
+
+    event_loop_backend = 'poll'
+
+
+@unittest.skipUnless('epoll' in reactor.backends, 'epoll not available')
+class EpollTests(Tests):
+
+    event_loop_backend = 'epoll'
+
+
+class MainLoopSendsTests(Tests):
+
+    adj = main_loop_adj
+
+
+class StreamingTests(Tests):
+
+    adj = streaming_adj
+
+    def testBodyIsStreamed(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        self.addCleanup(sock.close)
+        # The application reads blocks of 8192 bytes.
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 8200\r\n\r\n'
+                     + b'x' * 8192)
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 200)
+        # The start of the body was echoed before the rest was sent.
+        self.assertEqual(response.read(8192), b'x' * 8192)
+        sock.sendall(b'the rest')
+        self.assertEqual(response.read(8), b'the rest')
+        # The connection can be used for the next request.
+        sock.sendall(b'GET / HTTP/1.1\r\nConnection: close\r\n\r\n')
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(int(response.status), 200)
+
+    def testClientGoesAway(self):
+        errors = []
+        orig = self.server.executeRequest
+
+        def executeRequest(task):
+            try:
+                orig(task)
+            except OSError as e:
+                errors.append(e)
+        self.server.executeRequest = executeRequest
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.connect((self.LOCALHOST, self.port))
+        sock.sendall(b'POST / HTTP/1.1\r\nContent-Length: 8200\r\n\r\n'
+                     + b'x' * 8192)
+        response = ClientHTTPResponse(sock)
+        response.begin()
+        self.assertEqual(response.read(8192), b'x' * 8192)
+        response.close()
+        sock.close()
+        for _i in range(100):
+            if errors:
+                break
+            sleep(0.05)
+        self.assertIsInstance(errors[0], ConnectionResetError)
+        # The server is fine.
+        self.testEchoResponse()
@@ -2,8 +2,12 @@
 Tests for httptask.py.
 
 """
+import io
+import os
+import tempfile
 import unittest
 
+from zope.server.adjustments import Adjustments
 from zope.server.http import httptask
 from zope.server.http.httprequestparser import HTTPRequestParser
 
@@ -154,3 +158,200 @@ class TestHTTPTask(unittest.TestCase):
         task.flush()
 
         self.assertTrue(task.channel.flush_called)
+
+
+class ShedChannel(MockChannel):
+
+    def __init__(self, max_queue_wait):
+        self.adj = Adjustments()
+        self.adj.max_queue_wait = max_queue_wait
+        self.written = []
+        self.executed = []
+        self.shed = []
+
+    hit_log = None
+
+    def write(self, data):
+        if not isinstance(data, bytes):
+            data = b''.join(data)
+        self.written.append(data)
+        return len(data)
+
+    def executeRequest(self, task):
+        self.executed.append(task)
+
+    def requestShed(self, task):
+        self.shed.append(task)
+
+    def close_when_done(self):
+        pass
+
+
+class TestLoadShedding(unittest.TestCase):
+
+    def _makeOne(self, max_queue_wait, waited):
+        channel = ShedChannel(max_queue_wait)
+        task = httptask.HTTPTask(channel, MockRequestData())
+        task.created -= waited
+        return task
+
+    def test_fresh_task_executed(self):
+        task = self._makeOne(5, 1)
+        task.service()
+        self.assertEqual(task.channel.executed, [task])
+        self.assertEqual(task.channel.shed, [])
+
+    def test_service_closes_request_data(self):
+        task = self._makeOne(5, 1)
+        closed = []
+        task.request_data.close = lambda: closed.append(1)
+        task.service()
+        self.assertEqual(closed, [1])
+
+    def test_disabled(self):
+        task = self._makeOne(0, 3600)
+        task.service()
+        self.assertEqual(task.channel.executed, [task])
+
+    def test_stale_task_shed(self):
+        task = self._makeOne(5, 10)
+        task.shed_retry_after = 7
+        task.service()
+        channel = task.channel
+        self.assertEqual(channel.executed, [])
+        self.assertEqual(channel.shed, [task])
+        self.assertEqual(task.status, '503')
+        self.assertEqual(task.response_headers['Retry-After'], '7')
+        response = b''.join(channel.written)
+        self.assertTrue(
+            response.startswith(b'HTTP/1.0 503 Service Unavailable\r\n'))
+        self.assertIn(b'\r\nRetry-After: 7\r\n', response)
+        head, body = response.split(b'\r\n\r\n', 1)
+        self.assertIn(b'Content-Length: %d' % len(body), head)
+
+
+class TestErrorResponses(unittest.TestCase):
+
+    def test_request_error_served(self):
+        channel = ShedChannel(0)
+        request_data = MockRequestData()
+        request_data.error = ('431', 'Request Header Fields Too Large')
+        task = httptask.HTTPTask(channel, request_data)
+        task.service()
+        self.assertEqual(channel.executed, [])
+        self.assertTrue(task.close_on_finish)
+        response = b''.join(channel.written)
+        self.assertTrue(response.startswith(
+            b'HTTP/1.0 431 Request Header Fields Too Large\r\n'))
+        self.assertIn(b'\r\nConnection: close\r\n', response)
+        self.assertTrue(response.endswith(
+            b'\r\n\r\nRequest Header Fields Too Large\r\n'))
+
+    def test_writeError_detail(self):
+        channel = ShedChannel(0)
+        task = httptask.HTTPTask(channel, MockRequestData())
+        task.writeError('400', 'Bad Request', 'no host')
+        response = b''.join(channel.written)
+        self.assertIn(b'Content-Type: text/plain\r\n', response)
+        self.assertTrue(response.endswith(b'\r\nBad Request: no host.\r\n'))
+
+
+class TestExpectContinue(unittest.TestCase):
+
+    def _makeOne(self):
+        adj = Adjustments()
+        request_data = HTTPRequestParser(adj)
+        request_data.received(b'PUT / HTTP/1.1\r\nContent-Length: 4\r\n'
+                              b'Expect: 100-continue\r\n\r\n')
+        return httptask.HTTPTask(ShedChannel(0), request_data)
+
+    def test_sent_on_first_read(self):
+        task = self._makeOne()
+        channel = task.channel
+        self.assertEqual(channel.written, [])
+        body = task.request_data.getBodyStream()
+        body.append(b'body')  # As the main loop would, once asked for.
+        self.assertEqual(body.read(2), b'bo')
+        self.assertEqual(body.read(2), b'dy')
+        self.assertEqual(channel.written, [b'HTTP/1.1 100 Continue\r\n\r\n'])
+        self.assertTrue(channel.flush_called)
+        task.response_headers['Content-Length'] = '0'
+        task.write(b'')
+        self.assertFalse(task.close_on_finish)
+
+    def test_not_sent_after_response(self):
+        task = self._makeOne()
+        task.writeError('401', 'Unauthorized')
+        # The body was not asked for.
+        self.assertTrue(task.close_on_finish)
+        task.sendContinue()
+        self.assertEqual(len(task.channel.written), 1)
+        self.assertFalse(task.sent_continue)
+
+
+class FileChannel(ShedChannel):
+
+    use_sendfile = True
+
+    def __init__(self):
+        ShedChannel.__init__(self, 0)
+        self.files = []
+
+    def write_file(self, fd, offset, count):
+        self.files.append((fd, offset, count))
+        return count
+
+
+class TestWriteFile(unittest.TestCase):
+
+    def _makeOne(self, channel=None):
+        return httptask.HTTPTask(channel or FileChannel(), MockRequestData())
+
+    def _makeFile(self, data=b'0123456789'):
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write(data)
+        f.seek(3)
+        return f
+
+    def test_whole_file(self):
+        task = self._makeOne()
+        f = self._makeFile()
+        self.assertTrue(task.writeFile(f))
+        self.assertEqual(task.channel.files, [(f.fileno(), 3, 7)])
+        self.assertTrue(task.wrote_header)
+
+    def test_content_length(self):
+        task = self._makeOne()
+        task.appendResponseHeaders(['X-Foo: bar', 'content-length: 4'])
+        f = self._makeFile()
+        self.assertTrue(task.writeFile(f))
+        self.assertEqual(task.channel.files, [(f.fileno(), 3, 4)])
+
+        task = self._makeOne()
+        task.setResponseHeaders({'Content-Length': '5'})
+        self.assertTrue(task.writeFile(f))
+        self.assertEqual(task.channel.files, [(f.fileno(), 3, 5)])
+
+    def test_invalid_content_length(self):
+        task = self._makeOne()
+        task.appendResponseHeaders(['Content-Length: many'])
+        f = self._makeFile()
+        self.assertTrue(task.writeFile(f))
+        self.assertEqual(task.channel.files, [(f.fileno(), 3, 7)])
+
+    def test_not_a_file(self):
+        task = self._makeOne()
+        self.assertFalse(task.writeFile(io.BytesIO(b'data')))
+        self.assertFalse(task.writeFile(object()))
+        self.assertEqual(task.channel.files, [])
+        self.assertFalse(task.wrote_header)
+
+    def test_pipe(self):
+        r, w = os.pipe()
+        with os.fdopen(r, 'rb') as rf, os.fdopen(w, 'wb'):
+            self.assertFalse(self._makeOne().writeFile(rf))
+
+    def test_channel_without_sendfile(self):
+        task = self._makeOne(MockChannel())
+        self.assertFalse(task.writeFile(self._makeFile()))
@@ -12,7 +12,10 @@
 """Test Publisher-based HTTP Server
 """
 
+import io
+import os
 import sys
+import tempfile
 import unittest
 import warnings
 from contextlib import closing
@@ -281,6 +284,7 @@ class Tests(LoopTestMixin,
         wsgi_variables = set(response_body.decode('ascii').split())
         self.assertEqual(wsgi_variables,
                          {'wsgi.version', 'wsgi.url_scheme', 'wsgi.input',
+                          'wsgi.file_wrapper',
                           'wsgi.errors', 'wsgi.multithread',
                           'wsgi.multiprocess', 'wsgi.run_once'})
 
@@ -476,12 +480,72 @@ class Tests(LoopTestMixin,
             return iterator
 
         self.server.application = app
-        self.invokeRequest("/")
+        with closing(HTTPConnection(self.LOCALHOST, self.port)) as h:
+            h.request('GET', '/')
+            # Without a Content-Length the server closes the connection
+            # once the task, and so the application, is done.
+            self.assertEqual(h.getresponse().read(), b'Klaatubaradanikto')
         self.assertTrue(iterator.closed,
                         "close method wasn't called on iterable")
 
         self.server.application = orig_app
 
+    def _makeFile(self, data):
+        fd, name = tempfile.mkstemp()
+        self.addCleanup(os.remove, name)
+        os.write(fd, data)
+        os.close(fd)
+        return name
+
+    def test_file_wrapper_sendfile(self):
+        data = bytes(range(256)) * 400
+        name = self._makeFile(data)
+
+        class UnreadableFile(io.FileIO):
+            # Prove that the data isn't read in Python.
+            def read(self, *args):
+                raise AssertionError('read() called')
+
+        files = []
+
+        def app(environ, start_response):
+            f = UnreadableFile(name)
+            f.seek(10)
+            files.append(f)
+            start_response('200 OK', [('Content-Length', '50000')])
+            return environ['wsgi.file_wrapper'](f)
+
+        orig_app = self.server.application
+        self.server.application = app
+        try:
+            status, body = self.invokeRequest('/')
+            self.assertEqual(status, 200)
+            self.assertEqual(body, data[10:50010])
+            # The connection is still usable.
+            status, body = self.invokeRequest('/')
+            self.assertEqual(body, data[10:50010])
+            # The response can arrive before the task closes the file,
+            # but the first task is done once the second one ran.
+            self.assertTrue(files[0].closed)
+        finally:
+            self.server.application = orig_app
+
+    def test_file_wrapper_fallback(self):
+        data = b'x' * 20000
+
+        def app(environ, start_response):
+            start_response('200 OK', [('Content-Length', str(len(data)))])
+            return environ['wsgi.file_wrapper'](BytesIO(data), 4096)
+
+        orig_app = self.server.application
+        self.server.application = app
+        try:
+            status, body = self.invokeRequest('/')
+            self.assertEqual(status, 200)
+            self.assertEqual(body, data)
+        finally:
+            self.server.application = orig_app
+
     def test_wsgi_compliance(self):
         orig_app = self.server.application
         self.server.application = paste.lint.middleware(orig_app)
@@ -533,6 +597,7 @@ class PMDBTests(Tests):
         wsgi_variables = set(response_body.decode('ascii').split())
         self.assertEqual(wsgi_variables,
                          {'wsgi.version', 'wsgi.url_scheme', 'wsgi.input',
+                          'wsgi.file_wrapper',
                           'wsgi.errors', 'wsgi.multithread',
                           'wsgi.multiprocess', 'wsgi.handleErrors',
                           'wsgi.run_once'})
@@ -621,3 +686,69 @@ class TestPaste(unittest.TestCase):
             wsgihttpserver.asyncore = orig_async
 
         self.assertTrue(a.looped)
+
+    def test_run_paste_backend(self):
+        from zope.server.http import wsgihttpserver
+
+        class Server:
+            adj = None
+
+            def __init__(self, *args, **kwargs):
+                Server.adj = kwargs['adj']
+
+            def close(self):
+                pass
+
+        class reactor:
+            backend = None
+
+            def loop(self, backend):
+                self.backend = backend
+
+        orig_wsgi = wsgihttpserver.WSGIHTTPServer
+        orig_reactor = wsgihttpserver.reactor
+
+        wsgihttpserver.WSGIHTTPServer = Server
+        r = wsgihttpserver.reactor = reactor()
+
+        try:
+            wsgihttpserver.run_paste(None, None, threads=0, backend='poll')
+        finally:
+            wsgihttpserver.WSGIHTTPServer = orig_wsgi
+            wsgihttpserver.reactor = orig_reactor
+
+        self.assertEqual(r.backend, 'poll')
+        from zope.server import maxsockets
+        self.assertEqual(Server.adj.connection_limit,
+                         maxsockets.connection_limit('poll'))
+
+    def test_asbool(self):
+        from zope.server.http.wsgihttpserver import _asbool
+        self.assertTrue(_asbool('true'))
+        self.assertTrue(_asbool(' On'))
+        self.assertTrue(_asbool(1))
+        self.assertFalse(_asbool('false'))
+        self.assertFalse(_asbool(''))
+        self.assertFalse(_asbool(None))
+
+    def test_run_paste_workers(self):
+        from zope.server.http import wsgihttpserver
+
+        class PreforkServer:
+            ran = False
+
+            def __init__(self, factory, workers, threads, adj, backend):
+                PreforkServer.args = (factory, workers, threads, backend)
+
+            def run(self):
+                PreforkServer.ran = True
+
+        orig_prefork = wsgihttpserver.PreforkServer
+        wsgihttpserver.PreforkServer = PreforkServer
+        try:
+            wsgihttpserver.run_paste(None, None, threads='3', workers='4')
+        finally:
+            wsgihttpserver.PreforkServer = orig_prefork
+
+        self.assertTrue(PreforkServer.ran)
+        self.assertEqual(PreforkServer.args[1:], (4, 3, 'select'))
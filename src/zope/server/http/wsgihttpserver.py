@@ -19,7 +19,11 @@ from contextlib import closing
 
 import zope.security.management
 
+from zope.server import maxsockets
+from zope.server import reactor
+from zope.server.adjustments import Adjustments
 from zope.server.http.httpserver import HTTPServer
+from zope.server.prefork import PreforkServer
 from zope.server.taskthreads import ThreadedTaskDispatcher
 
 
@@ -28,6 +32,41 @@ def fakeWrite(body):
         "Zope 3's HTTP Server does not support the WSGI write() function.")
 
 
+class FileWrapper:
+    """The ``wsgi.file_wrapper`` of the server.
+
+    Files returned wrapped in it are sent with :func:`os.sendfile` when
+    possible, and read in blocks of *block_size* otherwise.
+    """
+
+    def __init__(self, filelike, block_size=8192):
+        self.filelike = filelike
+        self.block_size = block_size
+
+    def __iter__(self):
+        read = self.filelike.read
+        block_size = self.block_size
+        while True:
+            data = read(block_size)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        if hasattr(self.filelike, 'close'):
+            self.filelike.close()
+
+
+def writeResult(task, result):
+    """Write the WSGI application *result* to *task*."""
+    if isinstance(result, FileWrapper) and task.writeFile(result.filelike):
+        return
+    # By iterating manually at this point, we execute task.write()
+    # multiple times, allowing partial data to be sent.
+    for value in result:
+        task.write(value)
+
+
 def curriedStartResponse(task):
     def start_response(status, headers, exc_info=None):
         if task.wroteResponseHeader() and not exc_info:
@@ -94,6 +133,7 @@ class WSGIHTTPServer(HTTPServer):
         env['wsgi.multiprocess'] = True
         env['wsgi.run_once'] = False
         env['wsgi.input'] = task.request_data.getBodyStream()
+        env['wsgi.file_wrapper'] = FileWrapper
 
         # Add some proprietary proxy information.
         # Note: Derived request parsers might not have these new attributes,
@@ -111,12 +151,8 @@ class WSGIHTTPServer(HTTPServer):
 
         # Call the application to handle the request and write a response
         result = self.application(env, curriedStartResponse(task))
-
-        # By iterating manually at this point, we execute task.write()
-        # multiple times, allowing partial data to be sent.
         try:
-            for value in result:
-                task.write(value)
+            writeResult(task, result)
         finally:
             if hasattr(result, "close"):
                 result.close()
@@ -134,10 +170,7 @@ class PMDBWSGIHTTPServer(WSGIHTTPServer):
         result = None
         try:
             result = self.application(env, curriedStartResponse(task))
-            # By iterating manually at this point, we execute task.write()
-            # multiple times, allowing partial data to be sent.
-            for value in result:
-                task.write(value)
+            writeResult(task, result)
         except:  # noqa: E722 do not use bare 'except'
             self.post_mortem(sys.exc_info())
         finally:
@@ -158,13 +191,50 @@ class PMDBWSGIHTTPServer(WSGIHTTPServer):
             zope.security.management.endInteraction()
 
 
+def _asbool(value):
+    if isinstance(value, str):
+        return value.strip().lower() in ('true', 'yes', 'on', 'y', 't', '1')
+    return bool(value)
+
+
 def run_paste(wsgi_app, global_conf, name='zope.server.http',
-              host='127.0.0.1', port=8080, threads=4):
+              host='127.0.0.1', port=8080, threads=4, backend='select',
+              raise_fd_limit=False, workers=1):
+    """Serve *wsgi_app* (``paste.server_runner`` entry point).
+
+    *backend* names the event loop implementation to use; see
+    :mod:`zope.server.reactor`.  The default, ``select``, uses
+    ``asyncore.loop``.  If *raise_fd_limit* is true, the soft limit on
+    open files is raised to the hard limit first.  The connection limit
+    is derived from the resulting limit and the backend.
+
+    If *workers* is greater than one, that many processes with *threads*
+    threads each serve the application; see :mod:`zope.server.prefork`.
+    """
     port = int(port)
     threads = int(threads)
+    workers = int(workers)
+    if backend == 'auto':
+        backend = reactor.best_backend()
+
+    if _asbool(raise_fd_limit):
+        maxsockets.raise_open_files_limit()
+    adj = Adjustments()
+    adj.connection_limit = maxsockets.connection_limit(backend)
+
+    if workers > 1:
+        def factory(task_dispatcher, adj):
+            return WSGIHTTPServer(wsgi_app, name, host, port,
+                                  task_dispatcher=task_dispatcher, adj=adj)
+        PreforkServer(factory, workers, threads, adj=adj,
+                      backend=backend).run()
+        return
 
     task_dispatcher = ThreadedTaskDispatcher()
     task_dispatcher.setThreadCount(threads)
     with closing(WSGIHTTPServer(wsgi_app, name, host, port,
-                                task_dispatcher=task_dispatcher)):
-        asyncore.loop()
+                                task_dispatcher=task_dispatcher, adj=adj)):
+        if backend == 'select':
+            asyncore.loop()
+        else:
+            reactor.loop(backend=backend)
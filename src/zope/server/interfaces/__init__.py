@@ -178,7 +178,12 @@ class IStreamConsumer(Interface):
     """
 
     def received(data):
-        """Accept data, returning the number of bytes consumed."""
+        """Accept data, returning the number of bytes consumed.
+
+        *data* is a bytes-like object, often a memoryview of a buffer
+        that is reused once this returns: the consumer must copy the
+        data it keeps.
+        """
 
     completed = Attribute(
         'completed', 'Set to a true value when finished consuming data.')
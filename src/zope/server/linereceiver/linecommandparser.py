@@ -16,6 +16,7 @@
 from zope.interface import implementer
 
 from zope.server.interfaces import IStreamConsumer
+from zope.server.utilities import find_newline
 
 
 @implementer(IStreamConsumer)
@@ -41,7 +42,7 @@ class LineCommandParser:
         'See IStreamConsumer'
         if self.completed:
             return 0  # Can't consume any more.
-        pos = data.find(b'\n')
+        pos = find_newline(data)
         datalen = len(data)
         if pos < 0:
             self.inbuf = self.inbuf + data
@@ -97,10 +97,14 @@ class LineServerChannel(ServerChannelBase):
         except:  # noqa: E722 do not use bare 'except'
             msg = self.reply_error % code
 
-        self.write(msg.encode('utf-8') + b'\r\n')
-
+        msg = msg.encode('utf-8') + b'\r\n'
         if flush:
+            self.write(msg)
             self.flush(0)
+        else:
+            # Queue the reply so that it goes out together with what
+            # follows; write() would try to send it right away.
+            self._queue_output(msg)
 
         # TODO: Some logging should go on here.
 
@@ -24,3 +24,13 @@ class TestLineCommandparser(unittest.TestCase):
         self.assertEqual(x, len(data))
         self.assertEqual(parser.inbuf, data)
         self.assertEqual(0, parser.received(None))
+
+    def test_reused_memoryview(self):
+        parser = linecommandparser.LineCommandParser(None)
+        buf = bytearray(b'USER f')
+        self.assertEqual(parser.received(memoryview(buf)), 6)
+        buf[:] = b'oo\r\nXX'
+        self.assertEqual(parser.received(memoryview(buf)), 4)
+        buf[:] = b'YYYYYY'
+        self.assertTrue(parser.completed)
+        self.assertEqual((parser.cmd, parser.args), ('USER', 'foo'))
@@ -113,3 +113,15 @@ class TestLineServerChannel(unittest.TestCase):
 
         self.assertEqual(channel.output,
                          [b'500 Unknown Reply Code: no_such_code.\r\n'])
+
+    def test_reply_without_flush_is_queued(self):
+        class Chunnel(Channel):
+            def _queue_output(self, data):
+                self.output.append(('queued', data))
+
+        chunnel = Chunnel()
+        chunnel.reply('LOGIN_REQUIRED', flush=0)
+        self.assertEqual(
+            chunnel.output,
+            [('queued', (Channel.status_messages['LOGIN_REQUIRED']
+                         + '\r\n').encode('ascii'))])
@@ -14,24 +14,103 @@
 """
 Find max number of sockets allowed.
 
-.. caution:: These functions are all hard coded to return a constant value
-   of 100. Attempting to dynamically compute them by looping and creating
-   sockets until failure was very time consuming, at least at one point,
-   and at least on macOS. (Anecdotally this has also been observed on other
-   platforms too.)
+The limits are derived from the process's ``RLIMIT_NOFILE`` resource
+limit and, for ``select()``, from ``FD_SETSIZE``.  (Medusa used to find
+them by creating sockets until failure, which was very time consuming
+on some platforms; this module used to return a constant of 100.)
 
+.. versionchanged:: 5.1
+   Compute the limits instead of returning a hard coded value.
 """
-# Medusa max_sockets module.
+import logging
 
-# several factors here we might want to test:
-# 1) max we can create
-# 2) max we can bind
-# 3) max we can listen on
-# 4) max we can connect
+
+try:
+    import resource
+except ImportError:  # pragma: no cover
+    # Windows
+    resource = None
+
+
+log = logging.getLogger(__name__)
+
+# select() can't watch descriptors greater than or equal to this.
+FD_SETSIZE = 1024
+
+# Used when RLIMIT_NOFILE is unknown or unlimited.
+DEFAULT_MAX_OPEN_FILES = 1024
+UNLIMITED_MAX_OPEN_FILES = 65536
+
+# What raise_open_files_limit() aims for if the hard limit is unlimited.
+# Setting the soft limit to RLIM_INFINITY fails on some platforms, and
+# macOS refuses values above its OPEN_MAX.
+OPEN_MAX = 10240
+
+# Fraction of the usable descriptors handed out to connections by
+# default.  The rest stays available for listening sockets, the
+# trigger, tempfiles of overflowing buffers, log files, and whatever
+# the application opens.
+CONNECTION_LIMIT_FRACTION = 0.75
+
+
+def max_open_files():
+    """Return the soft limit on open files for this process."""
+    if resource is None:  # pragma: no cover
+        return DEFAULT_MAX_OPEN_FILES
+    soft, _hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY or soft < 0:
+        return UNLIMITED_MAX_OPEN_FILES
+    return soft
+
+
+def raise_open_files_limit(wanted=None):
+    """Raise the soft limit on open files towards the hard limit.
+
+    If *wanted* is given, the soft limit is raised to at most that
+    value; if the hard limit is unlimited, it is raised to *wanted* or
+    to :data:`OPEN_MAX`. The soft limit is never lowered.  Returns the
+    new soft limit.
+    """
+    if resource is None:  # pragma: no cover
+        return max_open_files()
+    infinity = resource.RLIM_INFINITY
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == infinity:
+        target = OPEN_MAX if wanted is None else wanted
+    else:
+        target = hard if wanted is None else min(wanted, hard)
+    if soft != infinity and target > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            log.warning('Could not raise the open files limit from %d to'
+                        ' %d: %s', soft, target, e)
+    return max_open_files()
 
 
 def max_select_sockets():
-    return 100
+    """Return the number of sockets usable with ``select()``."""
+    return min(max_open_files(), FD_SETSIZE)
+
+
+def max_poll_sockets():
+    """Return the number of sockets usable with ``poll()``/``epoll()``."""
+    return max_open_files()
+
+
+def max_sockets(backend='select'):
+    """Return the number of sockets usable with the event loop *backend*.
+
+    See :mod:`zope.server.reactor` for the backend names.
+    """
+    if backend == 'select':
+        return max_select_sockets()
+    return max_poll_sockets()
+
+
+def connection_limit(backend='select'):
+    """Return a sensible default for ``Adjustments.connection_limit``."""
+    return max(int(max_sockets(backend) * CONNECTION_LIMIT_FRACTION), 1)
 
 
 max_server_sockets = max_client_sockets = max_select_sockets
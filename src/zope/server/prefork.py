@@ -0,0 +1,233 @@
+##############################################################################
+#
+# Copyright (c) 2024 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Pre-forking server supervisor (POSIX only).
+
+A single zope.server process is limited to one core by the GIL.
+:class:`PreforkServer` forks a number of worker processes, each running
+its own :class:`~zope.server.taskthreads.ThreadedTaskDispatcher` and
+event loop, and restarts workers that die.
+
+Workers share the listening port in one of two ways:
+
+- With ``SO_REUSEPORT`` (the default where available) every worker
+  binds its own listening socket and the kernel balances incoming
+  connections across them.  The port must not be 0.
+
+- Otherwise the supervisor creates the server before forking and the
+  workers inherit its listening socket.
+
+Sending ``SIGTERM`` or ``SIGINT`` to the supervisor stops the workers
+gracefully: they stop accepting, finish the requests they are working
+on (for at most ``shutdown_timeout`` seconds) and exit.
+"""
+import asyncore
+import copy
+import logging
+import os
+import signal
+import socket
+import time
+
+from zope.server import dualmodechannel
+from zope.server.adjustments import default_adj
+from zope.server.reactor import get_reactor
+from zope.server.taskthreads import ThreadedTaskDispatcher
+
+
+log = logging.getLogger(__name__)
+
+
+def describe_exit_status(status):
+    """Describe the status of a terminated process, as returned by
+    :func:`os.waitpid`."""
+    if os.WIFSIGNALED(status):
+        return 'killed by signal %d' % os.WTERMSIG(status)
+    return 'exited with code %d' % os.WEXITSTATUS(status)
+
+
+class PreforkServer:
+    """Run servers in *workers* forked processes.
+
+    *factory* is called as ``factory(task_dispatcher, adj)`` and must
+    return a started server (a :class:`~zope.server.serverbase.ServerBase`
+    instance).  *adj* is a copy of the given adjustments with
+    ``reuse_port`` set appropriately.
+    """
+
+    # Seconds between checks for dead workers in the supervisor.
+    poll_interval = 0.2
+    # Workers dying sooner than this after being started are restarted
+    # only after respawn_delay, to avoid a tight crash loop.
+    min_worker_lifetime = 1.0
+    respawn_delay = 1.0
+    # Event loop timeout in the workers; bounds the reaction time to
+    # a stop request.
+    loop_timeout = 1.0
+
+    def __init__(self, factory, workers=2, threads=4, adj=None,
+                 backend='select', reuse_port=None, shutdown_timeout=10):
+        if adj is None:
+            adj = default_adj
+        if reuse_port is None:
+            reuse_port = hasattr(socket, 'SO_REUSEPORT')
+        self.factory = factory
+        self.workers = workers
+        self.threads = threads
+        self.backend = backend
+        self.shutdown_timeout = shutdown_timeout
+        self.adj = copy.copy(adj)
+        self.adj.reuse_port = reuse_port
+        self.children = {}  # { pid -> start time }
+        self.server = None
+        self.running = False
+        self.stopping = False
+
+    #
+    # Supervisor
+    #
+
+    def run(self):
+        """Start the workers and supervise them until stopped."""
+        if not self.adj.reuse_port:
+            # The workers will inherit this server's listening socket.
+            self.server = self.factory(None, self.adj)
+        self.running = True
+        old_handlers = {
+            signum: signal.signal(signum, self._handle_stop_signal)
+            for signum in (signal.SIGTERM, signal.SIGINT)}
+        try:
+            while self.running:
+                self.spawn_workers()
+                self.reap_workers()
+                time.sleep(self.poll_interval)
+        finally:
+            for signum, handler in old_handlers.items():
+                signal.signal(signum, handler)
+            self.stop_workers()
+            if self.server is not None:
+                self.server.close()
+
+    def _handle_stop_signal(self, signum, frame):
+        self.running = False
+
+    def stop(self):
+        """Ask the supervisor to stop (it stops its workers on exit)."""
+        self.running = False
+
+    def spawn_workers(self):
+        while len(self.children) < self.workers:
+            pid = os.fork()
+            if pid == 0:  # pragma: no cover
+                # Executed in the child, which the parent can't measure.
+                status = 0
+                try:
+                    self.run_worker()
+                except BaseException:
+                    log.exception('Worker %d failed', os.getpid())
+                    status = 1
+                finally:
+                    os._exit(status)
+            self.children[pid] = time.time()
+            log.info('Started worker %d', pid)
+
+    def reap_workers(self):
+        while self.children:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:  # pragma: no cover
+                self.children.clear()
+                return
+            if not pid:
+                return
+            started = self.children.pop(pid, None)
+            if started is None:  # pragma: no cover
+                continue
+            log.warning('Worker %d %s; restarting',
+                        pid, describe_exit_status(status))
+            if time.time() - started < self.min_worker_lifetime:
+                time.sleep(self.respawn_delay)
+
+    def stop_workers(self):
+        children = self.children
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:  # pragma: no cover
+                pass
+        expiration = time.time() + self.shutdown_timeout + 1
+        while children and time.time() < expiration:
+            try:
+                pid, _status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:  # pragma: no cover
+                break
+            if pid:
+                children.pop(pid, None)
+            else:
+                time.sleep(0.05)
+        for pid in children:  # pragma: no cover
+            log.error('Worker %d did not stop; killing it', pid)
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        children.clear()
+
+    #
+    # Worker
+    #
+
+    def _handle_worker_stop_signal(self, signum, frame):  # pragma: no cover
+        self.stopping = True
+
+    def run_worker(self):  # pragma: no cover
+        """Serve requests in a forked worker until told to stop."""
+        # Executed in the child, which the parent can't measure.
+        self.children = {}
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, self._handle_worker_stop_signal)
+        # Only serve our own server; forget whatever else the supervisor
+        # had in its socket map.
+        the_trigger = dualmodechannel.the_trigger
+        socket_map = asyncore.socket_map
+        for fd, obj in list(socket_map.items()):
+            if obj is not self.server and obj is not the_trigger:
+                del socket_map[fd]
+        # Don't share wakeups with the supervisor and the other workers.
+        the_trigger.reopen()
+
+        task_dispatcher = ThreadedTaskDispatcher()
+        task_dispatcher.setThreadCount(self.threads)
+        if self.server is None:
+            server = self.factory(task_dispatcher, self.adj)
+        else:
+            server = self.server
+            server.task_dispatcher = task_dispatcher
+        reactor = get_reactor(self.backend)
+        try:
+            while not self.stopping:
+                reactor.poll(self.loop_timeout)
+            server.close()
+            expiration = time.time() + self.shutdown_timeout
+            while self._busy() and time.time() < expiration:
+                reactor.poll(0.1)
+        finally:
+            reactor.close()
+            task_dispatcher.shutdown()
+
+    def _busy(self):  # pragma: no cover
+        for obj in list(asyncore.socket_map.values()):
+            if getattr(obj, 'running_tasks', False) or obj.writable():
+                return True
+        return False
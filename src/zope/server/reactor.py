@@ -0,0 +1,293 @@
+##############################################################################
+#
+# Copyright (c) 2024 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Pluggable event loop backends.
+
+``asyncore.loop`` builds a fresh fd set (or poll object) on every
+iteration, which costs O(n) system call work in the number of open
+channels.  The reactors in this module keep a persistent ``poll`` or
+``epoll`` registration instead and only tell the kernel about channels
+whose interest (as reported by ``readable()`` and ``writable()``) has
+changed since the last iteration.
+
+The dispatcher contract is unchanged: every object in the socket map
+is still asked whether it is readable or writable, and events are
+delivered through ``asyncore.readwrite``, exactly as ``asyncore.poll2``
+does it.
+
+The ``select`` backend simply delegates to ``asyncore`` and remains the
+default.
+
+All reactors wake up for the deadlines of the registered timers (see
+:func:`add_timer`), such as the idle timeouts of server channels.
+"""
+import asyncore
+import errno
+import math
+import select
+import time
+
+
+# Objects with next_deadline() and expire(now) methods; see add_timer().
+timers = set()
+
+
+def add_timer(timer):
+    """Have the reactors serve the deadlines of *timer*.
+
+    ``timer.next_deadline()`` returns the earliest ``time.time()`` at
+    which the timer has something to do, or None.  The reactors don't
+    wait for events past it, and call ``timer.expire(now)`` after each
+    poll.
+    """
+    timers.add(timer)
+
+
+def remove_timer(timer):
+    """Forget a timer registered with :func:`add_timer`."""
+    timers.discard(timer)
+
+
+def _cap_timeout(timeout):
+    # Return *timeout* (seconds, or None to wait forever), capped at the
+    # time left until the earliest timer deadline.
+    deadline = None
+    for timer in timers:
+        d = timer.next_deadline()
+        if d is not None and (deadline is None or d < deadline):
+            deadline = d
+    if deadline is None:
+        return timeout
+    left = max(deadline - time.time(), 0.0)
+    if timeout is None or left < timeout:
+        return left
+    return timeout
+
+
+def _run_timers():
+    if timers:
+        now = time.time()
+        for timer in list(timers):
+            timer.expire(now)
+
+
+class SelectReactor:
+    """Reactor delegating to ``asyncore.poll`` (select based)."""
+
+    name = 'select'
+
+    def __init__(self, map=None):
+        self.map = map
+
+    def poll(self, timeout=0.0):
+        asyncore.poll(_cap_timeout(timeout), self.map)
+        _run_timers()
+
+    def close(self):
+        pass
+
+
+class _PollerReactor:
+    """Base for reactors based on a persistent poller object.
+
+    Subclasses provide ``_make_poller`` and ``_poll``.
+    """
+
+    name = None
+
+    # The event masks for reading and writing, from the select module;
+    # not all platforms have them.
+    READ_FLAGS = None
+    WRITE_FLAGS = None
+
+    def __init__(self, map=None):
+        self.map = map
+        self._poller = self._make_poller()
+        # fd -> (dispatcher, flags) as currently registered.
+        self._registered = {}
+
+    def _make_poller(self):
+        raise NotImplementedError()
+
+    def _poll(self, timeout):
+        raise NotImplementedError()
+
+    def _register(self, fd, flags):
+        poller = self._poller
+        try:
+            poller.modify(fd, flags)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # The kernel forgot about the descriptor (it was closed
+            # and reused) or it was never registered.
+            poller.register(fd, flags)
+
+    def _unregister(self, fd):
+        try:
+            self._poller.unregister(fd)
+        except (OSError, KeyError, ValueError):
+            # Already closed, and therefore already gone from epoll.
+            pass
+
+    def update(self):
+        """Bring the poller's registrations in line with the socket map."""
+        map = self.map if self.map is not None else asyncore.socket_map
+        registered = self._registered
+        read_flags = self.READ_FLAGS
+        write_flags = self.WRITE_FLAGS
+        seen = set()
+        for fd, obj in list(map.items()):
+            flags = 0
+            if obj.readable():
+                flags |= read_flags
+            # accepting sockets should not be writable
+            if obj.writable() and not obj.accepting:
+                flags |= write_flags
+            current = registered.get(fd)
+            if not flags:
+                if current is not None:
+                    del registered[fd]
+                    self._unregister(fd)
+                continue
+            seen.add(fd)
+            if current is None:
+                self._register(fd, flags)
+            elif current[0] is not obj:
+                # The descriptor number was reused by a new dispatcher.
+                self._unregister(fd)
+                self._register(fd, flags)
+            elif current[1] == flags:
+                continue
+            else:
+                self._register(fd, flags)
+            registered[fd] = (obj, flags)
+        if len(seen) != len(registered):
+            for fd in [fd for fd in registered if fd not in seen]:
+                del registered[fd]
+                self._unregister(fd)
+
+    def poll(self, timeout=0.0):
+        map = self.map if self.map is not None else asyncore.socket_map
+        self.update()
+        try:
+            events = self._poll(_cap_timeout(timeout))
+        except InterruptedError:
+            events = ()
+        for fd, flags in events:
+            obj = map.get(fd)
+            if obj is None:
+                continue
+            asyncore.readwrite(obj, flags)
+        _run_timers()
+
+    def close(self):
+        self._registered.clear()
+        close = getattr(self._poller, 'close', None)
+        if close is not None:
+            close()
+
+
+backends = {'select': SelectReactor}
+
+
+if hasattr(select, 'poll'):
+
+    class PollReactor(_PollerReactor):
+        """Reactor using a persistent ``select.poll`` object."""
+
+        name = 'poll'
+
+        READ_FLAGS = select.POLLIN | select.POLLPRI
+        WRITE_FLAGS = select.POLLOUT
+
+        def _make_poller(self):
+            return select.poll()
+
+        def _poll(self, timeout):
+            if timeout is not None:
+                # Round up, not to wake up before a timer deadline.
+                timeout = int(math.ceil(timeout * 1000))
+            return self._poller.poll(timeout)
+
+    backends['poll'] = PollReactor
+
+
+if hasattr(select, 'epoll'):
+
+    class EpollReactor(_PollerReactor):
+        """Reactor using Linux ``epoll`` in level-triggered mode."""
+
+        name = 'epoll'
+
+        READ_FLAGS = select.EPOLLIN | select.EPOLLPRI
+        WRITE_FLAGS = select.EPOLLOUT
+
+        def _make_poller(self):
+            return select.epoll()
+
+        def _unregister(self, fd):
+            # Unlike poll, epoll forgets descriptors on its own once they
+            # are closed, so ENOENT and EBADF are expected here.
+            try:
+                self._poller.unregister(fd)
+            except (OSError, ValueError):
+                pass
+
+        def _poll(self, timeout):
+            if timeout is None:
+                timeout = -1
+            return self._poller.poll(timeout)
+
+    backends['epoll'] = EpollReactor
+
+
+def best_backend():
+    """Return the name of the most scalable backend available."""
+    for name in ('epoll', 'poll'):
+        if name in backends:
+            return name
+    return 'select'
+
+
+def get_reactor(backend='select', map=None):
+    """Create a reactor for the named backend.
+
+    *backend* is one of the keys of :data:`backends`, or ``'auto'`` to
+    pick the best available one.
+    """
+    if backend == 'auto':
+        backend = best_backend()
+    try:
+        factory = backends[backend]
+    except KeyError:
+        raise ValueError('Unknown or unsupported event loop backend: %r'
+                         % (backend,))
+    return factory(map)
+
+
+def loop(timeout=30.0, map=None, count=None, backend='select'):
+    """Like ``asyncore.loop``, but using the given backend."""
+    if map is None:
+        map = asyncore.socket_map
+    reactor = get_reactor(backend, map)
+    try:
+        if count is None:
+            while map:
+                reactor.poll(timeout)
+        else:
+            while map and count > 0:
+                reactor.poll(timeout)
+                count = count - 1
+    finally:
+        reactor.close()
@@ -34,6 +34,17 @@ class ServerBase(asyncore.dispatcher):
     channel_class = None    # Override with a channel class.
     SERVER_IDENT = 'zope.server.serverbase'  # Override.
 
+    # Statistics: the number of connections accepted, and the number of
+    # handle_accept() calls it took.  Their ratio tells how many pending
+    # connections are drained per event loop iteration.
+    accepted_connections = 0
+    accept_events = 0
+
+    _connection_options = None  # Cached get_connection_options()
+
+    # True while the task dispatcher is saturated; see check_overload().
+    overloaded = False
+
     def __init__(self, ip, port, task_dispatcher=None, adj=None, start=1,
                  hit_log=None, verbose=0):
         if adj is None:
@@ -48,6 +59,8 @@ class ServerBase(asyncore.dispatcher):
         self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             self.set_reuse_addr()
+            if adj.reuse_port:
+                self.set_reuse_port()
             self.bind((ip, port))
             self.server_name = self.computeServerName(ip)
 
@@ -69,6 +82,10 @@ class ServerBase(asyncore.dispatcher):
 
     log = log_info
 
+    def set_reuse_port(self):
+        """Allow other processes to listen on the same port."""
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+
     def computeServerName(self, ip=''):
         """Given an IP, try to determine the server name."""
         if ip:
@@ -92,8 +109,44 @@ class ServerBase(asyncore.dispatcher):
                     self.log_info('Cannot do reverse lookup', 'info')
         return server_name
 
+    def _socket_option(self, name, value, level=socket.IPPROTO_TCP):
+        # Returns the option tuple for socket.setsockopt(), or None.
+        if not value:
+            return None
+        optname = getattr(socket, name, None)
+        if optname is None:
+            self.log_info('warning: %s is not supported on this platform'
+                          % name, 'warning')
+            return None
+        return (level, optname, value)
+
+    def get_listener_options(self):
+        """Return the socket options to set on the listening socket."""
+        adj = self.adj
+        options = [
+            self._socket_option('SO_RCVBUF', adj.recv_buffer_size,
+                                socket.SOL_SOCKET),
+            self._socket_option('SO_SNDBUF', adj.send_buffer_size,
+                                socket.SOL_SOCKET),
+            self._socket_option('TCP_DEFER_ACCEPT', adj.tcp_defer_accept),
+            self._socket_option('TCP_FASTOPEN', adj.tcp_fastopen),
+        ]
+        return [option for option in options if option is not None]
+
+    def get_connection_options(self):
+        """Return the socket options to set on accepted connections."""
+        options = list(self.adj.socket_options)
+        lowat = self._socket_option('TCP_NOTSENT_LOWAT',
+                                    self.adj.tcp_notsent_lowat)
+        if lowat is not None:
+            options.append(lowat)
+        return options
+
     def accept_connections(self):
         self.accepting = 1
+        # Buffer sizes and TCP_FASTOPEN must be set before listen().
+        for (level, optname, value) in self.get_listener_options():
+            self.socket.setsockopt(level, optname, value)
         self.socket.listen(self.adj.backlog)  # Circumvent asyncore's NT limit
         if self.verbose:
             self.log_info('%s started.\n'
@@ -103,6 +156,7 @@ class ServerBase(asyncore.dispatcher):
                               self.port,
                               self.getExtraLogMessage()
                           ))
+            self.log_info('Connection limit: %d' % self.adj.connection_limit)
 
     def getExtraLogMessage(self):
         r"""Additional information to be logged on startup.
@@ -120,9 +174,31 @@ class ServerBase(asyncore.dispatcher):
         else:
             task.service()
 
+    def check_overload(self):
+        """Update and return the overloaded flag.
+
+        The flag is set when the number of pending tasks reaches
+        adj.task_queue_high_watermark and cleared when it drops to
+        adj.task_queue_low_watermark.  Channels stop reading while it
+        is set.
+        """
+        high = self.adj.task_queue_high_watermark
+        td = self.task_dispatcher
+        if not high or td is None:
+            return False
+        pending = td.getPendingTasksEstimate()
+        if self.overloaded:
+            if pending <= self.adj.task_queue_low_watermark:
+                self.overloaded = False
+        elif pending >= high:
+            self.overloaded = True
+        return self.overloaded
+
     def readable(self):
         """See zope.server.interfaces.IDispatcher"""
-        return (self.accepting and
+        # Called once per event loop iteration, before the channels.
+        overloaded = self.check_overload()
+        return (self.accepting and not overloaded and
                 len(asyncore.socket_map) < self.adj.connection_limit)
 
     def writable(self):
@@ -135,22 +211,52 @@ class ServerBase(asyncore.dispatcher):
     def handle_connect(self):
         """See zope.server.interfaces.IDispatcherEventHandler"""
 
+    def accept(self):
+        """See asyncore.dispatcher
+
+        Returns None if no connection is pending.  Unlike asyncore, lets
+        ConnectionAbortedError (a connection reset before it was
+        accepted) through, so that handle_accept() can go on with the
+        next one.
+        """
+        try:
+            return self.socket.accept()
+        except BlockingIOError:
+            return None
+
     def handle_accept(self):
         """See zope.server.interfaces.IDispatcherEventHandler"""
-        try:
-            v = self.accept()
-            if v is None:
-                return
-            conn, addr = v
-        except OSError:
-            # Linux: On rare occasions we get a bogus socket back from
-            # accept.  socketmodule.c:makesockaddr complains that the
-            # address family is unknown.  We don't want the whole server
-            # to shut down because of this.
-            if self.adj.log_socket_errors:
-                self.log_info('warning: server accept() threw an exception',
-                              'warning')
-            return
-        for (level, optname, value) in self.adj.socket_options:
-            conn.setsockopt(level, optname, value)
-        self.channel_class(self, conn, addr, self.adj)
+        adj = self.adj
+        socket_options = self._connection_options
+        if socket_options is None:
+            socket_options = self.get_connection_options()
+            self._connection_options = socket_options
+        accepted = 0
+        self.accept_events += 1
+        for i in range(max(adj.accept_batch, 1)):
+            if i and not self.readable():
+                # Connection limit reached.
+                break
+            try:
+                v = self.accept()
+                if v is None:
+                    # No more pending connections.
+                    break
+                conn, addr = v
+            except ConnectionAbortedError:
+                # Reset by the client while waiting; try the next one.
+                continue
+            except OSError:
+                # Linux: On rare occasions we get a bogus socket back from
+                # accept.  socketmodule.c:makesockaddr complains that the
+                # address family is unknown.  We don't want the whole server
+                # to shut down because of this.
+                if adj.log_socket_errors:
+                    self.log_info('warning: server accept() threw an '
+                                  'exception', 'warning')
+                break
+            for (level, optname, value) in socket_options:
+                conn.setsockopt(level, optname, value)
+            self.channel_class(self, conn, addr, adj)
+            accepted += 1
+        self.accepted_connections += accepted
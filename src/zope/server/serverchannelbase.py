@@ -17,17 +17,23 @@ This module provides a base implementation for the server channel. It can only
 be used as a mix-in to actual server channel implementations.
 """
 import asyncore
+import errno
+import logging
 import sys
 import time
 from threading import Lock
 
 from zope.interface import implementer
 
+from zope.server import reactor
 from zope.server.dualmodechannel import DualModeChannel
 from zope.server.interfaces import IServerChannel
 from zope.server.interfaces import ITask
+from zope.server.timeouts import TimeoutQueue
 
 
+log = logging.getLogger(__name__)
+
 # task_lock is useful for synchronizing access to task-related attributes.
 task_lock = Lock()
 
@@ -41,9 +47,10 @@ class ServerChannelBase(DualModeChannel):
     task_class = None         # ... and a task class.
 
     active_channels = {}        # Class-specific channel tracker
+    idle_timeouts = TimeoutQueue()  # Class-specific idle channel deadlines
     next_channel_cleanup = [0]  # Class-specific cleanup time
     proto_request = None      # A request parser instance
-    last_activity = 0         # Time of last activity
+    _last_activity = 0        # Time of last activity
     tasks = None  # List of channel-related tasks to execute
     running_tasks = False  # True when another thread is running tasks
 
@@ -58,13 +65,37 @@ class ServerChannelBase(DualModeChannel):
         self.last_activity = t = self.creation_time
         self.check_maintenance(t)
 
+    @property
+    def last_activity(self):
+        """Time of last activity."""
+        return self._last_activity
+
+    @last_activity.setter
+    def last_activity(self, t):
+        self._last_activity = t
+        # Deadlines are moved forward lazily, when kill_zombies() finds
+        # them expired.  Moving one backward has to happen right away.
+        timeouts = self.__class__.idle_timeouts
+        deadline = timeouts.deadline(self)
+        if deadline is not None:
+            new_deadline = t + self.adj.channel_timeout
+            if new_deadline < deadline:
+                timeouts.schedule(self, new_deadline)
+
     def add_channel(self, map=None):
         """See async.dispatcher
 
         This hook keeps track of opened channels.
         """
         DualModeChannel.add_channel(self, map)
-        self.__class__.active_channels[self._fileno] = self
+        cls = self.__class__
+        cls.active_channels[self._fileno] = self
+        cls.idle_timeouts.schedule(
+            self,
+            (self.last_activity or self.creation_time)
+            + self.adj.channel_timeout)
+        # Have the event loop close the channels once they are idle.
+        reactor.add_timer(cls)
 
     def del_channel(self, map=None):
         """See async.dispatcher
@@ -76,6 +107,7 @@ class ServerChannelBase(DualModeChannel):
         fd = self._fileno
         if fd in ac:
             del ac[fd]
+        self.__class__.idle_timeouts.cancel(self)
 
     def check_maintenance(self, now):
         """See async.dispatcher
@@ -101,16 +133,43 @@ class ServerChannelBase(DualModeChannel):
         Closes connections that have not had any activity in a while.
 
         The timeout is configured through adj.channel_timeout (seconds).
+        Only channels whose deadline has passed are looked at; the ones
+        that turn out to have been active since are rescheduled.
+        """
+        self.expire(time.time(), self)
+
+    @classmethod
+    def next_deadline(cls):
+        """See zope.server.reactor.add_timer"""
+        return cls.idle_timeouts.next_deadline()
+
+    @classmethod
+    def expire(cls, now, current=None):
+        """See zope.server.reactor.add_timer
+
+        Closes the channels whose idle deadline has passed, except
+        *current* and the ones serving requests.
         """
-        now = time.time()
-        cutoff = now - self.adj.channel_timeout
-        # channel.close calls channel.del_channel, which can change
-        # the size of the map.
-        for channel in list(self.active_channels.values()):
-            if (channel is not self and not channel.running_tasks and
-                    channel.last_activity < cutoff):
+        timeouts = cls.idle_timeouts
+        for channel in timeouts.pop_expired(now):
+            deadline = channel.last_activity + channel.adj.channel_timeout
+            if deadline >= now:
+                timeouts.schedule(channel, deadline)
+            elif channel is current or channel.running_tasks:
+                timeouts.schedule(channel,
+                                  now + channel.adj.cleanup_interval)
+            else:
                 channel.close()
 
+    def readable(self):
+        """See async.dispatcher
+
+        Doesn't read while the server is overloaded.
+        """
+        if not DualModeChannel.readable(self):
+            return False
+        return not getattr(self.server, 'overloaded', False)
+
     def received(self, data):
         """See async.dispatcher
 
@@ -121,7 +180,16 @@ class ServerChannelBase(DualModeChannel):
         while data:
             if preq is None:
                 preq = self.parser_class(self.adj)
-            n = preq.received(data)
+            try:
+                n = preq.received(data)
+            except OSError as e:
+                if e.errno != errno.ENOSPC:
+                    raise
+                # The request doesn't fit in the spool quota.
+                log.warning('Dropping request from %s: %s', self.addr, e)
+                self.proto_request = None
+                self.handle_spool_full(preq)
+                return
             if preq.completed:
                 # The request is ready to use.
                 self.proto_request = None
@@ -130,6 +198,7 @@ class ServerChannelBase(DualModeChannel):
                 preq = None
             else:
                 self.proto_request = preq
+                self.handle_partial_request(preq)
             if n >= len(data):
                 break
             data = data[n:]
@@ -143,6 +212,27 @@ class ServerChannelBase(DualModeChannel):
         task = self.task_class(self, req)
         self.queue_task(task)
 
+    def handle_partial_request(self, req):
+        """Called when a request has consumed all the data received so far.
+
+        Subclasses may override this method to handle requests before
+        they are complete.
+        """
+
+    def handle_spool_full(self, req):
+        """Called when the input of a request exceeds the spool quota.
+
+        The rest of the input is dropped.  Subclasses may override this
+        method to answer the request; this one just closes the channel
+        once the requests being served are done.
+        """
+        if self.async_mode:
+            self.close_when_done()
+        else:
+            # Received for a request being served; close once it is
+            # done.
+            self.will_close = True
+
     def handle_error(self):
         """See async.dispatcher
 
@@ -239,4 +329,5 @@ else:
             except BaseException:  # pragma: no cover
                 pass
         ServerChannelBase.active_channels.clear()
+        ServerChannelBase.idle_timeouts.clear()
     addCleanUp(_clean_active_channels)
@@ -6,6 +6,7 @@ import traceback
 from threading import Event
 from threading import Thread
 
+from zope.server.reactor import get_reactor
 from zope.server.taskthreads import ThreadedTaskDispatcher
 
 
@@ -13,6 +14,7 @@ class LoopTestMixin:
 
     thread_name = 'LoopTest'
     task_dispatcher_count = 4
+    event_loop_backend = 'select'
 
     LOCALHOST = '127.0.0.1'
     SERVER_PORT = 0      # Set these port numbers to 0 to auto-bind, or
@@ -77,12 +79,13 @@ class LoopTestMixin:
         self.thread_started.set()
         import select
         from errno import EBADF
+        reactor = get_reactor(self.event_loop_backend)
         while self.run_loop:
             self.counter = self.counter + 1
             # Note that it isn't acceptable to fail out of
             # this loop. That will likely make the tests hang.
             try:
-                asyncore.poll(0.1)
+                reactor.poll(0.1)
             except OSError as data:  # pragma: no cover
                 print("EXCEPTION POLLING IN LOOP(): %s" % data)
                 if data.args[0] == EBADF:
@@ -103,3 +106,4 @@ class LoopTestMixin:
             except:  # noqa: E722 do not use bare 'except' pragma: no cover
                 print("WEIRD EXCEPTION IN LOOP")
                 traceback.print_exception(*(sys.exc_info() + (100,)))
+        reactor.close()
@@ -3,6 +3,13 @@ Tests for buffers.py
 
 """
 
+import errno
+import gc
+import os
+import shutil
+import tempfile
+import threading
+import time
 import unittest
 
 from zope.server import buffers
@@ -59,3 +66,529 @@ class TestTempfileBasedBuffer(TestStringBuffer):
 
     def _getFUT(self):
         return buffers.TempfileBasedBuffer
+
+
+class TestSegmentedBuffer(unittest.TestCase):
+
+    def _makeOne(self, overflow=100):
+        buf = buffers.SegmentedBuffer(overflow)
+        self.addCleanup(buf.close)
+        return buf
+
+    def test_empty(self):
+        buf = self._makeOne()
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(buf.peek(10), b'')
+        self.assertEqual(buf.get(), b'')
+        with self.assertRaises(ValueError):
+            buf.skip(1)
+
+    def test_large_appends_are_not_copied(self):
+        buf = self._makeOne(overflow=1 << 20)
+        data = b'x' * buffers.STRBUF_LIMIT
+        buf.append(data)
+        buf.append(data)
+        self.assertEqual(len(buf.segments), 2)
+        self.assertIs(buf.segments[0], data)
+        view = buf.peek()
+        self.assertIsInstance(view, memoryview)
+        self.assertIs(view.obj, data)
+        self.assertEqual(len(view), len(data))
+
+    def test_small_appends_are_joined(self):
+        buf = self._makeOne()
+        buf.append(b'abc')
+        buf.append(bytearray(b'def'))
+        buf.append(memoryview(b'ghi'))
+        self.assertEqual(len(buf), 9)
+        self.assertEqual(list(buf.segments), [b'abcdefghi'])
+        self.assertEqual(buf.get(), b'abcdefghi')
+        # get() doesn't consume by default.
+        self.assertEqual(len(buf), 9)
+
+    def test_mutable_data_is_copied(self):
+        buf = self._makeOne()
+        data = bytearray(b'data')
+        buf.append(data)
+        data[:] = b'xxxx'
+        self.assertEqual(buf.get(), b'data')
+
+    def test_peek_and_skip_advance_offset(self):
+        buf = self._makeOne(overflow=1 << 20)
+        first = b'a' * 10000
+        second = b'b' * 10000
+        buf.append(first)
+        buf.append(second)
+        self.assertEqual(bytes(buf.peek(4)), b'aaaa')
+        buf.skip(9998)
+        self.assertEqual(buf.offset, 9998)
+        self.assertEqual(bytes(buf.peek(4)), b'aa')
+        self.assertEqual(buf.get(4), b'aabb')
+        buf.skip(3)
+        self.assertEqual(len(buf.segments), 1)
+        self.assertEqual(buf.offset, 1)
+        self.assertEqual(buf.get(skip=True), second[1:])
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(len(buf.segments), 0)
+        self.assertEqual(buf.in_memory, 0)
+
+    def test_peek_segments(self):
+        buf = self._makeOne(overflow=30000)
+        buf.append(b'a' * 10000)
+        buf.append(b'b' * 10000)
+        buf.append(b'c' * 10000)
+        buf.skip(5000)
+        segments = buf.peek_segments(20000)
+        self.assertEqual([len(s) for s in segments], [5000, 10000, 5000])
+        self.assertTrue(all(isinstance(s, memoryview) for s in segments))
+        self.assertEqual(b''.join(segments),
+                         b'a' * 5000 + b'b' * 10000 + b'c' * 5000)
+        self.assertEqual(len(buf.peek_segments(20000, maxsegments=2)), 2)
+
+    def test_peek_segments_stops_at_spool(self):
+        buf = self._makeOne(overflow=10)
+        self.assertEqual(buf.peek_segments(100), [b''])
+        buf.append(b'0123456789')
+        buf.append(b'abc')
+        self.assertEqual(buf.peek_segments(100), [memoryview(b'0123456789')])
+        buf.skip(10)
+        self.assertEqual(buf.peek_segments(100), [b'abc'])
+
+    def test_skip_too_much(self):
+        buf = self._makeOne()
+        buf.append(b'data')
+        with self.assertRaises(ValueError):
+            buf.skip(5)
+
+    def test_spills_past_overflow(self):
+        buf = self._makeOne(overflow=10)
+        buf.append(b'0123456789')
+        self.assertIsNone(buf.spool)
+        buf.append(b'abc')
+        spool = buf.spool
+        self.assertIsInstance(spool, buffers.TempfileBasedBuffer)
+        # Everything after spilling goes to the spool, in order.
+        buf.append(b'def')
+        self.assertEqual(len(buf.segments), 2)
+        self.assertEqual(len(buf), 16)
+        self.assertEqual(buf.get(12), b'0123456789ab')
+
+        buf.skip(10)
+        self.assertEqual(buf.peek(2), b'ab')
+        buf.skip(6)
+        # A consumed spool is closed and dropped.
+        self.assertIsNone(buf.spool)
+        self.assertTrue(spool.file.closed)
+        buf.append(b'xyz')
+        self.assertEqual(buf.get(), b'xyz')
+
+    def _makeFd(self, data):
+        f = tempfile.TemporaryFile()
+        self.addCleanup(f.close)
+        f.write(data)
+        f.flush()
+        return os.dup(f.fileno())
+
+    @unittest.skipUnless(hasattr(os, 'pread'), 'requires os.pread()')
+    def test_append_file(self):
+        buf = self._makeOne(overflow=3)
+        buf.append(b'ab')
+        buf.append_file(self._makeFd(b'0123456789'), 2, 5)
+        buf.append(b'cd')
+        self.assertEqual(len(buf), 9)
+        self.assertIsNone(buf.peek_file())
+        self.assertEqual(buf.peek_segments(100), [memoryview(b'ab')])
+        self.assertEqual(buf.get(), b'ab23456cd')
+
+        buf.skip(3)
+        segment = buf.peek_file()
+        self.assertIsInstance(segment, buffers.FileSegment)
+        self.assertEqual((segment.offset, len(segment)), (3, 4))
+        self.assertEqual(buf.peek(2), b'34')
+        self.assertEqual(buf.peek_segments(2), [b'34'])
+        fd = segment.fd
+        buf.skip(5)
+        # The consumed file segment closed its descriptor.
+        self.assertIsNone(segment.fd)
+        with self.assertRaises(OSError):
+            os.fstat(fd)
+        self.assertEqual(buf.get(skip=True), b'd')
+
+    @unittest.skipUnless(hasattr(os, 'pread'), 'requires os.pread()')
+    def test_append_file_errors(self):
+        buf = self._makeOne()
+        fd = self._makeFd(b'data')
+        buf.append_file(fd, 0, 0)
+        self.assertEqual(len(buf), 0)
+        with self.assertRaises(OSError):
+            os.fstat(fd)
+
+        buf.append_file(self._makeFd(b'data'), 4, 5)
+        with self.assertRaises(OSError):
+            buf.get()
+        segment = buf.peek_file()
+        buf.close()
+        self.assertIsNone(segment.fd)
+
+    def test_close(self):
+        buf = self._makeOne(overflow=1)
+        buf.append(b'data')
+        spool = buf.spool
+        buf.prune()
+        buf.close()
+        self.assertEqual(len(buf), 0)
+        self.assertTrue(spool.file.closed)
+
+
+class TestBufferPool(unittest.TestCase):
+
+    def _makeOne(self, size=2, overflow=100):
+        return buffers.BufferPool(size, overflow)
+
+    def test_acquire_release(self):
+        pool = self._makeOne()
+        buf = pool.acquire()
+        self.assertIsInstance(buf, buffers.OverflowableBuffer)
+        self.assertEqual((pool.hits, pool.misses, len(pool)), (0, 1, 0))
+        buf.append(b'data')
+        pool.release(buf)
+        self.assertEqual(len(pool), 1)
+
+        buf2 = pool.acquire()
+        self.assertIs(buf2, buf)
+        self.assertEqual((pool.hits, pool.misses, len(pool)), (1, 1, 0))
+        # It was emptied.
+        self.assertEqual(len(buf), 0)
+        self.assertEqual(buf.get(), b'')
+        buf.append(b'new')
+        self.assertEqual(buf.getfile().read(), b'new')
+
+    def test_bounded(self):
+        pool = self._makeOne(size=1)
+        bufs = [pool.acquire(), pool.acquire()]
+        for buf in bufs:
+            pool.release(buf)
+        self.assertEqual(len(pool), 1)
+        self.assertEqual(pool.discarded, 1)
+        self.assertTrue(bufs[1].file.closed)
+
+    def test_rolled_buffers_are_discarded(self):
+        pool = self._makeOne(overflow=10)
+        buf = pool.acquire()
+        buf.append(b'x' * (buffers.STRBUF_LIMIT + 100))
+        self.assertTrue(buf.file._rolled)
+        pool.release(buf)
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.discarded, 1)
+        self.assertTrue(buf.file.closed)
+
+    def test_exported_buffers_are_discarded(self):
+        pool = self._makeOne()
+        buf = pool.acquire()
+        buf.append(b'data')
+        view = buf.getfile().getbuffer()
+        pool.release(buf)
+        self.assertEqual(len(pool), 0)
+        self.assertEqual(pool.discarded, 1)
+        view.release()
+
+    def test_get_buffer_pool(self):
+        pool = buffers.get_buffer_pool(7, 1000)
+        self.assertIs(buffers.get_buffer_pool(7, 1000), pool)
+        self.assertIsNot(buffers.get_buffer_pool(7, 1001), pool)
+        self.assertEqual((pool.size, pool.overflow), (7, 1000))
+
+
+class TestPipeBuffer(unittest.TestCase):
+
+    def _makeOne(self, high_water=10, timeout=5):
+        return buffers.PipeBuffer(high_water, timeout)
+
+    def _later(self, func, *args):
+        # Call func(*args) in another thread, a little later.
+        def run():
+            time.sleep(0.05)
+            func(*args)
+        thread = threading.Thread(target=run)
+        thread.start()
+        self.addCleanup(thread.join)
+
+    def test_read(self):
+        pipe = self._makeOne()
+        self.assertIs(pipe.getfile(), pipe)
+        pipe.append(b'abc')
+        pipe.append(memoryview(b'def'))
+        self.assertEqual(len(pipe), 6)
+        self.assertEqual(pipe.read(2), b'ab')
+        self.assertEqual(pipe.read(0), b'')
+        pipe.finish()
+        self.assertEqual(pipe.read(10), b'cdef')
+        self.assertEqual(pipe.read(), b'')
+
+    def test_read_waits_for_data(self):
+        pipe = self._makeOne()
+        pipe.append(b'ab')
+        self._later(pipe.append, b'cd')
+        self.assertEqual(pipe.read(3), b'abc')
+        self._later(pipe.finish)
+        self.assertEqual(pipe.read(), b'd')
+
+    def test_readline(self):
+        pipe = self._makeOne()
+        pipe.append(b'one\ntw')
+        self.assertEqual(pipe.readline(), b'one\n')
+        self._later(pipe.append, b'o\nthree')
+        self.assertEqual(pipe.readline(), b'two\n')
+        self.assertEqual(pipe.readline(2), b'th')
+        pipe.finish()
+        self.assertEqual(list(pipe), [b'ree'])
+        self.assertEqual(pipe.readline(), b'')
+
+    def test_readlines(self):
+        pipe = self._makeOne()
+        pipe.append(b'a\nb\nc\n')
+        pipe.finish()
+        self.assertEqual(pipe.readlines(2), [b'a\n', b'b\n'])
+        self.assertEqual(pipe.readlines(), [b'c\n'])
+
+    def test_timeout(self):
+        pipe = self._makeOne(timeout=0.05)
+        pipe.append(b'a')
+        with self.assertRaises(TimeoutError):
+            pipe.read(2)
+        # The data is still there.
+        self.assertEqual(pipe.read(1), b'a')
+
+    def test_abort(self):
+        pipe = self._makeOne()
+        pipe.append(b'ab')
+        self._later(pipe.abort, ConnectionResetError())
+        self.assertEqual(pipe.read(1), b'a')
+        with self.assertRaises(ConnectionResetError):
+            pipe.read()
+
+    def test_flow_control(self):
+        pipe = self._makeOne(high_water=4)
+        drained = []
+        pipe.on_drain = lambda: drained.append(len(pipe))
+        pipe.append(b'abc')
+        self.assertFalse(pipe.full())
+        pipe.append(b'def')
+        self.assertTrue(pipe.full())
+        self.assertEqual(pipe.read(1), b'a')
+        self.assertEqual(drained, [])
+        self.assertEqual(pipe.read(2), b'bc')
+        self.assertEqual(drained, [3])
+        self.assertFalse(pipe.full())
+
+    def test_waiting_reader_is_not_blocked(self):
+        # A reader asking for more than high_water bytes gets them.
+        pipe = self._makeOne(high_water=4)
+        drained = []
+
+        def on_drain():
+            drained.append(pipe.full())
+            if len(pipe) < 8:
+                pipe.append(b'5678')
+        pipe.on_drain = on_drain
+        pipe.append(b'1234')
+        self.assertEqual(pipe.read(8), b'12345678')
+        self.assertTrue(drained)
+        self.assertFalse(any(drained))
+
+    def test_on_first_read(self):
+        pipe = self._makeOne()
+        calls = []
+        pipe.on_first_read = lambda: calls.append(len(calls))
+        pipe.append(b'a\nb')
+        self.assertEqual(pipe.readline(), b'a\n')
+        self.assertEqual(pipe.read(1), b'b')
+        self.assertEqual(calls, [0])
+
+    def test_close(self):
+        pipe = self._makeOne(high_water=4)
+        drained = []
+        pipe.on_drain = lambda: drained.append(1)
+        pipe.append(b'abcdef')
+        self.assertTrue(pipe.full())
+        pipe.close()
+        self.assertEqual(drained, [1])
+        self.assertFalse(pipe.full())
+        pipe.append(b'discarded')
+        self.assertEqual(len(pipe), 0)
+
+
+class SpoolTestMixin:
+
+    def _makeSpool(self, backend='tempfile', quota=0):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        return buffers.Spool(backend, directory, quota)
+
+    def assertUsed(self, used, before):
+        self.assertEqual(buffers.Spool.used - before, used)
+
+
+class TestSpool(SpoolTestMixin, unittest.TestCase):
+
+    def test_tempfile(self):
+        spool = self._makeSpool()
+        with spool.open() as f:
+            f.write(b'data')
+            f.seek(0)
+            self.assertEqual(f.read(), b'data')
+            if os.name == 'posix':
+                # Anonymous: already gone from the directory.
+                self.assertEqual(os.listdir(spool.directory), [])
+
+    @unittest.skipUnless(hasattr(os, 'memfd_create'), 'requires memfd')
+    def test_memfd(self):
+        spool = self._makeSpool('memfd')
+        with spool.open() as f:
+            f.write(b'data')
+            f.seek(0)
+            self.assertEqual(f.read(), b'data')
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            self._makeSpool('floppy').open()
+
+    def test_quota(self):
+        before = buffers.Spool.used
+        spool = self._makeSpool(quota=before + 10)
+        spool.reserve(6)
+        with self.assertRaises(OSError) as exc:
+            spool.reserve(6)
+        self.assertEqual(exc.exception.errno, errno.ENOSPC)
+        self.assertUsed(6, before)
+        spool.release(6)
+        self.assertUsed(0, before)
+
+    def test_get_spool(self):
+        from zope.server.adjustments import Adjustments
+        adj = Adjustments()
+        self.assertEqual(buffers.get_spool(adj), buffers.default_spool)
+        adj.spool_backend = 'memfd'
+        adj.spool_quota = 5
+        self.assertEqual(buffers.get_spool(adj), ('memfd', None, 5))
+
+
+class TestMappedFileBuffer(SpoolTestMixin, unittest.TestCase):
+
+    def _makeOne(self, quota=0):
+        buf = buffers.MappedFileBuffer(self._makeSpool(quota=quota))
+        self.addCleanup(buf.close)
+        return buf
+
+    def test_reads_from_map(self):
+        before = buffers.Spool.used
+        buf = self._makeOne()
+        self.assertEqual(buf.peek(), b'')
+        buf.append(b'hello ')
+        view = buf.peek(3)
+        self.assertIsInstance(view, memoryview)
+        self.assertEqual(bytes(view), b'hel')
+        view.release()
+        # The map grows with the file.
+        buf.append(b'world')
+        self.assertEqual(buf.get(), b'hello world')
+        self.assertEqual(len(buf), 11)
+        self.assertUsed(11, before)
+
+        self.assertEqual(buf.get(5, skip=True), b'hello')
+        self.assertEqual(buf.getfile().read(), b' world')
+        buf.skip(6)
+        # Emptied: the file is truncated and the quota given back.
+        self.assertEqual(buf.size, 0)
+        self.assertEqual(os.fstat(buf.file.fileno()).st_size, 0)
+        self.assertUsed(0, before)
+
+        buf.append(b'again')
+        self.assertEqual(buf.get(), b'again')
+        with self.assertRaises(ValueError):
+            buf.skip(6)
+        buf.close()
+        buf.close()
+        self.assertUsed(0, before)
+
+    def test_quota_exceeded(self):
+        before = buffers.Spool.used
+        buf = self._makeOne(quota=before + 10)
+        buf.append(b'x' * 8)
+        with self.assertRaises(OSError):
+            buf.append(b'x' * 8)
+        self.assertEqual(len(buf), 8)
+        self.assertUsed(8, before)
+
+    def test_emptied_with_view_in_use(self):
+        buf = self._makeOne()
+        buf.append(b'data')
+        view = buf.peek()
+        buf.skip(4)
+        self.assertEqual(bytes(view), b'data')
+        self.assertEqual(buf.size, 4)
+        view.release()
+        buf.append(b'more')
+        self.assertEqual(buf.get(), b'more')
+
+    def test_close_with_view_in_use(self):
+        buf = self._makeOne()
+        buf.append(b'data')
+        view = buf.peek()
+        buf.close()
+        self.assertEqual(bytes(view), b'data')
+
+    def test_as_segmented_buffer_spool(self):
+        from functools import partial
+        spool = self._makeSpool()
+        buf = buffers.SegmentedBuffer(
+            4, partial(buffers.MappedFileBuffer, spool))
+        buf.append(b'abc')
+        buf.append(b'defgh')
+        self.assertIsInstance(buf.spool, buffers.MappedFileBuffer)
+        buf.skip(3)
+        self.assertIsInstance(buf.peek(), memoryview)
+        self.assertEqual(buf.get(), b'defgh')
+        buf.close()
+
+
+class TestSpooledOverflowableBuffer(SpoolTestMixin, unittest.TestCase):
+
+    def _makeOne(self, overflow=10, quota=0):
+        spool = self._makeSpool(quota=quota)
+        buf = buffers.OverflowableBuffer(overflow, spool)
+        return buf
+
+    def test_rollover_counts_against_quota(self):
+        before = buffers.Spool.used
+        buf = self._makeOne()
+        data = b'x' * (buffers.STRBUF_LIMIT + 5)
+        buf.append(data)
+        self.assertFalse(buf.file._rolled)
+        self.assertUsed(0, before)
+        buf.append(b'yyyyyy')
+        self.assertTrue(buf.file._rolled)
+        self.assertUsed(len(data) + 6, before)
+        buf.append(b'z')
+        self.assertUsed(len(data) + 7, before)
+        self.assertEqual(buf.getfile().read(), data + b'yyyyyyz')
+        buf.close()
+        self.assertUsed(0, before)
+
+    def test_released_when_garbage_collected(self):
+        before = buffers.Spool.used
+        buf = self._makeOne(overflow=0)
+        buf.append(b'x' * (buffers.STRBUF_LIMIT + 1))
+        self.assertUsed(buffers.STRBUF_LIMIT + 1, before)
+        del buf
+        gc.collect()
+        self.assertUsed(0, before)
+
+    def test_quota_exceeded(self):
+        before = buffers.Spool.used
+        buf = self._makeOne(overflow=0, quota=before + buffers.STRBUF_LIMIT)
+        with self.assertRaises(OSError):
+            buf.append(b'x' * (buffers.STRBUF_LIMIT + 1))
+        self.assertFalse(buf.file._rolled)
+        self.assertUsed(0, before)
+        buf.close()
@@ -2,8 +2,14 @@
 Tests for dualmodechannel.py.
 
 """
+import errno
+import os
+import socket
+import tempfile
+import threading
 import unittest
 
+from zope.server.adjustments import Adjustments
 from zope.server.dualmodechannel import DualModeChannel
 
 
@@ -76,6 +82,7 @@ class TestDualModeChannel(unittest.TestCase):
         class A:
             send_bytes = 1
             outbuf_overflow = 100
+            outbuf_high_water = 0
 
         channel = C(None, None, A())
         channel.write(b'some bytes')
@@ -120,3 +127,579 @@ class TestDualModeChannel(unittest.TestCase):
                          "2\n"
                          "3\n"
                          "I love to count. Ha ha ha.")
+
+
+class TestLazyOutputBuffer(unittest.TestCase):
+
+    def _makeOne(self):
+        from zope.server.tests.test_serverbase import FakeSocket
+        socket = FakeSocket()
+        channel = DualModeChannel(socket, ('localhost', 42))
+        channel.send_directly = False
+        return channel, socket
+
+    def test_no_buffer_until_written(self):
+        channel, _socket = self._makeOne()
+        self.assertIsNone(channel._outbuf)
+        self.assertFalse(channel.writable())
+        channel.handle_write()
+        channel.flush()
+        self.assertEqual(channel.write(b''), 0)
+        self.assertEqual(channel.write([b'', b'']), 0)
+        self.assertIsNone(channel._outbuf)
+        channel.close()
+        self.assertIsNone(channel._outbuf)
+
+    def test_outbuf_property_creates_buffer(self):
+        channel, _socket = self._makeOne()
+        outbuf = channel.outbuf
+        self.assertIs(channel._outbuf, outbuf)
+        self.assertIs(channel.outbuf, outbuf)
+
+    def test_buffer_dropped_when_sent_in_async_mode(self):
+        channel, socket = self._makeOne()
+        channel.write(b'data')
+        self.assertIsNotNone(channel._outbuf)
+        self.assertTrue(channel.writable())
+        channel.handle_write()
+        self.assertEqual(socket.data, b'data')
+        self.assertIsNone(channel._outbuf)
+        self.assertFalse(channel.writable())
+
+    def test_buffer_kept_in_sync_mode(self):
+        channel, socket = self._makeOne()
+        channel.set_sync()
+        channel.write(b'data')
+        outbuf = channel._outbuf
+        channel.flush()
+        self.assertEqual(socket.data, b'data')
+        self.assertIs(channel._outbuf, outbuf)
+        channel.async_mode = True
+        channel.close()
+        self.assertIsNone(channel._outbuf)
+
+
+class SendmsgSocket:
+
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    def setblocking(self, _val):
+        pass
+
+    def fileno(self):
+        return 42
+
+    def getpeername(self):
+        return ('localhost', 42)
+
+    def send(self, data):
+        self.calls.append(('send', bytes(data)))
+        return len(data)
+
+    def sendmsg(self, buffers):
+        if self.error is not None:
+            raise OSError(self.error, 'error')
+        data = b''.join(buffers)
+        self.calls.append(('sendmsg', data))
+        return len(data)
+
+
+class TestScatterGatherWrites(unittest.TestCase):
+
+    def _makeOne(self, sock):
+        class C(DualModeChannel):
+            close_called = False
+
+            def handle_close(self):
+                self.close_called = True
+
+        adj = Adjustments()
+        adj.send_bytes = 1 << 20
+        return C(sock, ('localhost', 42), adj)
+
+    def test_segments_sent_together(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        header = b'HTTP/1.1 200 OK\r\n' + b'X' * 9000
+        body = b'b' * 10000
+        channel.outbuf.append(header)
+        channel.outbuf.append(body)
+        channel.flush()
+        self.assertEqual(sock.calls, [('sendmsg', header + body)])
+        self.assertEqual(len(channel.outbuf), 0)
+
+    def test_single_segment_uses_send(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        channel.outbuf.append(b'data')
+        channel.flush()
+        self.assertEqual(sock.calls, [('send', b'data')])
+
+    def test_disabled(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        channel.sendmsg_segments = 0
+        channel.outbuf.append(b'a' * 10000)
+        channel.outbuf.append(b'b' * 10000)
+        channel.flush()
+        self.assertEqual([c[0] for c in sock.calls], ['send', 'send'])
+
+    def test_sendmsg_would_block(self):
+        channel = self._makeOne(SendmsgSocket(errno.EWOULDBLOCK))
+        self.assertEqual(channel.sendmsg([b'data']), 0)
+        self.assertFalse(channel.close_called)
+
+    def test_sendmsg_disconnected(self):
+        channel = self._makeOne(SendmsgSocket(errno.EPIPE))
+        self.assertEqual(channel.sendmsg([b'data']), 0)
+        self.assertTrue(channel.close_called)
+
+    def test_sendmsg_other_error(self):
+        channel = self._makeOne(SendmsgSocket(errno.EINVAL))
+        with self.assertRaises(OSError):
+            channel.sendmsg([b'data'])
+
+
+class PartialSendSocket(SendmsgSocket):
+    # Accepts at most *limit* bytes per call.
+
+    def __init__(self, limit):
+        SendmsgSocket.__init__(self)
+        self.limit = limit
+
+    def send(self, data):
+        return SendmsgSocket.send(self, data[:self.limit])
+
+    def sendmsg(self, buffers):
+        return self.send(b''.join(buffers))
+
+
+class TestDirectSend(unittest.TestCase):
+
+    def _makeOne(self, sock):
+        adj = Adjustments()
+        adj.send_bytes = 1 << 20
+        return DualModeChannel(sock, ('localhost', 42), adj)
+
+    def test_sent_without_buffering(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        self.assertEqual(channel.write(b'data'), 4)
+        self.assertEqual(sock.calls, [('send', b'data')])
+        self.assertIsNone(channel._outbuf)
+        self.assertEqual(channel.write([b'head', b'', b'body']), 8)
+        self.assertEqual(sock.calls[1:], [('sendmsg', b'headbody')])
+        self.assertIsNone(channel._outbuf)
+
+    def test_unsent_rest_buffered(self):
+        sock = PartialSendSocket(6)
+        channel = self._makeOne(sock)
+        self.assertEqual(channel.write([b'head', b'body', b'tail']), 12)
+        self.assertEqual(sock.calls, [('send', b'headbo')])
+        self.assertEqual(channel.outbuf.get(), b'dytail')
+
+        # With data waiting, writes are queued behind it.
+        channel.write(b'more')
+        self.assertEqual(len(sock.calls), 1)
+        channel.flush()
+        self.assertEqual(b''.join(c[1] for c in sock.calls),
+                         b'headbodytailmore')
+
+    def test_would_block(self):
+        sock = PartialSendSocket(0)
+        channel = self._makeOne(sock)
+        channel.write(b'data')
+        self.assertEqual(channel.outbuf.get(), b'data')
+
+    def test_disabled_or_not_connected(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        channel.send_directly = False
+        channel.write(b'data')
+        self.assertEqual(sock.calls, [])
+        channel = self._makeOne(None)
+        channel.write(b'data')
+        self.assertEqual(channel.outbuf.get(), b'data')
+
+
+@unittest.skipUnless(hasattr(os, 'sendfile'), 'requires os.sendfile()')
+class TestWriteFile(unittest.TestCase):
+
+    def setUp(self):
+        self.sock, self.other = socket.socketpair()
+        self.addCleanup(self.other.close)
+        self.sock.setblocking(0)
+        self.channel = DualModeChannel(self.sock, ('localhost', 42))
+        self.channel.set_sync()
+        self.addCleanup(self._close)
+        self.file = tempfile.TemporaryFile()
+        self.addCleanup(self.file.close)
+        self.data = os.urandom(100000)
+        self.file.write(self.data)
+        self.file.flush()
+
+    def _close(self):
+        self.channel.async_mode = True
+        self.channel.close()
+
+    def _receive(self, count):
+        received = b''
+        while len(received) < count:
+            received += self.other.recv(count - len(received))
+        return received
+
+    def _write(self):
+        channel = self.channel
+        channel.write(b'header')
+        wrote = channel.write_file(self.file.fileno(), 1000, 50000)
+        channel.write(b'trailer')
+        # The channel keeps its own descriptor.
+        self.file.close()
+        return wrote
+
+    def test_sendfile(self):
+        sent = []
+        orig = self.channel.sendfile
+
+        def sendfile(segment):
+            n = orig(segment)
+            sent.append(n)
+            return n
+        self.channel.sendfile = sendfile
+        self.assertEqual(self._write(), 50000)
+        self.channel.flush()
+        self.assertEqual(self._receive(50013),
+                         b'header' + self.data[1000:51000] + b'trailer')
+        self.assertEqual(sum(sent), 50000)
+        self.assertEqual(len(self.channel.outbuf), 0)
+
+    def test_without_sendfile(self):
+        self.channel.use_sendfile = False
+        self._write()
+        self.channel.flush()
+        self.assertEqual(self._receive(50013),
+                         b'header' + self.data[1000:51000] + b'trailer')
+
+    def test_empty_range(self):
+        self.assertEqual(self.channel.write_file(self.file.fileno(), 0, 0), 0)
+        self.assertEqual(len(self.channel.outbuf), 0)
+
+    def test_file_too_short(self):
+        self.channel.write_file(self.file.fileno(), 99000, 2000)
+        with self.assertRaises(OSError):
+            self.channel.flush()
+
+    def _sendfileError(self, error):
+        from zope.server import dualmodechannel
+        from zope.server.buffers import FileSegment
+
+        class FakeOS:
+            def sendfile(self, *args):
+                raise OSError(error, 'error')
+
+        orig_os = dualmodechannel.os
+        dualmodechannel.os = FakeOS()
+        self.addCleanup(setattr, dualmodechannel, 'os', orig_os)
+        closed = []
+        self.channel.handle_close = lambda: closed.append(1)
+        return self.channel.sendfile(FileSegment(None, 0, 10)), closed
+
+    def test_sendfile_would_block(self):
+        self.assertEqual(self._sendfileError(errno.EAGAIN), (0, []))
+
+    def test_sendfile_disconnected(self):
+        self.assertEqual(self._sendfileError(errno.ECONNRESET), (0, [1]))
+
+    def test_sendfile_other_error(self):
+        with self.assertRaises(OSError):
+            self._sendfileError(errno.EINVAL)
+
+
+class TestRecvInto(unittest.TestCase):
+
+    def _makeOne(self, sock):
+        class C(DualModeChannel):
+            close_called = False
+
+            def received(self, data):
+                self.views.append(data)
+                self.data.append(bytes(data))
+
+            def handle_close(self):
+                self.close_called = True
+
+        channel = C(sock, ('localhost', 42))
+        channel.views = []
+        channel.data = []
+        return channel
+
+    def test_reads_into_reused_buffer(self):
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        channel = self._makeOne(sock)
+        other.sendall(b'first')
+        channel.handle_read()
+        other.sendall(b'second')
+        channel.handle_read()
+        self.assertEqual(channel.data, [b'first', b'second'])
+        first, second = channel.views
+        self.assertIsInstance(first, memoryview)
+        self.assertIs(first.obj, second.obj)
+
+        other.close()
+        channel.handle_read()
+        self.assertTrue(channel.close_called)
+        self.assertEqual(channel.data[-1], b'')
+
+    def test_recv_into_errors(self):
+        class ErrorSocket(SendmsgSocket):
+            def recv_into(self, buffer, nbytes=0):
+                raise OSError(self.error, 'error')
+
+        channel = self._makeOne(ErrorSocket(errno.ECONNRESET))
+        self.assertEqual(channel.recv_into(bytearray(10)), 0)
+        self.assertTrue(channel.close_called)
+
+        channel = self._makeOne(ErrorSocket(errno.EINVAL))
+        with self.assertRaises(OSError):
+            channel.recv_into(bytearray(10))
+        self.assertFalse(channel.close_called)
+
+
+class TestOutputBackpressure(unittest.TestCase):
+
+    def _makeOne(self, sock, high_water=65536, timeout=10):
+        adj = Adjustments()
+        adj.outbuf_high_water = high_water
+        adj.write_timeout = timeout
+        channel = DualModeChannel(sock, ('localhost', 42), adj)
+        channel.set_sync()
+        return channel
+
+    def _socketpair(self):
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        sock.setblocking(False)
+        # Keep the kernel from buffering everything.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+        other.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 16384)
+        return sock, other
+
+    def test_writer_waits_for_main_loop(self):
+        sock, other = self._socketpair()
+        channel = self._makeOne(sock)
+        self.assertFalse(channel.writable())
+        chunk = b'x' * 50000
+        sizes = []
+        errors = []
+
+        def app():
+            try:
+                for _i in range(100):
+                    channel.write(chunk)
+                    sizes.append(len(channel.outbuf))
+            except BaseException as e:  # pragma: no cover
+                errors.append(e)
+
+        writer = threading.Thread(target=app)
+        writer.start()
+        received = 0
+        other.settimeout(0.01)
+        # Act as the main loop and as a slow client.
+        while writer.is_alive() or channel.writable():
+            if channel.writable():
+                channel.handle_write()
+            try:
+                received += len(other.recv(20000))
+            except socket.timeout:
+                pass
+        writer.join()
+        while received < len(chunk) * 100:
+            channel.flush(block=False)
+            try:
+                received += len(other.recv(65536))
+            except socket.timeout:  # pragma: no cover
+                pass
+        self.assertEqual(errors, [])
+        self.assertEqual(received, len(chunk) * 100)
+        self.assertLessEqual(max(sizes), 65536)
+        self.assertGreater(max(sizes), 0)
+        self.assertFalse(channel.writable())
+
+    def test_write_timeout(self):
+        sock, _other = self._socketpair()
+        channel = self._makeOne(sock, timeout=0.05)
+        with self.assertRaises(TimeoutError):
+            channel.write(b'x' * (8 << 20))
+        self.assertIsNone(channel._outbuf)
+        self.assertFalse(channel._draining)
+
+    def test_send_error_reaches_writer(self):
+        class ErrorSocket(SendmsgSocket):
+            def send(self, data):
+                if self.error is not None:
+                    raise OSError(self.error, 'error')
+                return 0
+
+        sock = ErrorSocket()
+        channel = self._makeOne(sock, high_water=1)
+
+        def main_loop():
+            while not channel.writable():
+                pass
+            sock.error = errno.EINVAL
+            channel.handle_write()
+
+        loop = threading.Thread(target=main_loop)
+        loop.start()
+        with self.assertRaises(OSError):
+            channel.write(b'data')
+        loop.join()
+        self.assertIsNone(channel._outbuf)
+
+    def test_async_mode_never_waits(self):
+        channel = self._makeOne(SendmsgSocket(), high_water=1)
+        channel.async_mode = True
+        channel.send_directly = False
+        channel.write(b'data')
+        self.assertEqual(len(channel.outbuf), 4)
+
+
+class TestSendInMainLoop(unittest.TestCase):
+
+    def _makeOne(self, sock):
+        adj = Adjustments()
+        adj.send_in_main_loop = True
+        adj.write_timeout = 10
+        channel = DualModeChannel(sock, ('localhost', 42), adj)
+        channel.set_sync()
+        return channel
+
+    def test_application_thread_only_queues(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        self.assertFalse(channel.writable())
+        channel.write(b'x' * 100000)
+        channel.flush(block=False)
+        self.assertEqual(sock.calls, [])
+        self.assertTrue(channel.writable())
+        channel.handle_write()
+        self.assertEqual(sock.calls, [('send', b'x' * 9000)])
+        while channel.writable():
+            channel.handle_write()
+        self.assertEqual(len(b''.join(c[1] for c in sock.calls)), 100000)
+        # Switching back to asynchronous mode drops the empty buffer.
+        channel.set_async()
+        channel.handle_write()
+        self.assertIsNone(channel._outbuf)
+
+    def test_writer_waits_below_high_water(self):
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        channel = self._makeOne(sock)
+        channel.adj.outbuf_high_water = 65536
+        sizes = []
+
+        def app():
+            for _i in range(20):
+                channel.write(b'x' * 50000)
+                channel.flush()
+                sizes.append(len(channel.outbuf))
+
+        writer = threading.Thread(target=app)
+        writer.start()
+        received = 0
+        other.settimeout(0.01)
+        while received < 1000000:
+            if channel.writable():
+                channel.handle_write()
+            try:
+                received += len(other.recv(65536))
+            except socket.timeout:
+                pass
+        writer.join()
+        self.assertEqual(received, 1000000)
+        self.assertLessEqual(max(sizes), 65536)
+
+    def test_flush_waits_for_main_loop(self):
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        channel = self._makeOne(sock)
+        flushed = []
+
+        def app():
+            channel.write(b'x' * 100000)
+            channel.flush()
+            flushed.append(len(channel.outbuf))
+
+        writer = threading.Thread(target=app)
+        writer.start()
+        writer.join(0.05)
+        self.assertEqual(flushed, [])
+        received = 0
+        other.settimeout(0.01)
+        while received < 100000:
+            if channel.writable():
+                channel.handle_write()
+            try:
+                received += len(other.recv(65536))
+            except socket.timeout:
+                pass
+        writer.join()
+        self.assertEqual(flushed, [0])
+
+    def test_flush_timeout(self):
+        sock, other = socket.socketpair()
+        self.addCleanup(sock.close)
+        self.addCleanup(other.close)
+        channel = self._makeOne(sock)
+        channel.adj.write_timeout = 0.05
+        channel.write(b'data')
+        # No main loop sends it.
+        with self.assertRaises(TimeoutError):
+            channel.flush()
+        self.assertIsNone(channel._outbuf)
+
+    def test_queue_output(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        pulled = []
+        channel.pull_trigger = lambda: pulled.append(1)
+        channel._queue_output(b'data')
+        channel._queue_output(b'more')
+        self.assertEqual(sock.calls, [])
+        # The main loop was woken up once, when output became pending.
+        self.assertEqual(pulled, [1])
+        channel.handle_write()
+        self.assertEqual(b''.join(c[1] for c in sock.calls), b'datamore')
+
+    def test_send_error_raised_by_next_write(self):
+        channel = self._makeOne(SendmsgSocket())
+        channel.write(b'data')
+        channel.socket.send = lambda data: 1 / 0
+        channel.handle_write()
+        self.assertFalse(channel.writable())
+        self.assertIsNone(channel._outbuf)
+        with self.assertRaises(ZeroDivisionError):
+            channel.write(b'more')
+        channel.write(b'more')
+        self.assertEqual(len(channel.outbuf), 4)
+
+    def test_close_when_done(self):
+        sock = SendmsgSocket()
+        channel = self._makeOne(sock)
+        channel.close = lambda: setattr(channel, 'closed', True)
+        channel.write(b'data')
+        channel.close_when_done()
+        self.assertEqual(sock.calls, [])
+        self.assertTrue(channel.async_mode)
+        channel.handle_write()
+        self.assertEqual(sock.calls, [('send', b'data')])
+        channel.handle_write()
+        self.assertTrue(channel.closed)
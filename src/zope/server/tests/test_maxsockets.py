@@ -0,0 +1,104 @@
+"""
+Tests for maxsockets.py.
+
+"""
+import unittest
+
+from zope.server import maxsockets
+
+
+class FakeResource:
+
+    RLIMIT_NOFILE = 7
+    RLIM_INFINITY = -1
+
+    def __init__(self, soft, hard):
+        self.limits = (soft, hard)
+
+    def getrlimit(self, which):
+        assert which == self.RLIMIT_NOFILE
+        return self.limits
+
+    def setrlimit(self, which, limits):
+        assert which == self.RLIMIT_NOFILE
+        if limits[0] == self.RLIM_INFINITY:
+            raise ValueError('not allowed to raise maximum limit')
+        self.limits = limits
+
+
+class TestMaxSockets(unittest.TestCase):
+
+    def _setResource(self, soft, hard):
+        res = FakeResource(soft, hard)
+        orig = maxsockets.resource
+        maxsockets.resource = res
+        self.addCleanup(setattr, maxsockets, 'resource', orig)
+        return res
+
+    def test_real_limits(self):
+        self.assertGreater(maxsockets.max_open_files(), 0)
+        self.assertLessEqual(maxsockets.max_select_sockets(),
+                             maxsockets.FD_SETSIZE)
+        self.assertGreaterEqual(maxsockets.max_poll_sockets(),
+                                maxsockets.max_select_sockets())
+
+    def test_select_is_capped_by_fd_setsize(self):
+        self._setResource(100000, 100000)
+        self.assertEqual(maxsockets.max_select_sockets(),
+                         maxsockets.FD_SETSIZE)
+        self.assertEqual(maxsockets.max_sockets('select'),
+                         maxsockets.FD_SETSIZE)
+        self.assertEqual(maxsockets.max_sockets('epoll'), 100000)
+
+    def test_small_limit(self):
+        self._setResource(256, 4096)
+        self.assertEqual(maxsockets.max_select_sockets(), 256)
+        self.assertEqual(maxsockets.connection_limit('select'), 192)
+        self.assertEqual(maxsockets.connection_limit('poll'), 192)
+
+    def test_unlimited(self):
+        self._setResource(-1, -1)
+        self.assertEqual(maxsockets.max_poll_sockets(),
+                         maxsockets.UNLIMITED_MAX_OPEN_FILES)
+
+    def test_raise_open_files_limit(self):
+        res = self._setResource(1024, 4096)
+        self.assertEqual(maxsockets.raise_open_files_limit(), 4096)
+        self.assertEqual(res.limits, (4096, 4096))
+
+    def test_raise_open_files_limit_wanted(self):
+        res = self._setResource(1024, 4096)
+        self.assertEqual(maxsockets.raise_open_files_limit(2048), 2048)
+        self.assertEqual(res.limits, (2048, 4096))
+        self.assertEqual(maxsockets.raise_open_files_limit(100000), 4096)
+
+    def test_raise_open_files_limit_never_lowers(self):
+        res = self._setResource(1024, 4096)
+        self.assertEqual(maxsockets.raise_open_files_limit(512), 1024)
+        self.assertEqual(res.limits, (1024, 4096))
+
+    def test_raise_open_files_limit_hard_unlimited(self):
+        res = self._setResource(1024, -1)
+        self.assertEqual(maxsockets.raise_open_files_limit(8192), 8192)
+        self.assertEqual(res.limits, (8192, -1))
+
+    def test_raise_open_files_limit_hard_unlimited_default(self):
+        res = self._setResource(256, -1)
+        self.assertEqual(maxsockets.raise_open_files_limit(),
+                         maxsockets.OPEN_MAX)
+        self.assertEqual(res.limits, (maxsockets.OPEN_MAX, -1))
+
+    def test_raise_open_files_limit_fails(self):
+        res = self._setResource(256, 4096)
+
+        def setrlimit(which, limits):
+            raise ValueError('current limit exceeds maximum limit')
+        res.setrlimit = setrlimit
+        with self.assertLogs('zope.server.maxsockets', 'WARNING') as logs:
+            self.assertEqual(maxsockets.raise_open_files_limit(), 256)
+        self.assertIn('from 256 to 4096', logs.output[0])
+
+    def test_connection_limit_default(self):
+        from zope.server.adjustments import Adjustments
+        self.assertEqual(Adjustments.connection_limit,
+                         maxsockets.connection_limit())
@@ -0,0 +1,175 @@
+"""
+Tests for prefork.py.
+
+"""
+import os
+import signal
+import socket
+import time
+import unittest
+from http.client import HTTPConnection
+
+from zope.server import prefork
+from zope.server.adjustments import Adjustments
+
+
+def find_free_port():
+    s = socket.socket()
+    try:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+    finally:
+        s.close()
+
+
+def make_server(task_dispatcher, adj, port):
+    from zope.server.http.httpserver import HTTPServer
+
+    class PidHTTPServer(HTTPServer):
+        def executeRequest(self, task):
+            body = str(os.getpid()).encode('ascii')
+            task.response_headers['Content-Length'] = str(len(body))
+            task.write(body)
+
+    return PidHTTPServer('127.0.0.1', port, task_dispatcher=task_dispatcher,
+                         adj=adj)
+
+
+@unittest.skipUnless(hasattr(os, 'fork'), 'requires fork()')
+class TestPreforkServer(unittest.TestCase):
+
+    reuse_port = None
+
+    def setUp(self):
+        if self.reuse_port and not hasattr(socket, 'SO_REUSEPORT'):
+            self.skipTest('SO_REUSEPORT not available')  # pragma: no cover
+        self.port = port = find_free_port()
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            status = 0
+            try:
+                server = prefork.PreforkServer(
+                    lambda td, adj: make_server(td, adj, port),
+                    workers=2, threads=2, reuse_port=self.reuse_port,
+                    shutdown_timeout=2)
+                server.min_worker_lifetime = 0
+                server.run()
+            except BaseException:
+                status = 1
+            finally:
+                os._exit(status)
+        self.supervisor = pid
+        self.addCleanup(self._stopSupervisor)
+
+    def _stopSupervisor(self):
+        if self.supervisor is None:
+            return
+        try:
+            os.kill(self.supervisor, signal.SIGKILL)
+            os.waitpid(self.supervisor, 0)
+        except (ProcessLookupError, ChildProcessError):  # pragma: no cover
+            pass
+
+    def _request(self, timeout=10):
+        expiration = time.time() + timeout
+        while True:
+            conn = HTTPConnection('127.0.0.1', self.port, timeout=5)
+            try:
+                conn.request('GET', '/')
+                response = conn.getresponse()
+                self.assertEqual(response.status, 200)
+                return int(response.read())
+            except OSError:
+                if time.time() > expiration:  # pragma: no cover
+                    raise
+                time.sleep(0.05)
+            finally:
+                conn.close()
+
+    def _waitForSupervisor(self, timeout=10):
+        expiration = time.time() + timeout
+        while time.time() < expiration:
+            pid, status = os.waitpid(self.supervisor, os.WNOHANG)
+            if pid:
+                self.supervisor = None
+                return status
+            time.sleep(0.05)
+        self.fail('supervisor did not stop')  # pragma: no cover
+
+    def test_serves_respawns_and_stops(self):
+        worker = self._request()
+        self.assertNotEqual(worker, self.supervisor)
+        self.assertNotEqual(worker, os.getpid())
+
+        # A crashed worker is replaced and service continues.
+        os.kill(worker, signal.SIGKILL)
+        pids = set()
+        for _i in range(20):
+            pids.add(self._request())
+        self.assertNotIn(worker, pids)
+
+        os.kill(self.supervisor, signal.SIGTERM)
+        self.assertEqual(self._waitForSupervisor(), 0)
+        # The workers are gone, and so is the listening socket.
+        for pid in pids:
+            with self.assertRaises(ProcessLookupError):
+                os.kill(pid, 0)
+
+
+class TestPreforkServerInheritedSocket(TestPreforkServer):
+
+    reuse_port = False
+
+
+class TestPreforkServerReusePort(TestPreforkServer):
+
+    reuse_port = True
+
+
+class TestPreforkServerUnit(unittest.TestCase):
+
+    def test_adjustments_copied(self):
+        adj = Adjustments()
+        server = prefork.PreforkServer(None, adj=adj, reuse_port=True)
+        self.assertTrue(server.adj.reuse_port)
+        self.assertIsNot(server.adj, adj)
+        self.assertFalse(adj.reuse_port)
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'requires fork()')
+    def test_describe_exit_status(self):
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os._exit(3)
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(prefork.describe_exit_status(status),
+                         'exited with code 3')
+
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            os.kill(os.getpid(), signal.SIGKILL)
+        _pid, status = os.waitpid(pid, 0)
+        self.assertEqual(prefork.describe_exit_status(status),
+                         'killed by signal %d' % signal.SIGKILL)
+
+    def test_stop(self):
+        server = prefork.PreforkServer(None)
+        server.running = True
+        server.stop()
+        self.assertFalse(server.running)
+
+
+class TestTriggerReopen(unittest.TestCase):
+
+    def test_reopen(self):
+        from zope.server import trigger
+        t = trigger.trigger()
+        self.addCleanup(t.close)
+        t.thunks.append(None)
+        t.reopen()
+        self.assertFalse(t._closed)
+        self.assertEqual(t.thunks, [])
+
+        called = []
+        t.pull_trigger(lambda: called.append(1))
+        t.handle_read()
+        self.assertEqual(called, [1])
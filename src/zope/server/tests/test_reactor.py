@@ -0,0 +1,194 @@
+"""
+Tests for reactor.py.
+
+"""
+import asyncore
+import socket
+import sys
+import time
+import unittest
+
+from zope.server import reactor
+
+
+class Timer:
+
+    def __init__(self, deadline):
+        self.deadline = deadline
+        self.expired = []
+
+    def next_deadline(self):
+        return self.deadline
+
+    def expire(self, now):
+        self.expired.append(now)
+        if self.deadline is not None and now >= self.deadline:
+            self.deadline = None
+
+
+class Dispatcher(asyncore.dispatcher):
+
+    read_data = b''
+    want_write = False
+    wrote = False
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return self.want_write
+
+    def handle_read(self):
+        self.read_data += self.recv(100)
+
+    def handle_write(self):
+        self.wrote = True
+        self.want_write = False
+
+
+class _ReactorTestsBase:
+
+    backend = None
+
+    def setUp(self):
+        if self.backend not in reactor.backends:  # pragma: no cover
+            self.skipTest('%s is not available' % self.backend)
+        self.map = {}
+        self.reactor = reactor.get_reactor(self.backend, self.map)
+        self.addCleanup(self.reactor.close)
+
+    def _makePair(self):
+        a, b = socket.socketpair()
+        self.addCleanup(b.close)
+        d = Dispatcher(a, map=self.map)
+        self.addCleanup(d.close)
+        return d, b
+
+    def test_name(self):
+        self.assertEqual(self.reactor.name, self.backend)
+
+    def test_read_event(self):
+        d, other = self._makePair()
+        self.reactor.poll(0)
+        self.assertEqual(d.read_data, b'')
+        other.send(b'data')
+        self.reactor.poll(1.0)
+        self.assertEqual(d.read_data, b'data')
+
+    def test_write_interest_changes(self):
+        d, _other = self._makePair()
+        self.reactor.poll(0)
+        self.assertFalse(d.wrote)
+        d.want_write = True
+        self.reactor.poll(1.0)
+        self.assertTrue(d.wrote)
+        d.wrote = False
+        self.reactor.poll(0)
+        self.assertFalse(d.wrote)
+
+    def test_closed_dispatcher_is_forgotten(self):
+        d, _other = self._makePair()
+        fd = d._fileno
+        self.reactor.poll(0)
+        d.close()
+        self.reactor.poll(0)
+        self.assertEqual(d.read_data, b'')
+        self.assertNotIn(fd, getattr(self.reactor, '_registered', {}))
+
+    def test_reused_descriptor(self):
+        d, other = self._makePair()
+        self.reactor.poll(0)
+        fd = d._fileno
+        d.close()
+        d2, other2 = self._makePair()
+        if d2._fileno != fd:  # pragma: no cover
+            self.skipTest('descriptor not reused')
+        other2.send(b'new')
+        self.reactor.poll(1.0)
+        self.assertEqual(d2.read_data, b'new')
+        self.assertEqual(d.read_data, b'')
+
+    def test_loop_exits_when_map_is_empty(self):
+        d, other = self._makePair()
+        other.send(b'data')
+        orig = d.handle_read
+
+        def handle_read():
+            orig()
+            d.close()
+        d.handle_read = handle_read
+        reactor.loop(timeout=1.0, map=self.map, backend=self.backend)
+        self.assertEqual(d.read_data, b'data')
+        self.assertEqual(self.map, {})
+
+    def test_loop_count(self):
+        d, _other = self._makePair()
+        d.want_write = True
+        reactor.loop(timeout=0, map=self.map, count=2, backend=self.backend)
+        self.assertTrue(d.wrote)
+
+    def test_timer(self):
+        self._makePair()
+        start = time.time()
+        timer = Timer(start + 0.05)
+        reactor.add_timer(timer)
+        self.addCleanup(reactor.remove_timer, timer)
+        # The poll doesn't wait past the deadline.
+        while timer.deadline is not None:
+            self.reactor.poll(10.0)
+        self.assertLess(time.time() - start, 5.0)
+        self.assertGreaterEqual(timer.expired[-1], start + 0.05)
+        # Removed timers are left alone.
+        expired = len(timer.expired)
+        reactor.remove_timer(timer)
+        self.reactor.poll(0)
+        self.assertEqual(len(timer.expired), expired)
+
+
+class TestSelectReactor(_ReactorTestsBase, unittest.TestCase):
+
+    backend = 'select'
+
+
+class TestPollReactor(_ReactorTestsBase, unittest.TestCase):
+
+    backend = 'poll'
+
+
+class TestEpollReactor(_ReactorTestsBase, unittest.TestCase):
+
+    backend = 'epoll'
+
+
+class TestGetReactor(unittest.TestCase):
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            reactor.get_reactor('kqueue-on-windows')
+
+    def test_auto(self):
+        r = reactor.get_reactor('auto', {})
+        self.addCleanup(r.close)
+        self.assertEqual(r.name, reactor.best_backend())
+
+
+class TestWithoutPoll(unittest.TestCase):
+
+    def test_import_without_poll(self):
+        # E.g. on Windows, select has neither poll nor the POLL* flags.
+        import importlib.util
+        import select
+        import types
+
+        fake_select = types.SimpleNamespace(error=select.error,
+                                            select=select.select)
+        spec = importlib.util.find_spec('zope.server.reactor')
+        module = importlib.util.module_from_spec(spec)
+        orig = sys.modules['select']
+        sys.modules['select'] = fake_select
+        try:
+            spec.loader.exec_module(module)
+        finally:
+            sys.modules['select'] = orig
+        self.assertEqual(sorted(module.backends), ['select'])
+        self.assertEqual(module.best_backend(), 'select')
@@ -13,6 +13,7 @@
 ##############################################################################
 """Tests for zope.server.serverbase
 """
+import socket
 import unittest
 
 from zope.server import serverbase
@@ -103,6 +104,15 @@ class TestServerBase(unittest.TestCase):
                          "        Port: 80\n"
                          "        URL: http://example.com/")
 
+    def test_ServerBase_logs_connection_limit(self):
+        from zope.server.adjustments import Adjustments
+        adj = Adjustments()
+        adj.connection_limit = 1234
+        sb = NonBindingServerBase('example.com', 80, adj=adj, start=True,
+                                  verbose=True)
+        self.addCleanup(sb.close)
+        self.assertEqual(sb.logs[1], 'Connection limit: 1234')
+
     def test_computeServerName(self):
         sb = NonBindingServerBase('', 80, start=False)
         self.addCleanup(sb.close)
@@ -172,3 +182,199 @@ class TestServerBase(unittest.TestCase):
 
         self.assertEqual(sb.logs,
                          ('warning: server accept() threw an exception',))
+
+    def test_handle_accept_aborted_connection(self):
+        accepted = []
+
+        class Socket:
+            calls = 0
+
+            def accept(self):
+                self.calls += 1
+                if self.calls == 1:
+                    raise ConnectionAbortedError()
+                if self.calls == 2:
+                    return ('conn', ('client', 1))
+                raise BlockingIOError()
+
+        class SB(NonBindingServerBase):
+            _connection_options = ()
+
+            def readable(self):
+                return True
+
+            def channel_class(self, server, conn, addr, adj):
+                accepted.append((conn, addr))
+
+        sb = SB('', 80, start=False)
+        self.addCleanup(sb.close)
+        real_socket = sb.socket
+        sb.socket = Socket()
+        try:
+            sb.handle_accept()
+        finally:
+            sb.socket = real_socket
+        # The aborted connection didn't end the batch.
+        self.assertEqual(accepted, [('conn', ('client', 1))])
+        self.assertEqual(sb.accepted_connections, 1)
+        self.assertEqual(sb.logs, ())
+
+
+class TestAcceptBatching(unittest.TestCase):
+
+    def _makeServer(self, **kw):
+        import asyncore
+        import socket
+
+        from zope.server.adjustments import Adjustments
+
+        channels = []
+
+        class Channel:
+            def __init__(self, server, conn, addr, adj):
+                channels.append(conn)
+
+        class Server(serverbase.ServerBase):
+            channel_class = Channel
+
+            def readable(self):
+                return (self.accepting and
+                        len(channels) < self.adj.connection_limit)
+
+        adj = Adjustments()
+        for k, v in kw.items():
+            setattr(adj, k, v)
+        server = Server('127.0.0.1', 0, adj=adj)
+        self.addCleanup(server.close)
+        port = server.socket.getsockname()[1]
+        for _i in range(5):
+            c = socket.create_connection(('127.0.0.1', port))
+            self.addCleanup(c.close)
+        self.addCleanup(lambda: [conn.close() for conn in channels])
+        # Give the kernel a moment to complete the handshakes.
+        asyncore.poll(0.1, {server._fileno: server})
+        return server, channels
+
+    def test_drains_backlog(self):
+        server, channels = self._makeServer()
+        if len(channels) < 5:
+            server.handle_accept()
+        self.assertEqual(len(channels), 5)
+        self.assertEqual(server.accepted_connections, 5)
+        self.assertLessEqual(server.accept_events, 2)
+        # Nothing pending any more.
+        server.handle_accept()
+        self.assertEqual(server.accepted_connections, 5)
+
+    def test_accept_batch(self):
+        server, channels = self._makeServer(accept_batch=2)
+        self.assertEqual(len(channels), 2)
+        server.handle_accept()
+        self.assertEqual(len(channels), 4)
+        self.assertEqual(server.accept_events, 2)
+
+    def test_connection_limit(self):
+        _server, channels = self._makeServer(connection_limit=3)
+        self.assertEqual(len(channels), 3)
+
+
+class TestSocketOptions(unittest.TestCase):
+
+    def _makeAdj(self, **kw):
+        from zope.server.adjustments import Adjustments
+        adj = Adjustments()
+        for k, v in kw.items():
+            setattr(adj, k, v)
+        return adj
+
+    def test_defaults_set_nothing(self):
+        sb = NonBindingServerBase('', 80, start=False)
+        self.addCleanup(sb.close)
+        self.assertEqual(sb.get_listener_options(), [])
+        self.assertEqual(sb.get_connection_options(),
+                         list(sb.adj.socket_options))
+
+    @unittest.skipUnless(hasattr(socket, 'TCP_DEFER_ACCEPT'),
+                         'Linux specific')
+    def test_listener_options_applied(self):
+        adj = self._makeAdj(tcp_defer_accept=5, tcp_fastopen=16,
+                            recv_buffer_size=65536, send_buffer_size=65536,
+                            tcp_notsent_lowat=16384)
+        sb = serverbase.ServerBase('127.0.0.1', 0, adj=adj)
+        self.addCleanup(sb.close)
+        sock = sb.socket
+        self.assertGreater(
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_DEFER_ACCEPT), 0)
+        self.assertEqual(
+            sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_FASTOPEN), 16)
+        self.assertGreaterEqual(
+            sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF), 65536)
+        self.assertIn((socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, 16384),
+                      sb.get_connection_options())
+
+    def test_unsupported_option_is_skipped(self):
+        adj = self._makeAdj(tcp_defer_accept=5)
+        sb = NonBindingServerBase('', 80, adj=adj, start=False)
+        self.addCleanup(sb.close)
+        orig = serverbase.socket
+        serverbase.socket = type('socket', (), {})()
+        try:
+            self.assertIsNone(sb._socket_option('TCP_DEFER_ACCEPT', 5))
+        finally:
+            serverbase.socket = orig
+        self.assertEqual(
+            sb.logs,
+            ('warning: TCP_DEFER_ACCEPT is not supported on this platform',))
+
+
+class TestBackpressure(unittest.TestCase):
+
+    def _makeOne(self, high=10, low=5):
+        from zope.server.adjustments import Adjustments
+
+        class TaskDispatcher:
+            pending = 0
+
+            def getPendingTasksEstimate(self):
+                return self.pending
+
+        adj = Adjustments()
+        adj.task_queue_high_watermark = high
+        adj.task_queue_low_watermark = low
+        td = TaskDispatcher()
+        sb = NonBindingServerBase('', 80, task_dispatcher=td, adj=adj)
+        self.addCleanup(sb.close)
+        return sb, td
+
+    def test_disabled_by_default(self):
+        sb, td = self._makeOne(high=0)
+        td.pending = 1000
+        self.assertTrue(sb.readable())
+        self.assertFalse(sb.overloaded)
+
+    def test_no_dispatcher(self):
+        sb, _td = self._makeOne()
+        sb.task_dispatcher = None
+        self.assertFalse(sb.check_overload())
+
+    def test_watermarks(self):
+        sb, td = self._makeOne()
+        self.assertTrue(sb.readable())
+        td.pending = 9
+        self.assertTrue(sb.readable())
+        td.pending = 10
+        self.assertFalse(sb.readable())
+        self.assertTrue(sb.overloaded)
+        # Hysteresis: stays overloaded until the low watermark.
+        td.pending = 6
+        self.assertFalse(sb.readable())
+        td.pending = 5
+        self.assertTrue(sb.readable())
+        self.assertFalse(sb.overloaded)
+
+    def test_flag_updated_when_not_accepting(self):
+        sb, td = self._makeOne()
+        sb.accepting = False
+        td.pending = 10
+        self.assertFalse(sb.readable())
+        self.assertTrue(sb.overloaded)
@@ -2,6 +2,7 @@
 Tests for serverchannelbase.py
 
 """
+import errno
 import unittest
 
 from zope.testing.cleanup import CleanUp
@@ -22,6 +23,109 @@ class TestServerChannelBase(CleanUp,
         channel.del_channel()
         self.assertEqual(channel.active_channels, {})
 
+    def test_idle_timeouts(self):
+        channel = self._makeOne()
+        channel.add_channel()
+        timeouts = channel.idle_timeouts
+        deadline = timeouts.deadline(channel)
+        self.assertEqual(deadline,
+                         channel.creation_time + channel.adj.channel_timeout)
+
+        # Activity doesn't touch the heap...
+        channel.last_activity += 10
+        self.assertEqual(timeouts.deadline(channel), deadline)
+        # ...unless it moves the deadline backwards.
+        channel.last_activity -= 20
+        self.assertEqual(timeouts.deadline(channel), deadline - 10)
+
+        channel.del_channel()
+        self.assertNotIn(channel, timeouts)
+
+    def test_kill_zombies_reschedules_active_channels(self):
+        channel = self._makeOne()
+        channel.add_channel()
+        timeouts = channel.idle_timeouts
+        other = self._makeOne()
+        other._fileno = 1
+        other.add_channel()
+        closed = []
+        other.close = lambda: closed.append(other)
+
+        timeout = channel.adj.channel_timeout
+        now = channel.last_activity
+        # The deadline passed, but the channel was active since.
+        timeouts.schedule(other, now - 1)
+        channel.kill_zombies()
+        self.assertEqual(closed, [])
+        self.assertEqual(timeouts.deadline(other),
+                         other.last_activity + timeout)
+
+        # Busy channels are checked again later.
+        other.last_activity = now - timeout - 1
+        other.running_tasks = True
+        channel.kill_zombies()
+        self.assertEqual(closed, [])
+        self.assertGreater(timeouts.deadline(other), now)
+
+        other.running_tasks = False
+        other.last_activity = now - timeout - 1
+        channel.kill_zombies()
+        self.assertEqual(closed, [other])
+
+    def test_readable_paused_while_server_overloaded(self):
+        channel = self._makeOne()
+        self.assertTrue(channel.readable())
+
+        class Server:
+            overloaded = True
+
+        channel.server = Server()
+        self.assertFalse(channel.readable())
+        channel.server.overloaded = False
+        self.assertTrue(channel.readable())
+        channel.set_sync()
+        self.assertFalse(channel.readable())
+
+    def _makeFailingParser(self, error):
+        class Parser:
+            def __init__(self, adj):
+                pass
+
+            def received(self, data):
+                raise OSError(error, 'error')
+
+        channel = self._makeOne()
+        channel.parser_class = Parser
+        closed = []
+        channel.close_when_done = lambda: closed.append(1)
+        return channel, closed
+
+    def test_received_spool_quota_exceeded(self):
+        channel, closed = self._makeFailingParser(errno.ENOSPC)
+        channel.received(b'data')
+        self.assertEqual(closed, [1])
+        self.assertIsNone(channel.proto_request)
+
+    def test_received_spool_quota_exceeded_http(self):
+        from zope.server.http.httpserverchannel import HTTPServerChannel
+        channel, closed = self._makeFailingParser(errno.ENOSPC)
+        channel.handle_spool_full = (
+            lambda req: HTTPServerChannel.handle_spool_full(channel, req))
+        requests = []
+        channel.handle_request = requests.append
+        channel.received(b'data')
+        self.assertEqual(closed, [])
+        self.assertIsNone(channel.proto_request)
+        [req] = requests
+        self.assertEqual(req.error, ('507', 'Insufficient Storage'))
+        self.assertTrue(req.completed)
+
+    def test_received_other_error(self):
+        channel, closed = self._makeFailingParser(errno.EIO)
+        with self.assertRaises(OSError):
+            channel.received(b'data')
+        self.assertEqual(closed, [])
+
     def test_handle_comm_err_logging(self):
         from zope.server.adjustments import Adjustments
         adj = Adjustments()
@@ -0,0 +1,78 @@
+"""
+Tests for timeouts.py.
+
+"""
+import unittest
+
+from zope.server.timeouts import TimeoutQueue
+
+
+class Obj:
+    pass
+
+
+class TestTimeoutQueue(unittest.TestCase):
+
+    def test_pop_expired_in_order(self):
+        q = TimeoutQueue()
+        a, b, c = Obj(), Obj(), Obj()
+        q.schedule(b, 20)
+        q.schedule(a, 10)
+        q.schedule(c, 30)
+        self.assertEqual(len(q), 3)
+        self.assertEqual(q.pop_expired(10), [])
+        self.assertEqual(q.pop_expired(25), [a, b])
+        self.assertEqual(len(q), 1)
+        self.assertNotIn(a, q)
+        self.assertIn(c, q)
+        self.assertEqual(q.deadline(c), 30)
+        self.assertIsNone(q.deadline(a))
+
+    def test_reschedule_replaces(self):
+        q = TimeoutQueue()
+        a = Obj()
+        q.schedule(a, 10)
+        q.schedule(a, 50)
+        self.assertEqual(q.deadline(a), 50)
+        self.assertEqual(q.pop_expired(20), [])
+        self.assertEqual(q.pop_expired(60), [a])
+        self.assertEqual(q.pop_expired(60), [])
+
+    def test_cancel(self):
+        q = TimeoutQueue()
+        a = Obj()
+        q.schedule(a, 10)
+        q.cancel(a)
+        q.cancel(a)
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.pop_expired(20), [])
+
+    def test_cancelled_entries_are_compacted(self):
+        q = TimeoutQueue()
+        keep = Obj()
+        q.schedule(keep, 1000)
+        for i in range(500):
+            o = Obj()
+            q.schedule(o, i)
+            q.cancel(o)
+        self.assertLess(len(q._heap), 100)
+        self.assertEqual(q.pop_expired(2000), [keep])
+
+    def test_next_deadline(self):
+        q = TimeoutQueue()
+        self.assertIsNone(q.next_deadline())
+        a, b = Obj(), Obj()
+        q.schedule(a, 10)
+        q.schedule(b, 20)
+        self.assertEqual(q.next_deadline(), 10)
+        q.cancel(a)
+        self.assertEqual(q.next_deadline(), 20)
+        q.cancel(b)
+        self.assertIsNone(q.next_deadline())
+
+    def test_clear(self):
+        q = TimeoutQueue()
+        q.schedule(Obj(), 10)
+        q.clear()
+        self.assertEqual(len(q), 0)
+        self.assertEqual(q.pop_expired(20), [])
@@ -76,6 +76,56 @@ class TestPipeTrigger(unittest.TestCase):
         t.pull_trigger()
         # The side effects of this are hard to test
 
+    def test_thunk_pulls_trigger(self):
+        t = self._makeOne()
+        called = []
+
+        def thunk():
+            # Thunks don't run under the lock.
+            t.pull_trigger(lambda: called.append(2))
+            called.append(1)
+        t.pull_trigger(thunk)
+        t.handle_read()
+        self.assertEqual(called, [1])
+        self.assertEqual(len(t.thunks), 1)
+        t.handle_read()
+        self.assertEqual(called, [1, 2])
+
+
+@unittest.skipIf(not hasattr(trigger, 'eventfdtrigger'),
+                 "eventfdtrigger not available")
+class TestEventfdTrigger(TestPipeTrigger):
+
+    def _getFUT(self):
+        return trigger.eventfdtrigger
+
+    def test_is_default(self):
+        self.assertIs(trigger.trigger, trigger.eventfdtrigger)
+
+    def test_pulls_coalesce(self):
+        import os
+        t = self._makeOne()
+        writes = []
+        orig_write = os.eventfd_write
+
+        def eventfd_write(fd, value):
+            writes.append(value)
+            orig_write(fd, value)
+        os.eventfd_write = eventfd_write
+        try:
+            t.pull_trigger()
+            t.pull_trigger()
+            t.pull_trigger(lambda: None)
+            self.assertEqual(len(writes), 1)
+            self.assertTrue(t.pending)
+            t.handle_read()
+            self.assertFalse(t.pending)
+            self.assertEqual(t.thunks, [])
+            t.pull_trigger()
+            self.assertEqual(len(writes), 2)
+        finally:
+            os.eventfd_write = orig_write
+
 
 class TestSocketTrigger(TestPipeTrigger):
 
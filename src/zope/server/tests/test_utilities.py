@@ -14,3 +14,14 @@ class TestFunctions(unittest.TestCase):
         s = b"abc\n\r\ndef\n\ngef"
         x = utilities.find_double_newline(s)
         self.assertEqual(x, 6)
+
+    def test_find_double_newline_memoryview(self):
+        s = memoryview(b"abc\n\ndef\n\r\n")
+        self.assertEqual(utilities.find_double_newline(s), 5)
+        self.assertEqual(utilities.find_double_newline(s[5:]), 6)
+        self.assertEqual(utilities.find_double_newline(s[:4]), -1)
+
+    def test_find_newline(self):
+        self.assertEqual(utilities.find_newline(b"ab\ncd\n"), 2)
+        self.assertEqual(utilities.find_newline(memoryview(b"abcd\n")), 4)
+        self.assertEqual(utilities.find_newline(bytearray(b"abcd")), -1)
@@ -0,0 +1,86 @@
+##############################################################################
+#
+# Copyright (c) 2024 Zope Foundation and Contributors.
+# All Rights Reserved.
+#
+# This software is subject to the provisions of the Zope Public License,
+# Version 2.1 (ZPL).  A copy of the ZPL should accompany this distribution.
+# THIS SOFTWARE IS PROVIDED "AS IS" AND ANY AND ALL EXPRESS OR IMPLIED
+# WARRANTIES ARE DISCLAIMED, INCLUDING, BUT NOT LIMITED TO, THE IMPLIED
+# WARRANTIES OF TITLE, MERCHANTABILITY, AGAINST INFRINGEMENT, AND FITNESS
+# FOR A PARTICULAR PURPOSE.
+#
+##############################################################################
+"""Deadline scheduling for idle channels.
+"""
+import heapq
+import itertools
+
+
+class TimeoutQueue:
+    """A heap of deadlines, with at most one deadline per object.
+
+    Scheduling is O(log n) and cancelling is O(1); cancelled entries
+    are dropped from the heap lazily.  Collecting the expired objects
+    costs O(k log n) for k expired entries, no matter how many objects
+    are still waiting.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._entries = {}  # { object -> [deadline, sequence, object] }
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, obj):
+        return obj in self._entries
+
+    def deadline(self, obj):
+        """Return the deadline of *obj*, or None if none is scheduled."""
+        entry = self._entries.get(obj)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def schedule(self, obj, deadline):
+        """Set the deadline of *obj*, replacing any previous one."""
+        self.cancel(obj)
+        entry = [deadline, next(self._sequence), obj]
+        self._entries[obj] = entry
+        heapq.heappush(self._heap, entry)
+
+    def cancel(self, obj):
+        """Forget the deadline of *obj*, if any."""
+        entry = self._entries.pop(obj, None)
+        if entry is not None:
+            entry[2] = None
+            heap = self._heap
+            if len(heap) > 2 * len(self._entries) + 64:
+                # Too many cancelled entries; compact.
+                self._heap = [e for e in heap if e[2] is not None]
+                heapq.heapify(self._heap)
+
+    def next_deadline(self):
+        """Return the earliest deadline, or None if none is scheduled."""
+        heap = self._heap
+        while heap and heap[0][2] is None:
+            heapq.heappop(heap)
+        return heap[0][0] if heap else None
+
+    def pop_expired(self, now):
+        """Remove and return the objects with a deadline before *now*."""
+        heap = self._heap
+        entries = self._entries
+        expired = []
+        while heap and heap[0][0] < now:
+            obj = heapq.heappop(heap)[2]
+            if obj is not None:
+                del entries[obj]
+                expired.append(obj)
+        return expired
+
+    def clear(self):
+        self._heap = []
+        self._entries.clear()
@@ -69,12 +69,12 @@ def positive_id(obj):
 class _triggerbase:
     """OS-independent base class for OS-dependent trigger class."""
 
-    kind = None  # subclass must set to "pipe" or "loopback"; used by repr
+    kind = None  # subclass must set to "pipe", "eventfd" or "loopback"
 
     def __init__(self):
         self._closed = False
 
-        # `lock` protects the `thunks` list from being traversed and
+        # `lock` protects the `thunks` list from being swapped out and
         # appended to simultaneously.
         self.lock = Lock()
 
@@ -108,6 +108,16 @@ class _triggerbase:
     def _close(self):    # see close() above; subclass must supply
         raise NotImplementedError
 
+    def reopen(self):
+        """Replace the trigger's OS resources with new ones.
+
+        A child process created by fork() shares the trigger with its
+        parent, so that one process may swallow the other's wakeups.
+        Calling this in the child gives it a trigger of its own.
+        """
+        self.close()
+        self.__init__()
+
     def pull_trigger(self, thunk=None):
         if thunk:
             with self.lock:
@@ -119,23 +129,31 @@ class _triggerbase:
     def _physical_pull(self):
         raise NotImplementedError
 
+    def _drain(self):
+        # Consume the pending wakeups.
+        self.recv(8192)
+
     def handle_read(self):
         try:
-            self.recv(8192)
+            self._drain()
         except OSError:
             return
+        # Take the thunks and run them without holding the lock, so
+        # that other threads don't wait for them (and thunks may pull
+        # the trigger themselves).
         with self.lock:
-            for thunk in self.thunks:
-                try:
-                    thunk()
-                except:  # noqa: E722 do not use bare 'except'
-                    _nil, t, v, tbinfo = asyncore.compact_traceback()
-                    try:
-                        print('exception in trigger thunk:'
-                              ' (%s:%s %s)' % (t, v, tbinfo))
-                    finally:
-                        del t, v, tbinfo
+            thunks = self.thunks
             self.thunks = []
+        for thunk in thunks:
+            try:
+                thunk()
+            except:  # noqa: E722 do not use bare 'except'
+                _nil, t, v, tbinfo = asyncore.compact_traceback()
+                try:
+                    print('exception in trigger thunk:'
+                          ' (%s:%s %s)' % (t, v, tbinfo))
+                finally:
+                    del t, v, tbinfo
 
     def __repr__(self):
         return '<select-trigger ({}) at {:x}>'.format(
@@ -173,6 +191,49 @@ if hasattr(asyncore, 'file_dispatcher'):
             os.write(self.trigger, b'x')
 
 
+if hasattr(asyncore, 'file_dispatcher') and hasattr(os, 'eventfd'):
+    # Linux, Python 3.10 and newer.
+    class eventfdtrigger(_triggerbase, asyncore.file_dispatcher):
+        """Trigger based on an eventfd counter.
+
+        Pulling the trigger while a wakeup is still pending doesn't make
+        a system call; the main loop will see the state change that came
+        with the pull anyway once it processes the pending wakeup.
+        """
+        kind = "eventfd"
+
+        # True from the first pull until the main loop drained the
+        # counter.
+        pending = False
+
+        def __init__(self):
+            _triggerbase.__init__(self)
+            self.pending = False
+            fd = os.eventfd(0, os.EFD_NONBLOCK | os.EFD_CLOEXEC)
+            asyncore.file_dispatcher.__init__(self, fd)
+            if self.socket.fd != fd:
+                # file_dispatcher duplicates the descriptor; see
+                # pipetrigger.
+                os.close(fd)
+
+        def _close(self):
+            if self.socket is not None:
+                self.socket.close()
+                self.socket = None
+
+        def _physical_pull(self):
+            if not self.pending:
+                self.pending = True
+                os.eventfd_write(self.socket.fd, 1)
+
+        def _drain(self):
+            # Reading resets the counter.  Only clear the flag
+            # afterwards: a pull skipped in between is covered by the
+            # wakeup being processed now.
+            self.recv(8)
+            self.pending = False
+
+
 class BindError(Exception):
     pass
 
@@ -256,6 +317,9 @@ class sockettrigger(_triggerbase, asyncore.dispatcher):
 
 
 if os.name == 'posix':
-    trigger = pipetrigger
+    if hasattr(os, 'eventfd'):
+        trigger = eventfdtrigger
+    else:  # pragma: no cover
+        trigger = pipetrigger
 else:  # pragma: no cover
     trigger = sockettrigger
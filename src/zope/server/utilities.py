@@ -13,21 +13,30 @@
 ##############################################################################
 """Server utility functions
 """
+import re
 
 
-def find_double_newline(s):
-    """Returns the position just after a double newline in the given string."""
-    pos1 = s.find(b'\n\r\n')  # One kind of double newline
-    if pos1 >= 0:
-        pos1 += 3
-    pos2 = s.find(b'\n\n')    # Another kind of double newline
-    if pos2 >= 0:
-        pos2 += 2
-
-    if pos1 >= 0:
-        if pos2 >= 0:
-            return min(pos1, pos2)
-        else:
-            return pos1
-    else:
-        return pos2
+_double_newline_re = re.compile(b'\n\r?\n')
+_newline_re = re.compile(b'\n')
+
+
+def find_double_newline(s, start=0):
+    """Returns the position just after a double newline in the given string.
+
+    *s* may be any bytes-like object.  The search begins at *start*.
+    """
+    m = _double_newline_re.search(s, start)
+    if m is None:
+        return -1
+    return m.end()
+
+
+def find_newline(s):
+    """Returns the position of the first newline in the given string.
+
+    Like ``bytes.find(b'\\n')``, but *s* may be any bytes-like object.
+    """
+    m = _newline_re.search(s)
+    if m is None:
+        return -1
+    return m.start()